@@ -0,0 +1,118 @@
+import threading
+import time
+from functools import wraps
+
+from flask import jsonify
+from flask_jwt_extended import get_jwt, get_jwt_identity, verify_jwt_in_request
+from sqlalchemy import select
+
+from extensions import jwt
+from models import db, Orders
+
+# Access tokens carry everything a handler needs to authorize a request: the
+# subject is the CustomerID and the claims hold the username and role, so no
+# Customer row is loaded just to find out who is calling.
+
+
+def token_claims(customer, admin_usernames=()):
+    role = 'admin' if customer.Username in admin_usernames else 'customer'
+    return {'username': customer.Username, 'role': role}
+
+
+def current_customer_id():
+    return int(get_jwt_identity())
+
+
+def is_admin():
+    return get_jwt().get('role') == 'admin'
+
+
+def can_access(customer_id):
+    return is_admin() or current_customer_id() == customer_id
+
+
+def order_owner(order_id):
+    # The customer an order belongs to, for rows that hang off it
+    return db.session.scalar(select(Orders.CustomerID).where(Orders.OrderID == order_id))
+
+
+def forbidden():
+    return jsonify({'error': 'Not allowed to access this resource'}), 403
+
+
+def admin_required(view):
+    @wraps(view)
+    def wrapper(*args, **kwargs):
+        verify_jwt_in_request()
+        if not is_admin():
+            return forbidden()
+        return view(*args, **kwargs)
+    return wrapper
+
+
+def owner_required(arg_name):
+    # The customer id in the URL must be the caller's own, unless they are an admin
+    def decorator(view):
+        @wraps(view)
+        def wrapper(*args, **kwargs):
+            verify_jwt_in_request()
+            if not can_access(kwargs[arg_name]):
+                return forbidden()
+            return view(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+class RevocationList:
+    # Revoked tokens are only remembered until they would have expired anyway,
+    # so the list stays small and checking it never touches the database.
+    # It is per process: with several workers a logout or password change only
+    # takes effect on the worker that handled it, and the others accept the old
+    # tokens until they expire, so keep JWT_ACCESS_TOKEN_EXPIRES short.
+
+    def __init__(self):
+        self._tokens = {}
+        self._customers = {}
+        self._lock = threading.Lock()
+
+    def revoke_token(self, jti, expires_at):
+        with self._lock:
+            self._tokens[jti] = expires_at
+            self._prune()
+
+    def revoke_customer(self, customer_id, lifetime):
+        # Every token issued to this customer before now stops working. Token
+        # iat is in whole seconds, so tokens issued later in this same second
+        # (the login right after a password change) stay valid.
+        now = time.time()
+        with self._lock:
+            self._customers[str(customer_id)] = (int(now), now + lifetime)
+            self._prune()
+
+    def is_revoked(self, payload):
+        now = time.time()
+        expires_at = self._tokens.get(payload['jti'])
+        if expires_at is not None and expires_at > now:
+            return True
+        revoked = self._customers.get(payload['sub'])
+        if revoked is not None:
+            revoked_before, expires_at = revoked
+            return expires_at > now and payload['iat'] < revoked_before
+        return False
+
+    def _prune(self):
+        now = time.time()
+        for jti, expires_at in list(self._tokens.items()):
+            if expires_at <= now:
+                del self._tokens[jti]
+        for customer_id, (_, expires_at) in list(self._customers.items()):
+            if expires_at <= now:
+                del self._customers[customer_id]
+
+
+revocations = RevocationList()
+
+
+@jwt.token_in_blocklist_loader
+def check_if_token_revoked(jwt_header, jwt_payload):
+    return revocations.is_revoked(jwt_payload)
@@ -0,0 +1,177 @@
+import logging
+
+from flask import current_app, g, request
+from werkzeug.test import EnvironBuilder
+
+from models import db
+from cache import catalog_cache
+
+# Batched requests (POST /batch).
+#
+# A batch is a list of sub-requests run one after the other through the normal
+# route handlers, inside the batch's own app context: they go through the same
+# auth, validation and hooks as if sent separately, but skip the round trips
+# and share one database session (and connection) for their reads.
+#
+# By default every sub-request commits on its own and gets its own status,
+# whatever happened to the others. An atomic batch runs them all in one
+# transaction instead: the handlers' commits only flush, and the transaction
+# commits after the last sub-request, or rolls back as soon as one fails
+# (status 400 or above). Sub-requests after the failure are not run and get 424.
+
+logger = logging.getLogger(__name__)
+
+METHODS = ('GET', 'POST', 'PUT', 'PATCH', 'DELETE')
+# Endpoints that cannot answer inside a batch: nested batches and streams
+UNBATCHABLE = ('batch.run_batch', 'events.stream_events')
+# Headers a sub-request inherits from the batch unless it sets its own
+INHERITED_HEADERS = ('Authorization',)
+
+
+def init_app(app):
+    app.config.setdefault('BATCH_MAX_REQUESTS', 20)
+
+
+class BatchSession(db.session.session_factory.class_):
+    # db.session during an atomic batch. Handlers still call commit() and
+    # rollback(); commits only flush, a rollback undoes the whole batch.
+
+    failed = False
+
+    def commit(self):
+        self.flush()
+
+    def rollback(self):
+        self.failed = True
+        super().rollback()
+
+    def commit_batch(self):
+        super().commit()
+
+
+class SubRequest:
+    def __init__(self, method, path, body=None, headers=None):
+        self.method = method
+        self.path = path
+        self.body = body
+        self.headers = headers or {}
+
+    @classmethod
+    def parse(cls, data):
+        if not isinstance(data, dict):
+            raise ValueError('must be an object with method and path')
+        unknown = set(data) - {'method', 'path', 'body', 'headers'}
+        if unknown:
+            raise ValueError(f'unknown fields {sorted(unknown)}')
+        method = data.get('method')
+        if not isinstance(method, str) or method.upper() not in METHODS:
+            raise ValueError(f'method must be one of {", ".join(METHODS)}')
+        path = data.get('path')
+        if not isinstance(path, str) or not path.startswith('/'):
+            raise ValueError('path must start with /')
+        headers = data.get('headers')
+        if headers is not None and (
+            not isinstance(headers, dict) or not all(isinstance(value, str) for value in headers.values())
+        ):
+            raise ValueError('headers must be an object of strings')
+        return cls(method.upper(), path, data.get('body'), headers)
+
+    def environ(self):
+        headers = {name: request.headers[name] for name in INHERITED_HEADERS if name in request.headers}
+        headers.update(self.headers)
+        builder = EnvironBuilder(
+            path=self.path, base_url=request.host_url, method=self.method, headers=headers, json=self.body,
+            environ_base={'REMOTE_ADDR': request.remote_addr},
+        )
+        try:
+            return builder.get_environ()
+        finally:
+            builder.close()
+
+
+def parse(data):
+    # The batch's sub-requests and whether it is atomic; ValueError if malformed
+    if not isinstance(data, dict) or not isinstance(data.get('requests'), list) or not data['requests']:
+        raise ValueError('Send a JSON object with a non-empty "requests" array')
+    limit = current_app.config['BATCH_MAX_REQUESTS']
+    if len(data['requests']) > limit:
+        raise ValueError(f'A batch holds at most {limit} requests')
+    atomic = data.get('atomic', False)
+    if not isinstance(atomic, bool):
+        raise ValueError('atomic must be true or false')
+    requests = []
+    for position, item in enumerate(data['requests']):
+        try:
+            requests.append(SubRequest.parse(item))
+        except ValueError as error:
+            raise ValueError(f'requests[{position}]: {error}')
+    return requests, atomic
+
+
+def result(response):
+    body = response.get_json(silent=True) if response.is_json else response.get_data(as_text=True)
+    headers = {name: value for name, value in response.headers.items() if name != 'Content-Length'}
+    return {'status': response.status_code, 'headers': headers, 'body': body}
+
+
+def failure(status, message):
+    return {'status': status, 'headers': {}, 'body': {'error': message}}
+
+
+def dispatch(sub_request):
+    # Run one sub-request through the app; its result entry
+    app = current_app._get_current_object()
+    # The app context, and with it g, is shared with the batch: give each
+    # sub-request a fresh g like a request of its own, and put the batch's back
+    outer = dict(vars(g))
+    vars(g).clear()
+    try:
+        with app.request_context(sub_request.environ()):
+            if request.endpoint in UNBATCHABLE:
+                return failure(400, f'{sub_request.method} {sub_request.path} cannot be batched')
+            try:
+                response = app.full_dispatch_request()
+            except Exception:
+                logger.exception('batched %s %s failed', sub_request.method, sub_request.path)
+                db.session.rollback()
+                return failure(500, 'Internal server error')
+            try:
+                return result(response)
+            finally:
+                # Runs its call_on_close hooks, as the server would
+                response.close()
+    finally:
+        vars(g).clear()
+        vars(g).update(outer)
+
+
+def run(requests, atomic=False):
+    # The sub-requests' results in order, and whether their writes committed
+    if not atomic:
+        return [dispatch(sub_request) for sub_request in requests], True
+
+    db.session.remove()
+    epoch = catalog_cache.epoch()
+    session = BatchSession(**db.session.session_factory.kw)
+    db.session.registry.set(session)
+    results = []
+    try:
+        for sub_request in requests:
+            if session.failed:
+                results.append(failure(424, 'Not run, an earlier request in the atomic batch failed'))
+                continue
+            results.append(dispatch(sub_request))
+            if results[-1]['status'] >= 400 and not session.failed:
+                session.rollback()
+        committed = not session.failed
+        if committed:
+            session.commit_batch()
+    except Exception:
+        session.rollback()
+        raise
+    finally:
+        db.session.remove()
+    if committed and catalog_cache.epoch() != epoch:
+        # Handlers invalidated the catalog before their writes were visible
+        catalog_cache.invalidate()
+    return results, committed
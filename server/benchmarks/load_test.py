@@ -0,0 +1,425 @@
+import argparse
+import http.client
+import json
+import logging
+import os
+import platform
+import random
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from flask_jwt_extended import create_access_token
+from sqlalchemy import insert, select
+from werkzeug.security import generate_password_hash
+from werkzeug.serving import make_server
+
+import rollups
+import search
+from app import create_app
+from auth import token_claims
+from models import db, Customer, Medication, Orders, OrderItems, Payments, CartItem
+
+# Load test for the HTTP API: seeds a synthetic pharmacy of the requested size,
+# then drives the real app with concurrent clients, one scenario at a time, and
+# reports throughput and p50/p95/p99 latency per endpoint. Results are written
+# as JSON so runs before and after a change can be compared, e.g.
+#
+#     python benchmarks/load_test.py --customers 500 --medications 2000 --output before.json
+#     python benchmarks/load_test.py --customers 500 --medications 2000 --compare before.json
+#     python benchmarks/load_test.py --server --concurrency 32      # over real sockets
+#     DATABASE_URL=postgresql://... python benchmarks/load_test.py
+#
+# Seeding uses the same seed for the same sizes, so two runs see the same data.
+
+SCENARIOS = ('login', 'catalog', 'cart', 'order', 'payment')
+PASSWORD = 'secret'
+SEED_CHUNK = 1000
+
+
+def percentile(samples, pct):
+    ordered = sorted(samples)
+    index = min(len(ordered) - 1, int(round(pct / 100.0 * (len(ordered) - 1))))
+    return ordered[index]
+
+
+def chunks(rows, size=SEED_CHUNK):
+    for start in range(0, len(rows), size):
+        yield rows[start:start + size]
+
+
+# Dataset
+
+def seed(args, rng, tag):
+    # Customers, medications, order history with payments and a few open carts.
+    # Core inserts for speed; the rollups and search index are rebuilt afterwards.
+    password_hash = generate_password_hash(PASSWORD, args.hash_method)
+    customers = [
+        {'FirstName': 'Load', 'LastName': str(i), 'Email': f'load{tag}-{i}@example.com',
+         'Phone': '0700000000', 'Username': f'load{tag}-{i}', 'PasswordHash': password_hash}
+        for i in range(args.customers)
+    ]
+    for rows in chunks(customers):
+        db.session.execute(insert(Customer), rows)
+    customer_ids = db.session.scalars(
+        select(Customer.CustomerID).where(Customer.Username.like(f'load{tag}-%')).order_by(Customer.CustomerID)
+    ).all()
+
+    words = ('Amoxicillin', 'Paracetamol', 'Ibuprofen', 'Metformin', 'Amlodipine', 'Omeprazole',
+             'Cetirizine', 'Salbutamol', 'Ciprofloxacin', 'Losartan', 'Artemether', 'Zinc')
+    forms = ('tablets', 'capsules', 'syrup', 'suspension', 'cream', 'inhaler')
+    medications = [
+        {'Name': f'{rng.choice(words)} {rng.choice((125, 250, 500))}mg {i}-{tag}',
+         'Description': f'{rng.choice(forms)}, pack of {rng.choice((10, 20, 30, 100))}',
+         # Enough that the order scenario never runs out
+         'StockLevel': 1000000,
+         'PricePerUnit': round(rng.uniform(0.5, 80), 2)}
+        for i in range(args.medications)
+    ]
+    for rows in chunks(medications):
+        db.session.execute(insert(Medication), rows)
+    medications = db.session.execute(
+        select(Medication.MedicationID, Medication.PricePerUnit)
+        .where(Medication.Name.like(f'%-{tag}')).order_by(Medication.MedicationID)
+    ).all()
+
+    started = datetime.now() - timedelta(days=365)
+    orders = []
+    lines = []
+    for customer_id in customer_ids:
+        for _ in range(args.orders_per_customer):
+            picked = rng.sample(medications, min(args.items_per_order, len(medications)))
+            items = [(medication.MedicationID, rng.randint(1, 5), medication.PricePerUnit) for medication in picked]
+            orders.append({
+                'CustomerID': customer_id,
+                'OrderDate': started + timedelta(minutes=rng.randint(0, 365 * 24 * 60)),
+                'Status': rng.choice(('Pending', 'Completed', 'Completed', 'Collected')),
+                'TotalAmount': sum(quantity * price for _, quantity, price in items),
+            })
+            lines.append(items)
+    for rows in chunks(orders):
+        db.session.execute(insert(Orders), rows)
+    # OrderID -> CustomerID
+    order_ids = dict(db.session.execute(
+        select(Orders.OrderID, Orders.CustomerID).where(Orders.CustomerID.in_(customer_ids)).order_by(Orders.OrderID)
+    ).all())
+
+    order_items = []
+    payments = []
+    for order_id, order, items in zip(order_ids, orders, lines):
+        order_items.extend(
+            {'OrderID': order_id, 'MedicationID': medication_id, 'Quantity': quantity, 'Subtotal': quantity * price}
+            for medication_id, quantity, price in items
+        )
+        if rng.random() < args.paid_fraction:
+            payments.append({'OrderID': order_id, 'PaymentDate': order['OrderDate'] + timedelta(hours=1),
+                             'AmountPaid': order['TotalAmount'],
+                             'PaymentMethod': rng.choice(('M-Pesa', 'Cash', 'Card'))})
+    for rows in chunks(order_items):
+        db.session.execute(insert(OrderItems), rows)
+    for rows in chunks(payments):
+        db.session.execute(insert(Payments), rows)
+
+    cart_items = [
+        {'CustomerID': customer_id, 'MedicationID': medication.MedicationID, 'Quantity': rng.randint(1, 3)}
+        for customer_id in customer_ids
+        for medication in rng.sample(medications, min(args.cart_items, len(medications)))
+    ]
+    for rows in chunks(cart_items):
+        db.session.execute(insert(CartItem), rows)
+    db.session.commit()
+
+    rollups.rebuild()
+    search.rebuild()
+    return customer_ids, [medication.MedicationID for medication in medications], order_ids, {
+        'customers': len(customer_ids), 'medications': len(medications), 'orders': len(order_ids),
+        'order_items': len(order_items), 'payments': len(payments), 'cart_items': len(cart_items),
+    }
+
+
+# Clients
+
+class TestClient:
+    # In-process, through Flask's test client (no sockets)
+
+    def __init__(self, app):
+        self.app = app
+        self.local = threading.local()
+
+    def request(self, method, path, body=None, token=None):
+        client = getattr(self.local, 'client', None)
+        if client is None:
+            client = self.local.client = self.app.test_client()
+        headers = {'Authorization': 'Bearer ' + token} if token else {}
+        response = client.open(path, method=method, json=body, headers=headers)
+        return response.status_code, response.get_json(silent=True)
+
+    def close(self):
+        pass
+
+
+class HTTPClient:
+    # Over real sockets against a threaded werkzeug server on a free local port,
+    # one keep-alive connection per client thread
+
+    def __init__(self, app):
+        # One access log line per request would dominate the run
+        logging.getLogger('werkzeug').setLevel(logging.WARNING)
+        self.server = make_server('127.0.0.1', 0, app, threaded=True)
+        self.port = self.server.server_port
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        self.thread.start()
+        self.local = threading.local()
+
+    def request(self, method, path, body=None, token=None):
+        connection = getattr(self.local, 'connection', None)
+        if connection is None:
+            connection = self.local.connection = http.client.HTTPConnection('127.0.0.1', self.port, timeout=60)
+        headers = {'Content-Type': 'application/json'}
+        if token:
+            headers['Authorization'] = 'Bearer ' + token
+        try:
+            connection.request(method, path, json.dumps(body) if body is not None else None, headers)
+            response = connection.getresponse()
+            data = response.read()
+        except (http.client.HTTPException, OSError):
+            # The server closed the connection; reconnect and retry once
+            connection.close()
+            connection = self.local.connection = http.client.HTTPConnection('127.0.0.1', self.port, timeout=60)
+            connection.request(method, path, json.dumps(body) if body is not None else None, headers)
+            response = connection.getresponse()
+            data = response.read()
+        try:
+            payload = json.loads(data) if data else None
+        except ValueError:
+            payload = None
+        return response.status, payload
+
+    def close(self):
+        self.server.shutdown()
+
+
+# Scenarios. Each takes the request number and returns [(endpoint, status, seconds)].
+
+def timed(client, endpoint, method, path, body=None, token=None):
+    start = time.perf_counter()
+    status, payload = client.request(method, path, body, token)
+    return (endpoint, status, time.perf_counter() - start), payload
+
+
+def build_scenarios(args, client, tag, customer_ids, tokens, cashier, medication_ids, order_ids):
+    customer_locks = {customer_id: threading.Lock() for customer_id in customer_ids}
+    payment_base = datetime.now().replace(microsecond=0)
+    paid_orders = list(order_ids)
+
+    def login(i):
+        customer = i % len(customer_ids)
+        sample, _ = timed(client, 'POST /login', 'POST', '/login',
+                          {'username': f'load{tag}-{customer}', 'password': PASSWORD})
+        return [sample]
+
+    def catalog(i):
+        # First pages and random later pages, as a browsing client would fetch them
+        rng = random.Random(i)
+        after = rng.choice(medication_ids) if rng.random() < 0.5 else None
+        path = f'/medications?limit={args.page_size}' + (f'&after={after}' if after else '')
+        sample, _ = timed(client, 'GET /medications', 'GET', path)
+        return [sample]
+
+    def cart(i):
+        customer_id = customer_ids[i % len(customer_ids)]
+        sample, _ = timed(client, 'GET /cartitems/<id>', 'GET', f'/cartitems/{customer_id}',
+                          token=tokens[customer_id])
+        return [sample]
+
+    def order(i):
+        # Add a medication to the cart, then check out. Serialised per customer,
+        # as one person can't check out the same cart twice at once.
+        rng = random.Random(i)
+        customer_id = customer_ids[i % len(customer_ids)]
+        token = tokens[customer_id]
+        with customer_locks[customer_id]:
+            added, _ = timed(client, 'POST /cart', 'POST', '/cart',
+                             {'medication_id': rng.choice(medication_ids), 'quantity': rng.randint(1, 3)}, token)
+            checkout, _ = timed(client, 'POST /checkout/<id>', 'POST', f'/checkout/{customer_id}', token=token)
+        return [added, checkout]
+
+    def payment(i):
+        rng = random.Random(i)
+        order_id = rng.choice(paid_orders)
+        sample, _ = timed(client, 'POST /payments', 'POST', '/payments', {
+            'OrderID': order_id,
+            'PaymentDate': (payment_base + timedelta(seconds=i)).strftime('%Y-%m-%dT%H:%M:%S'),
+            'AmountPaid': round(rng.uniform(1, 200), 2),
+            'PaymentMethod': 'M-Pesa',
+        }, cashier)
+        return [sample]
+
+    return {'login': login, 'catalog': catalog, 'cart': cart, 'order': order, 'payment': payment}
+
+
+def run_scenario(run, requests, concurrency):
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        results = [sample for samples in pool.map(run, range(requests)) for sample in samples]
+    elapsed = time.perf_counter() - started
+
+    by_endpoint = {}
+    for endpoint, status, latency in results:
+        by_endpoint.setdefault(endpoint, []).append((status, latency))
+    report = {}
+    for endpoint, samples in by_endpoint.items():
+        latencies = [latency * 1000 for _, latency in samples]
+        statuses = {}
+        for status, _ in samples:
+            statuses[str(status)] = statuses.get(str(status), 0) + 1
+        report[endpoint] = {
+            'requests': len(samples),
+            'errors': sum(1 for status, _ in samples if status >= 400),
+            'status_codes': statuses,
+            'seconds': round(elapsed, 3),
+            'throughput_rps': round(len(samples) / elapsed, 1),
+            'latency_ms': {
+                'p50': round(percentile(latencies, 50), 2),
+                'p95': round(percentile(latencies, 95), 2),
+                'p99': round(percentile(latencies, 99), 2),
+                'mean': round(statistics.mean(latencies), 2),
+                'max': round(max(latencies), 2),
+            },
+        }
+    return report
+
+
+# Reporting
+
+def git_revision():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True,
+                              cwd=os.path.dirname(os.path.abspath(__file__)), timeout=5).stdout.strip() or None
+    except (OSError, subprocess.SubprocessError):
+        return None
+
+
+def print_report(results, baseline=None):
+    print(f'{"endpoint":<22} {"reqs":>6} {"err":>5} {"req/s":>8} {"p50 ms":>8} {"p95 ms":>8} {"p99 ms":>8}')
+    for endpoint, result in results.items():
+        latency = result['latency_ms']
+        line = (f'{endpoint:<22} {result["requests"]:>6} {result["errors"]:>5} {result["throughput_rps"]:>8} '
+                f'{latency["p50"]:>8} {latency["p95"]:>8} {latency["p99"]:>8}')
+        before = (baseline or {}).get(endpoint)
+        if before:
+            change = (latency['p95'] - before['latency_ms']['p95']) / before['latency_ms']['p95'] * 100
+            line += f'   p95 {change:+.0f}% vs baseline ({before["latency_ms"]["p95"]} ms)'
+        print(line)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='HTTP API load test')
+    parser.add_argument('--customers', type=int, default=200)
+    parser.add_argument('--medications', type=int, default=500)
+    parser.add_argument('--orders-per-customer', type=int, default=5)
+    parser.add_argument('--items-per-order', type=int, default=3)
+    parser.add_argument('--paid-fraction', type=float, default=0.7)
+    parser.add_argument('--cart-items', type=int, default=2)
+    parser.add_argument('--requests', type=int, default=500, help='requests per scenario')
+    parser.add_argument('--concurrency', type=int, default=16)
+    parser.add_argument('--scenarios', default=','.join(SCENARIOS),
+                        help='comma-separated, from ' + ', '.join(SCENARIOS))
+    parser.add_argument('--page-size', type=int, default=50)
+    parser.add_argument('--hash-method', default='scrypt')
+    parser.add_argument('--server', action='store_true', help='go through a local HTTP server instead of the test client')
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--output', help='write the results to this JSON file')
+    parser.add_argument('--compare', help='JSON results of an earlier run to compare against')
+    args = parser.parse_args()
+
+    scenarios = [name for name in args.scenarios.split(',') if name]
+    unknown = set(scenarios) - set(SCENARIOS)
+    if unknown:
+        parser.error('unknown scenarios: ' + ', '.join(sorted(unknown)))
+    rng = random.Random(args.seed)
+
+    path = None
+    database_url = os.environ.get('DATABASE_URL')
+    if not database_url:
+        fd, path = tempfile.mkstemp(suffix='.db')
+        os.close(fd)
+        database_url = 'sqlite:///' + path
+    app = create_app({
+        'SQLALCHEMY_DATABASE_URI': database_url,
+        # Signs this run's throwaway tokens with a random key
+        'TESTING': True,
+        'PASSWORD_HASH_METHOD': args.hash_method,
+        'LOGIN_RATE_LIMIT': 0,
+        'LOGIN_QUEUE_TIMEOUT': 60,
+        'STOCK_SWEEP_INTERVAL': 0,
+    })
+
+    client = None
+    try:
+        with app.app_context():
+            db.create_all()
+            # Sets of rows from earlier runs against the same database stay apart
+            tag = int(time.time())
+            seed_started = time.perf_counter()
+            customer_ids, medication_ids, order_ids, dataset = seed(args, rng, tag)
+            seed_seconds = time.perf_counter() - seed_started
+            customers = db.session.scalars(select(Customer).where(Customer.CustomerID.in_(customer_ids))).all()
+            tokens = {
+                customer.CustomerID: create_access_token(identity=str(customer.CustomerID),
+                                                         additional_claims=token_claims(customer))
+                for customer in customers
+            }
+            # Payments are recorded by an admin, as at the till
+            cashier = create_access_token(identity=str(customers[0].CustomerID),
+                                          additional_claims=token_claims(customers[0], (customers[0].Username,)))
+            dialect = db.engine.dialect.name
+        print(f'seeded {dataset} in {seed_seconds:.1f}s')
+
+        client = HTTPClient(app) if args.server else TestClient(app)
+        runs = build_scenarios(args, client, tag, customer_ids, tokens, cashier, medication_ids, order_ids)
+        results = {}
+        for name in scenarios:
+            results.update(run_scenario(runs[name], args.requests, args.concurrency))
+    finally:
+        if client is not None:
+            client.close()
+        if path:
+            os.remove(path)
+
+    report = {
+        'started_at': datetime.now().isoformat(timespec='seconds'),
+        'revision': git_revision(),
+        'environment': {
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'cpus': os.cpu_count(),
+            'database': dialect,
+            'transport': 'http' if args.server else 'test_client',
+        },
+        'settings': {key: value for key, value in vars(args).items() if key not in ('output', 'compare')},
+        'dataset': dict(dataset, seed_seconds=round(seed_seconds, 2)),
+        'results': results,
+    }
+
+    baseline = None
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)['results']
+    print(f'{args.requests} requests per scenario, {args.concurrency} clients, {report["environment"]["transport"]}')
+    print_report(results, baseline)
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2)
+        print('results written to', args.output)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,94 @@
+import argparse
+import os
+import statistics
+import sys
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from sqlalchemy import insert
+from werkzeug.security import generate_password_hash
+
+from app import create_app
+from models import db, Customer
+
+# Login throughput under concurrent clients, for comparing password hashing
+# settings, e.g.
+#
+#     python benchmarks/login.py --executor inline
+#     python benchmarks/login.py --executor thread --hash-workers 4
+#     python benchmarks/login.py --method pbkdf2:sha256:600000 --max-concurrency 4
+
+
+def percentile(samples, pct):
+    ordered = sorted(samples)
+    index = min(len(ordered) - 1, int(round(pct / 100.0 * (len(ordered) - 1))))
+    return ordered[index]
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Login throughput benchmark')
+    parser.add_argument('--users', type=int, default=50)
+    parser.add_argument('--requests', type=int, default=200)
+    parser.add_argument('--concurrency', type=int, default=16)
+    parser.add_argument('--method', default='scrypt')
+    parser.add_argument('--executor', default='thread', choices=('thread', 'process', 'inline'))
+    parser.add_argument('--hash-workers', type=int, default=os.cpu_count() or 4)
+    parser.add_argument('--max-concurrency', type=int, default=2 * (os.cpu_count() or 4))
+    args = parser.parse_args()
+
+    fd, path = tempfile.mkstemp(suffix='.db')
+    os.close(fd)
+    app = create_app({
+        'SQLALCHEMY_DATABASE_URI': 'sqlite:///' + path,
+        # Signs this run's throwaway tokens with a random key
+        'TESTING': True,
+        'PASSWORD_HASH_METHOD': args.method,
+        'PASSWORD_HASH_EXECUTOR': args.executor,
+        'PASSWORD_HASH_WORKERS': args.hash_workers,
+        'LOGIN_MAX_CONCURRENCY': args.max_concurrency,
+        'LOGIN_QUEUE_TIMEOUT': 60,
+        'LOGIN_RATE_LIMIT': 0,
+    })
+
+    try:
+        with app.app_context():
+            db.create_all()
+            password_hash = generate_password_hash('secret', args.method)
+            db.session.execute(insert(Customer), [
+                {'FirstName': 'Bench', 'LastName': str(i), 'Email': f'bench{i}@example.com',
+                 'Phone': '0700000000', 'Username': f'bench{i}', 'PasswordHash': password_hash}
+                for i in range(args.users)
+            ])
+            db.session.commit()
+
+        def login(i):
+            client = app.test_client()
+            start = time.perf_counter()
+            response = client.post('/login', json={'username': f'bench{i % args.users}', 'password': 'secret'})
+            return response.status_code, time.perf_counter() - start
+
+        started = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=args.concurrency) as pool:
+            results = list(pool.map(login, range(args.requests)))
+        elapsed = time.perf_counter() - started
+    finally:
+        os.remove(path)
+
+    latencies = [latency * 1000 for status, latency in results]
+    statuses = {}
+    for status, _ in results:
+        statuses[status] = statuses.get(status, 0) + 1
+
+    print(f'method={args.method} executor={args.executor} hash_workers={args.hash_workers} '
+          f'max_concurrency={args.max_concurrency} clients={args.concurrency}')
+    print(f'{args.requests} logins in {elapsed:.2f}s: {args.requests / elapsed:.1f} logins/s')
+    print(f'latency p50 {percentile(latencies, 50):.1f} ms  p95 {percentile(latencies, 95):.1f} ms  '
+          f'p99 {percentile(latencies, 99):.1f} ms  mean {statistics.mean(latencies):.1f} ms')
+    print('status codes:', statuses)
+
+
+if __name__ == '__main__':
+    main()
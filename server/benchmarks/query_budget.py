@@ -0,0 +1,96 @@
+import argparse
+import os
+import sys
+import tempfile
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from flask_jwt_extended import create_access_token
+from sqlalchemy import insert
+
+from app import create_app
+from auth import token_claims
+from models import db, Customer, Medication, CartItem
+from query_counter import assert_max_queries
+
+# Checks that hot read routes run a fixed number of SQL statements however much
+# data they return, so an N+1 regression fails here instead of slowing the
+# mobile client down. Exits non-zero if a route goes over its budget, printing
+# the statements it ran.
+#
+#     python benchmarks/query_budget.py --items 25
+
+# (route, caller) -> most statements allowed per request
+BUDGETS = {
+    # One joined query for the lines, their subtotals and the cart total
+    ('/cartitems/{customer_id}', 'customer'): 1,
+    # The same query, outer-joined from the customer to tell an empty cart from a missing one
+    ('/cartitems/{customer_id}', 'admin'): 1,
+}
+
+
+def main():
+    parser = argparse.ArgumentParser(description='SQL statements per request check')
+    parser.add_argument('--items', type=int, default=10, help='cart lines to seed')
+    args = parser.parse_args()
+    if args.items < 1:
+        parser.error('--items must be at least 1')
+
+    fd, path = tempfile.mkstemp(suffix='.db')
+    os.close(fd)
+    app = create_app({
+        'SQLALCHEMY_DATABASE_URI': 'sqlite:///' + path,
+        # Signs this run's throwaway tokens with a random key
+        'TESTING': True,
+        'STOCK_SWEEP_INTERVAL': 0,
+    })
+
+    try:
+        with app.app_context():
+            db.create_all()
+            customer = Customer(FirstName='Budget', LastName='Check', Email='budget@example.com',
+                                Phone='0700000000', Username='budget', PasswordHash='-')
+            admin = Customer(FirstName='Budget', LastName='Admin', Email='budget-admin@example.com',
+                             Phone='0700000000', Username='budget-admin', PasswordHash='-')
+            db.session.add_all([customer, admin])
+            db.session.execute(insert(Medication), [
+                {'Name': f'Medication {i}', 'Description': '', 'StockLevel': 100, 'PricePerUnit': 1 + i}
+                for i in range(args.items)
+            ])
+            db.session.flush()
+            db.session.execute(insert(CartItem), [
+                {'CustomerID': customer.CustomerID, 'MedicationID': medication_id, 'Quantity': 1}
+                for medication_id in range(1, args.items + 1)
+            ])
+            db.session.commit()
+            customer_id = customer.CustomerID
+            headers = {
+                caller: {'Authorization': 'Bearer ' + create_access_token(
+                    identity=str(row.CustomerID), additional_claims=token_claims(row, ('budget-admin',)))}
+                for caller, row in (('customer', customer), ('admin', admin))
+            }
+            engine = db.engine
+
+        client = app.test_client()
+        failed = False
+        for (route, caller), budget in BUDGETS.items():
+            label = f'{route.format(customer_id=customer_id)} as {caller}'
+            try:
+                with assert_max_queries(engine, budget) as counter:
+                    response = client.get(route.format(customer_id=customer_id), headers=headers[caller])
+            except AssertionError as error:
+                print(f'FAIL {label}: {error}')
+                failed = True
+                continue
+            if response.status_code != 200 or len(response.get_json()['cart_items']) != args.items:
+                print(f'FAIL {label}: status {response.status_code}, expected {args.items} cart lines')
+                failed = True
+                continue
+            print(f'ok   {label}: {counter.count} statements (budget {budget})')
+        sys.exit(1 if failed else 0)
+    finally:
+        os.remove(path)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,58 @@
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+# Measures how long a fresh worker process takes to import the app module and
+# build an app with create_app(), i.e. what every preforked worker, test process
+# and CLI command pays before it can serve anything.
+#
+#     python benchmarks/startup.py --runs 20
+
+SERVER_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+CHILD = '''
+import time
+start = time.perf_counter()
+import app
+imported = time.perf_counter()
+app.create_app({'SQLALCHEMY_DATABASE_URI': 'sqlite://', 'TESTING': True})
+created = time.perf_counter()
+print(imported - start, created - imported)
+'''
+
+
+def run_once():
+    start = time.perf_counter()
+    output = subprocess.run(
+        [sys.executable, '-c', CHILD], cwd=SERVER_DIR, check=True, capture_output=True, text=True
+    ).stdout
+    total = time.perf_counter() - start
+    import_time, create_time = (float(value) for value in output.split())
+    return total, import_time, create_time
+
+
+def summarize(label, samples):
+    samples_ms = [sample * 1000 for sample in samples]
+    print(f'{label:<22} median {statistics.median(samples_ms):8.1f} ms   '
+          f'min {min(samples_ms):8.1f} ms   max {max(samples_ms):8.1f} ms')
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Worker startup benchmark')
+    parser.add_argument('--runs', type=int, default=10)
+    args = parser.parse_args()
+
+    # One warm-up run so the bytecode cache is populated
+    run_once()
+    results = [run_once() for _ in range(args.runs)]
+
+    summarize('process total', [r[0] for r in results])
+    summarize('import app', [r[1] for r in results])
+    summarize('create_app()', [r[2] for r in results])
+
+
+if __name__ == '__main__':
+    main()
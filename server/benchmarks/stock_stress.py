@@ -0,0 +1,177 @@
+import argparse
+import os
+import random
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from flask_jwt_extended import create_access_token
+from sqlalchemy import insert, select, func
+
+import stock
+from app import create_app
+from auth import token_claims
+from models import db, Customer, Medication, OrderItems, StockReservation
+
+# Many buyers racing for one medication: each adds it to their cart, then checks
+# out, changes the quantity, removes it or walks away, while a sweeper keeps
+# expiring reservations and a supplier keeps restocking. Afterwards every unit
+# must be accounted for:
+#
+#     initial stock + restocked == stock level + units sold + units still reserved
+#
+# and the level must never have gone negative. Exits non-zero otherwise.
+#
+#     python benchmarks/stock_stress.py --buyers 200 --stock 50 --concurrency 32
+#     DATABASE_URL=postgresql://... python benchmarks/stock_stress.py
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Stock reservation stress test')
+    parser.add_argument('--buyers', type=int, default=100)
+    parser.add_argument('--stock', type=int, default=40)
+    parser.add_argument('--max-quantity', type=int, default=3)
+    parser.add_argument('--concurrency', type=int, default=16)
+    parser.add_argument('--seed', type=int, default=1)
+    args = parser.parse_args()
+    rng = random.Random(args.seed)
+
+    path = None
+    database_url = os.environ.get('DATABASE_URL')
+    if not database_url:
+        fd, path = tempfile.mkstemp(suffix='.db')
+        os.close(fd)
+        database_url = 'sqlite:///' + path
+    app = create_app({
+        'SQLALCHEMY_DATABASE_URI': database_url,
+        # Signs this run's throwaway tokens with a random key
+        'TESTING': True,
+        'STOCK_SWEEP_INTERVAL': 0,
+        'LOGIN_RATE_LIMIT': 0,
+    })
+
+    try:
+        with app.app_context():
+            db.create_all()
+            medication = Medication(Name=f'Stress {time.time()}', Description='', StockLevel=args.stock, PricePerUnit=1)
+            db.session.add(medication)
+            db.session.flush()
+            medication_id = medication.MedicationID
+            tag = medication_id
+            db.session.execute(insert(Customer), [
+                {'FirstName': 'Buyer', 'LastName': str(i), 'Email': f'buyer{tag}-{i}@example.com',
+                 'Phone': '0700000000', 'Username': f'buyer{tag}-{i}', 'PasswordHash': '-'}
+                for i in range(args.buyers)
+            ])
+            db.session.commit()
+            buyers = db.session.scalars(
+                select(Customer).where(Customer.Username.like(f'buyer{tag}-%')).order_by(Customer.CustomerID)
+            ).all()
+            tokens = [
+                (buyer.CustomerID, create_access_token(identity=str(buyer.CustomerID), additional_claims=token_claims(buyer)))
+                for buyer in buyers
+            ]
+            # Restocking is admin-only: the supplier signs in as the first buyer, with the admin role
+            supplier = {'Authorization': 'Bearer ' + create_access_token(
+                identity=str(buyers[0].CustomerID), additional_claims=token_claims(buyers[0], (buyers[0].Username,)))}
+
+        plans = [(customer_id, token, rng.randint(1, args.max_quantity), rng.random(), rng.randint(1, args.max_quantity))
+                 for customer_id, token in tokens]
+        restocked = 0
+        restock_lock = threading.Lock()
+        statuses = {}
+        status_lock = threading.Lock()
+        done = threading.Event()
+
+        def record(action, status):
+            with status_lock:
+                statuses[(action, status)] = statuses.get((action, status), 0) + 1
+
+        def buyer(plan):
+            nonlocal restocked
+            customer_id, token, quantity, choice, new_quantity = plan
+            client = app.test_client()
+            headers = {'Authorization': 'Bearer ' + token}
+            response = client.post('/cart', json={'medication_id': medication_id, 'quantity': quantity}, headers=headers)
+            record('add', response.status_code)
+            if response.status_code != 201:
+                return
+            cart_item_id = response.get_json()['CartItemID']
+            if choice < 0.15:
+                record('remove', client.delete(f'/cart/{cart_item_id}', headers=headers).status_code)
+            elif choice < 0.3:
+                record('change', client.put(f'/cart/{cart_item_id}', json={'quantity': new_quantity}, headers=headers).status_code)
+                record('checkout', client.post(f'/checkout/{customer_id}', headers=headers).status_code)
+            elif choice < 0.45:
+                record('abandon', 0)
+            else:
+                record('checkout', client.post(f'/checkout/{customer_id}', headers=headers).status_code)
+            if choice > 0.9:
+                response = client.post(f'/medications/{medication_id}/stock', json={'Adjustment': 2}, headers=supplier)
+                record('restock', response.status_code)
+                if response.status_code == 200:
+                    with restock_lock:
+                        restocked += 2
+
+        def sweeper():
+            # Treat every reservation as expired, racing checkouts for the same holds
+            with app.app_context():
+                while not done.is_set():
+                    stock.sweep(now=datetime.now() + timedelta(days=1))
+                    time.sleep(0.005)
+
+        def accounting():
+            with app.app_context():
+                level = db.session.scalar(select(Medication.StockLevel).where(Medication.MedicationID == medication_id))
+                sold = db.session.scalar(
+                    select(func.coalesce(func.sum(OrderItems.Quantity), 0)).where(OrderItems.MedicationID == medication_id)
+                )
+                reserved = db.session.scalar(
+                    select(func.coalesce(func.sum(StockReservation.Quantity), 0))
+                    .where(StockReservation.MedicationID == medication_id)
+                )
+                db.session.rollback()
+            return level, sold, reserved
+
+        sweeper_thread = threading.Thread(target=sweeper, daemon=True)
+        started = time.perf_counter()
+        sweeper_thread.start()
+        with ThreadPoolExecutor(max_workers=args.concurrency) as pool:
+            list(pool.map(buyer, plans))
+        done.set()
+        sweeper_thread.join()
+        elapsed = time.perf_counter() - started
+
+        level, sold, reserved = accounting()
+        with app.app_context():
+            stock.sweep(now=datetime.now() + timedelta(days=1))
+        final_level, final_sold, final_reserved = accounting()
+    finally:
+        if path:
+            os.remove(path)
+
+    print(f'{args.buyers} buyers, {args.concurrency} clients, {elapsed:.2f}s')
+    for (action, status), count in sorted(statuses.items()):
+        print(f'  {action:<9} {status}: {count}')
+    print(f'initial {args.stock} + restocked {restocked}')
+    print(f'after run:   level {level} + sold {sold} + reserved {reserved} = {level + sold + reserved}')
+    print(f'after sweep: level {final_level} + sold {final_sold} + reserved {final_reserved} = '
+          f'{final_level + final_sold + final_reserved}')
+
+    expected = args.stock + restocked
+    ok = (
+        level >= 0 and final_level >= 0 and final_reserved == 0
+        and level + sold + reserved == expected
+        and final_level + final_sold == expected
+    )
+    print('OK: no stock oversold or lost' if ok else 'FAILED: stock accounting does not balance')
+    sys.exit(0 if ok else 1)
+
+
+if __name__ == '__main__':
+    main()
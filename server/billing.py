@@ -0,0 +1,71 @@
+from datetime import datetime
+
+from sqlalchemy import select, insert, func
+
+from models import db, Customer, Statements, CustomerBalance
+
+# Customer balances come from the customer_balance rollup (see rollups.py), which
+# is kept up to date as orders and payments change, so a balance is one row
+# lookup and a statement run never scans the orders or payments tables.
+
+STATEMENT_CHUNK_SIZE = 500
+
+
+def balances_select(customer_ids):
+    total_ordered = func.coalesce(CustomerBalance.TotalOrdered, 0)
+    total_paid = func.coalesce(CustomerBalance.TotalPaid, 0)
+    return (
+        select(
+            Customer.CustomerID,
+            total_ordered.label('TotalOrdered'),
+            total_paid.label('TotalPaid'),
+            (total_ordered - total_paid).label('AmountDue'),
+        )
+        .outerjoin(CustomerBalance, CustomerBalance.CustomerID == Customer.CustomerID)
+        .where(Customer.CustomerID.in_(customer_ids))
+        .order_by(Customer.CustomerID)
+    )
+
+
+def customer_balance(customer_id):
+    # None if the customer does not exist
+    return db.session.execute(balances_select([customer_id])).first()
+
+
+def payment_status(amount_due):
+    return 'Paid' if amount_due <= 0 else 'Due'
+
+
+def generate_statements(statement_date=None, chunk_size=STATEMENT_CHUNK_SIZE):
+    # Month-end run: walk customers in primary key chunks, compute each chunk's
+    # balances in one grouped query and write its statements in one bulk INSERT.
+    # Customers with no orders and no payments get no statement.
+    statement_date = statement_date or datetime.now()
+    written = 0
+    after = 0
+    while True:
+        customer_ids = db.session.scalars(
+            select(Customer.CustomerID)
+            .where(Customer.CustomerID > after)
+            .order_by(Customer.CustomerID)
+            .limit(chunk_size)
+        ).all()
+        if not customer_ids:
+            break
+        after = customer_ids[-1]
+
+        rows = [
+            {
+                'CustomerID': balance.CustomerID,
+                'StatementDate': statement_date,
+                'AmountDue': balance.AmountDue,
+                'PaymentStatus': payment_status(balance.AmountDue),
+            }
+            for balance in db.session.execute(balances_select(customer_ids))
+            if balance.TotalOrdered or balance.TotalPaid
+        ]
+        if rows:
+            db.session.execute(insert(Statements), rows)
+        db.session.commit()
+        written += len(rows)
+    return written
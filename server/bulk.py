@@ -0,0 +1,293 @@
+import csv
+import io
+import json
+from datetime import datetime
+from decimal import Decimal
+
+from sqlalchemy import select, insert, tuple_
+from sqlalchemy.exc import IntegrityError
+
+from models import db, Customer, Medication, Orders, OrderItems, Payments
+from pagination import iter_keyset
+from security import password_hasher
+from rollups import record_inserts
+from money import parse_money
+import fulfilment
+import search
+from serializers import RowEncoder, dumps
+
+# Bulk import/export for the catalog and transactional tables.
+# Rows are validated one by one, de-duplicated with one set-based SELECT per batch
+# and written with a single executemany INSERT per batch. Failures are reported
+# per input row instead of aborting the whole upload.
+
+DEFAULT_BATCH_SIZE = 500
+MAX_BATCH_SIZE = 5000
+DATE_FORMATS = ('%Y-%m-%dT%H:%M:%S', '%Y-%m-%d %H:%M:%S')
+
+
+def parse_datetime(value):
+    if isinstance(value, datetime):
+        return value
+    for fmt in DATE_FORMATS:
+        try:
+            return datetime.strptime(value, fmt)
+        except ValueError:
+            pass
+    raise ValueError(f'invalid date {value!r}, expected YYYY-MM-DDTHH:MM:SS')
+
+
+def format_datetime(value):
+    return value.strftime(DATE_FORMATS[0])
+
+
+def optional_str(value):
+    return None if value in (None, '') else str(value)
+
+
+class BulkResource:
+    def __init__(self, model, fields, required, unique=(), prepare=None, export_exclude=()):
+        self.model = model
+        # field name -> converter applied to the raw (JSON or CSV) value
+        self.fields = fields
+        self.required = required
+        # tuples of columns that must not repeat, checked once per batch
+        self.unique = unique
+        self.prepare = prepare
+        self.pk = model.__mapper__.primary_key[0]
+        # Sync bookkeeping (see sync.py) is not part of the data
+        export_exclude = tuple(export_exclude) + ('UpdatedAt', 'RowVersion')
+        self.export_columns = [c for c in model.__table__.c if c.key not in export_exclude]
+
+    def clean(self, record):
+        if not isinstance(record, dict):
+            raise ValueError('row must be an object')
+        missing = [name for name in self.required if record.get(name) in (None, '')]
+        if missing:
+            raise ValueError('missing required field(s): ' + ', '.join(missing))
+        row = {}
+        for name, convert in self.fields.items():
+            if name in record:
+                try:
+                    row[name] = convert(record[name])
+                except (TypeError, ValueError) as e:
+                    raise ValueError(f'{name}: {e}')
+        if self.prepare:
+            self.prepare(row, record)
+        return row
+
+
+def prepare_customer(row, record):
+    # Accept a pre-hashed password when migrating from another system,
+    # otherwise hash the plain one
+    if record.get('PasswordHash'):
+        row['PasswordHash'] = record['PasswordHash']
+    elif record.get('Password'):
+        row['PasswordHash'] = password_hasher.hash(str(record['Password']))
+    else:
+        raise ValueError('missing required field(s): Password')
+
+
+def prepare_order(row, record):
+    # The status belongs to the fulfilment pipeline: a Status in the upload is
+    # ignored, imported orders start placed and move on once paid
+    row['Status'] = fulfilment.PLACED
+
+
+RESOURCES = {
+    'medications': BulkResource(
+        Medication,
+        {'Name': str, 'Description': optional_str, 'StockLevel': int, 'PricePerUnit': parse_money},
+        required=('Name', 'StockLevel', 'PricePerUnit'),
+        unique=(('Name',),),
+    ),
+    'customers': BulkResource(
+        Customer,
+        {'FirstName': str, 'LastName': str, 'Email': str, 'Phone': str, 'Address': optional_str, 'Username': str},
+        required=('FirstName', 'LastName', 'Email', 'Phone', 'Username'),
+        unique=(('Username',), ('Email',)),
+        prepare=prepare_customer,
+        export_exclude=('PasswordHash',),
+    ),
+    'orders': BulkResource(
+        Orders,
+        {'CustomerID': int, 'OrderDate': parse_datetime, 'TotalAmount': parse_money},
+        required=('CustomerID', 'OrderDate', 'TotalAmount'),
+        prepare=prepare_order,
+    ),
+    'order_items': BulkResource(
+        OrderItems,
+        {'OrderID': int, 'MedicationID': int, 'Quantity': int, 'Subtotal': parse_money},
+        required=('OrderID', 'MedicationID', 'Quantity', 'Subtotal'),
+        unique=(('OrderID', 'MedicationID'),),
+    ),
+    'payments': BulkResource(
+        Payments,
+        {'OrderID': int, 'PaymentDate': parse_datetime, 'AmountPaid': parse_money, 'PaymentMethod': str},
+        required=('OrderID', 'PaymentDate', 'AmountPaid', 'PaymentMethod'),
+        unique=(('OrderID', 'PaymentDate', 'AmountPaid', 'PaymentMethod'),),
+    ),
+}
+
+
+# Input parsing. Every reader yields one item per input row: the decoded record,
+# or the exception raised while decoding it.
+
+def json_records(data):
+    if isinstance(data, dict):
+        data = data.get('rows')
+    if not isinstance(data, list):
+        raise ValueError('Expected a JSON array of rows')
+    return iter(data)
+
+
+def ndjson_records(stream):
+    for line in io.TextIOWrapper(stream, encoding='utf-8'):
+        line = line.strip()
+        if not line:
+            continue
+        try:
+            yield json.loads(line)
+        except ValueError as e:
+            yield e
+
+
+def csv_records(stream):
+    return csv.DictReader(io.TextIOWrapper(stream, encoding='utf-8', newline=''))
+
+
+def read_records(request):
+    upload = request.files.get('file')
+    if upload is not None:
+        name = (upload.filename or '').lower()
+        if name.endswith('.csv'):
+            return csv_records(upload.stream)
+        if name.endswith('.ndjson') or name.endswith('.jsonl'):
+            return ndjson_records(upload.stream)
+        return json_records(json.load(upload.stream))
+
+    mimetype = request.mimetype
+    if mimetype == 'text/csv':
+        return csv_records(request.stream)
+    if mimetype in ('application/x-ndjson', 'application/jsonl'):
+        return ndjson_records(request.stream)
+    return json_records(request.get_json())
+
+
+# Import
+
+def key_of(row, columns):
+    return tuple(row.get(name) for name in columns)
+
+
+def existing_keys(resource, columns, rows):
+    table = resource.model.__table__
+    cols = [table.c[name] for name in columns]
+    keys = {key_of(row, columns) for _, row in rows}
+    if len(cols) == 1:
+        stmt = select(cols[0]).where(cols[0].in_([key[0] for key in keys]))
+    else:
+        stmt = select(*cols).where(tuple_(*cols).in_(list(keys)))
+    return set(tuple(r) for r in db.session.execute(stmt))
+
+
+def after_inserts(resource, rows):
+    if resource.model is Medication:
+        search.index(names=[row['Name'] for row in rows])
+    elif resource.model is Payments:
+        # Like POST /payments, one confirmation check per order paid into
+        for order_id in sorted({row['OrderID'] for row in rows}):
+            fulfilment.payment_recorded(order_id)
+
+
+def flush_batch(resource, batch, errors):
+    # Drop rows that already exist or repeat within the batch
+    for columns in resource.unique:
+        seen = existing_keys(resource, columns, batch)
+        kept = []
+        for index, row in batch:
+            key = key_of(row, columns)
+            if key in seen:
+                errors.append({'row': index, 'error': f'duplicate {"/".join(columns)}'})
+            else:
+                seen.add(key)
+                kept.append((index, row))
+        batch = kept
+
+    if not batch:
+        return 0
+
+    try:
+        rows = [row for _, row in batch]
+        db.session.execute(insert(resource.model), rows)
+        record_inserts(resource.model, rows)
+        after_inserts(resource, rows)
+        db.session.commit()
+        return len(batch)
+    except IntegrityError:
+        db.session.rollback()
+
+    # Something in the batch violates a constraint (a concurrent insert, a bad
+    # foreign key...). Retry row by row so only the offending rows are rejected.
+    inserted = 0
+    for index, row in batch:
+        try:
+            with db.session.begin_nested():
+                db.session.execute(insert(resource.model), [row])
+                record_inserts(resource.model, [row])
+                after_inserts(resource, [row])
+            inserted += 1
+        except IntegrityError as e:
+            errors.append({'row': index, 'error': str(e.orig)})
+    db.session.commit()
+    return inserted
+
+
+def import_records(resource, records, batch_size=DEFAULT_BATCH_SIZE):
+    inserted = 0
+    errors = []
+    batch = []
+    for index, record in enumerate(records):
+        try:
+            if isinstance(record, Exception):
+                raise ValueError(f'invalid row: {record}')
+            batch.append((index, resource.clean(record)))
+        except ValueError as e:
+            errors.append({'row': index, 'error': str(e)})
+            continue
+        if len(batch) >= batch_size:
+            inserted += flush_batch(resource, batch, errors)
+            batch = []
+    if batch:
+        inserted += flush_batch(resource, batch, errors)
+    errors.sort(key=lambda error: error['row'])
+    return {'inserted': inserted, 'failed': len(errors), 'errors': errors}
+
+
+# Export
+
+def export_value(value):
+    if isinstance(value, datetime):
+        return format_datetime(value)
+    if isinstance(value, Decimal):
+        return float(value)
+    return value
+
+
+def export_ndjson(resource, batch_size=DEFAULT_BATCH_SIZE):
+    encoder = RowEncoder(resource.export_columns, datetime_separator='T')
+    for rows in iter_keyset(db.session, resource.export_columns, resource.pk, batch_size):
+        yield ''.join(dumps(row) + '\n' for row in encoder.encode_all(rows))
+
+
+def export_csv(resource, batch_size=DEFAULT_BATCH_SIZE):
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow([c.key for c in resource.export_columns])
+    for rows in iter_keyset(db.session, resource.export_columns, resource.pk, batch_size):
+        writer.writerows([export_value(value) for value in row] for row in rows)
+        yield buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate()
+    if buffer.tell():
+        yield buffer.getvalue()
@@ -0,0 +1,125 @@
+import threading
+import time
+import uuid
+from collections import OrderedDict
+
+# Read-through cache for the medication catalog.
+#
+# Every cached entry lives under the current catalog "epoch", a random token that
+# is replaced whenever the catalog changes. Invalidation is therefore a single
+# write, stale entries simply stop being addressed and age out, and the epoch
+# doubles as the ETag for every catalog response.
+#
+# The backend is pluggable: MemoryBackend keeps a per-process LRU, RedisBackend
+# shares entries (and invalidations) between workers through any Redis server.
+
+
+class MemoryBackend:
+    def __init__(self, max_entries=1024):
+        self.max_entries = max_entries
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None:
+                return None
+            value, expires_at = entry
+            if expires_at is not None and expires_at <= time.monotonic():
+                del self._data[key]
+                return None
+            self._data.move_to_end(key)
+            return value
+
+    def set(self, key, value, ttl=None):
+        expires_at = time.monotonic() + ttl if ttl else None
+        with self._lock:
+            self._data[key] = (value, expires_at)
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_entries:
+                self._data.popitem(last=False)
+
+    def add(self, key, value, ttl=None):
+        # Set only if absent, returns whether the value was stored
+        with self._lock:
+            if key in self._data:
+                expires_at = self._data[key][1]
+                if expires_at is None or expires_at > time.monotonic():
+                    return False
+        self.set(key, value, ttl)
+        return True
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+
+class RedisBackend:
+    def __init__(self, url):
+        try:
+            import redis
+        except ImportError:
+            raise RuntimeError('CATALOG_CACHE_URL points at Redis but the redis package is not installed')
+        self._client = redis.Redis.from_url(url)
+
+    def get(self, key):
+        return self._client.get(key)
+
+    def set(self, key, value, ttl=None):
+        self._client.set(key, value, ex=ttl)
+
+    def add(self, key, value, ttl=None):
+        return bool(self._client.set(key, value, ex=ttl, nx=True))
+
+    def clear(self):
+        for key in self._client.scan_iter('catalog:*'):
+            self._client.delete(key)
+
+
+class CatalogCache:
+    EPOCH_KEY = 'catalog:epoch'
+
+    def __init__(self, app=None):
+        self.backend = None
+        self.ttl = 60
+        self.epoch_ttl = None
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        app.config.setdefault('CATALOG_CACHE_URL', 'memory://')
+        app.config.setdefault('CATALOG_CACHE_TTL', 60)
+        app.config.setdefault('CATALOG_CACHE_MAX_ENTRIES', 1024)
+
+        url = app.config['CATALOG_CACHE_URL']
+        self.ttl = app.config['CATALOG_CACHE_TTL']
+        if url.startswith('redis'):
+            self.backend = RedisBackend(url)
+            # Invalidations are shared, the epoch only changes on writes
+            self.epoch_ttl = None
+        else:
+            self.backend = MemoryBackend(app.config['CATALOG_CACHE_MAX_ENTRIES'])
+            # Other workers' writes are invisible to this process, so the epoch
+            # expires with the entries to bound how stale reads and ETags can get
+            self.epoch_ttl = self.ttl
+        app.extensions['catalog_cache'] = self
+
+    def epoch(self):
+        epoch = self.backend.get(self.EPOCH_KEY)
+        if epoch is None:
+            self.backend.add(self.EPOCH_KEY, uuid.uuid4().hex, self.epoch_ttl)
+            epoch = self.backend.get(self.EPOCH_KEY)
+        return epoch.decode() if isinstance(epoch, bytes) else epoch
+
+    def get(self, name, epoch):
+        return self.backend.get(f'catalog:{epoch}:{name}')
+
+    def set(self, name, epoch, value):
+        self.backend.set(f'catalog:{epoch}:{name}', value, self.ttl)
+
+    def invalidate(self):
+        self.backend.set(self.EPOCH_KEY, uuid.uuid4().hex, self.epoch_ttl)
+
+
+catalog_cache = CatalogCache()
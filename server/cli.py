@@ -0,0 +1,139 @@
+import click
+from flask import current_app
+from flask.cli import AppGroup
+from sqlalchemy import select, func
+
+import idempotency
+import jobs
+import rollups
+import search
+import stock
+import sync
+from billing import STATEMENT_CHUNK_SIZE, generate_statements
+from models import db, Job
+
+# `flask <group> <command>` maintenance and batch jobs, run with an app context
+
+statements_cli = AppGroup('statements', help='Customer statement batch jobs.')
+
+
+@statements_cli.command('generate')
+@click.option('--date', 'statement_date', type=click.DateTime(formats=['%Y-%m-%d', '%Y-%m-%dT%H:%M:%S']),
+              default=None, help='Statement date, defaults to now.')
+@click.option('--chunk-size', default=STATEMENT_CHUNK_SIZE, show_default=True,
+              help='Customers processed per query and bulk insert.')
+def generate_statements_command(statement_date, chunk_size):
+    """Write a statement for every customer with orders or payments."""
+    written = generate_statements(statement_date, chunk_size)
+    click.echo(f'{written} statements written')
+
+
+rollups_cli = AppGroup('rollups', help='Sales and balance rollup maintenance.')
+
+
+@rollups_cli.command('rebuild')
+def rebuild_rollups_command():
+    """Recompute the rollup tables from orders, order items and payments."""
+    rollups.rebuild()
+    click.echo('Rollups rebuilt')
+
+
+@rollups_cli.command('check')
+@click.option('--fix', is_flag=True, help='Rebuild the rollups if any drift is found.')
+def check_rollups_command(fix):
+    """Compare the rollup tables with a full recomputation."""
+    drift = rollups.check()
+    for row in drift:
+        click.echo(f"{row['table']} {row['key']}: stored {row['stored']}, expected {row['expected']}")
+    if not drift:
+        click.echo('Rollups are up to date')
+        return
+    if fix:
+        rollups.rebuild()
+        click.echo(f'{len(drift)} drifted rows, rollups rebuilt')
+        return
+    raise click.ClickException(f'{len(drift)} drifted rows, run `flask rollups rebuild`')
+
+
+stock_cli = AppGroup('stock', help='Stock reservation maintenance.')
+
+
+@stock_cli.command('sweep')
+@click.option('--batch-size', default=500, show_default=True, help='Reservations read per query.')
+def sweep_reservations_command(batch_size):
+    """Return the stock held by expired cart reservations."""
+    released = stock.sweep(batch_size)
+    click.echo(f'{released} expired reservations released')
+
+
+search_cli = AppGroup('search', help='Medication search index maintenance.')
+
+
+@search_cli.command('rebuild')
+def rebuild_search_command():
+    """Reindex every medication (SQLite; PostgreSQL keeps its index itself)."""
+    search.rebuild()
+    click.echo('Search index rebuilt')
+
+
+jobs_cli = AppGroup('jobs', help='Background job queue.')
+
+
+@jobs_cli.command('work')
+@click.option('--batch-size', type=int, default=None, help='Jobs claimed per poll, defaults to JOBS_BATCH_SIZE.')
+@click.option('--once', is_flag=True, help='Exit once the queue is empty instead of polling.')
+def work_jobs_command(batch_size, once):
+    """Run queued jobs until interrupted (start as many as needed)."""
+    app = current_app._get_current_object()
+    try:
+        jobs.job_worker.run(app, batch_size, once)
+    except KeyboardInterrupt:
+        pass
+
+
+@jobs_cli.command('status')
+def jobs_status_command():
+    """Count jobs by kind and status."""
+    rows = db.session.execute(
+        select(Job.Kind, Job.Status, func.count()).group_by(Job.Kind, Job.Status).order_by(Job.Kind, Job.Status)
+    ).all()
+    for kind, status, count in rows:
+        click.echo(f'{kind:<28} {status:<8} {count}')
+    if not rows:
+        click.echo('No jobs')
+
+
+@jobs_cli.command('requeue')
+@click.option('--kind', default=None, help='Only jobs of this kind.')
+def requeue_jobs_command(kind):
+    """Retry failed jobs from scratch."""
+    click.echo(f'{jobs.requeue(kind)} failed jobs requeued')
+
+
+idempotency_cli = AppGroup('idempotency', help='Idempotency-Key store maintenance.')
+
+
+@idempotency_cli.command('purge')
+def purge_idempotency_command():
+    """Delete expired Idempotency-Key records (run from cron)."""
+    click.echo(f'{idempotency.purge()} expired keys deleted')
+
+
+sync_cli = AppGroup('sync', help='Delta sync maintenance.')
+
+
+@sync_cli.command('purge')
+@click.option('--days', type=int, default=None, help='Keep tombstones this many days, defaults to SYNC_TOMBSTONE_DAYS.')
+def purge_sync_command(days):
+    """Delete old tombstones; clients with older sync tokens start over."""
+    click.echo(f'{sync.purge(days)} tombstones deleted')
+
+
+def register_commands(app):
+    app.cli.add_command(statements_cli)
+    app.cli.add_command(rollups_cli)
+    app.cli.add_command(stock_cli)
+    app.cli.add_command(search_cli)
+    app.cli.add_command(jobs_cli)
+    app.cli.add_command(idempotency_cli)
+    app.cli.add_command(sync_cli)
@@ -0,0 +1,144 @@
+import os
+from datetime import timedelta
+
+from sqlalchemy import event
+
+# All deployment settings come from the environment so the same code runs on a
+# laptop (SQLite file) and behind several gunicorn workers (WAL SQLite or Postgres).
+
+
+def env_int(name, default):
+    value = os.environ.get(name)
+    return int(value) if value not in (None, '') else default
+
+
+def env_bool(name, default):
+    value = os.environ.get(name)
+    if value in (None, ''):
+        return default
+    return value.lower() in ('1', 'true', 'yes', 'on')
+
+
+def database_url():
+    url = os.environ.get('DATABASE_URL', 'sqlite:///utibu_health.db')
+    # Some hosts still hand out the pre-1.4 scheme SQLAlchemy no longer accepts
+    if url.startswith('postgres://'):
+        url = 'postgresql://' + url[len('postgres://'):]
+    return url
+
+
+def is_sqlite(url):
+    return url.startswith('sqlite')
+
+
+def is_sqlite_memory(url):
+    return is_sqlite(url) and (url in ('sqlite://', 'sqlite:///:memory:') or 'mode=memory' in url)
+
+
+def engine_options(url):
+    if is_sqlite_memory(url):
+        # Flask-SQLAlchemy pins in-memory databases to a single shared connection
+        return {}
+    options = {
+        'pool_pre_ping': env_bool('DB_POOL_PRE_PING', True),
+        'pool_recycle': env_int('DB_POOL_RECYCLE', 1800),
+        'pool_size': env_int('DB_POOL_SIZE', 5),
+        'max_overflow': env_int('DB_MAX_OVERFLOW', 10),
+        'pool_timeout': env_int('DB_POOL_TIMEOUT', 30),
+    }
+    if is_sqlite(url):
+        # pysqlite's own lock wait, in seconds, on top of the busy_timeout pragma
+        options['connect_args'] = {'timeout': env_int('SQLITE_BUSY_TIMEOUT', 5000) / 1000}
+    return options
+
+
+def install_sqlite_pragmas(engine, config):
+    # WAL lets readers run alongside the single writer instead of failing with
+    # "database is locked"; busy_timeout makes writers wait for the lock rather
+    # than erroring; synchronous=NORMAL is durable in WAL mode and far cheaper
+    # than FULL on every commit.
+    if engine.dialect.name != 'sqlite':
+        return
+    journal_mode = config['SQLITE_JOURNAL_MODE']
+    if is_sqlite_memory(str(engine.url)):
+        journal_mode = None
+
+    @event.listens_for(engine, 'connect')
+    def set_sqlite_pragmas(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        if journal_mode:
+            cursor.execute(f'PRAGMA journal_mode={journal_mode}')
+        cursor.execute(f'PRAGMA busy_timeout={int(config["SQLITE_BUSY_TIMEOUT"])}')
+        cursor.execute(f'PRAGMA synchronous={config["SQLITE_SYNCHRONOUS"]}')
+        cursor.close()
+
+
+class Config:
+    SQLALCHEMY_DATABASE_URI = database_url()
+    SQLALCHEMY_TRACK_MODIFICATIONS = False
+    # SQLALCHEMY_ENGINE_OPTIONS defaults to engine_options() for the final URI,
+    # see create_app()
+
+    SQLITE_JOURNAL_MODE = os.environ.get('SQLITE_JOURNAL_MODE', 'WAL')
+    SQLITE_SYNCHRONOUS = os.environ.get('SQLITE_SYNCHRONOUS', 'NORMAL')
+    SQLITE_BUSY_TIMEOUT = env_int('SQLITE_BUSY_TIMEOUT', 5000)
+
+    # Required: tokens carry the caller's role, so anyone holding the key can mint
+    # an admin token. create_app() only makes up a random one when TESTING.
+    JWT_SECRET_KEY = os.environ.get('JWT_SECRET_KEY')
+    JWT_ACCESS_TOKEN_EXPIRES = timedelta(minutes=env_int('JWT_ACCESS_TOKEN_MINUTES', 15))
+    # Customers whose tokens carry the 'admin' role
+    ADMIN_USERNAMES = tuple(name for name in os.environ.get('ADMIN_USERNAMES', '').split(',') if name)
+
+    BULK_BATCH_SIZE = env_int('BULK_BATCH_SIZE', 500)
+
+    # Any werkzeug method string, e.g. 'scrypt' or 'pbkdf2:sha256:600000'.
+    # Hashes made with other parameters are upgraded on the next successful login.
+    PASSWORD_HASH_METHOD = os.environ.get('PASSWORD_HASH_METHOD', 'scrypt')
+    PASSWORD_HASH_WORKERS = env_int('PASSWORD_HASH_WORKERS', os.cpu_count() or 4)
+    PASSWORD_HASH_EXECUTOR = os.environ.get('PASSWORD_HASH_EXECUTOR', 'thread')
+    LOGIN_MAX_CONCURRENCY = env_int('LOGIN_MAX_CONCURRENCY', 2 * (os.cpu_count() or 4))
+    LOGIN_QUEUE_TIMEOUT = env_int('LOGIN_QUEUE_TIMEOUT', 2)
+    LOGIN_RATE_LIMIT = env_int('LOGIN_RATE_LIMIT', 20)
+
+    # Cart lines hold their stock this long; the sweeper returns expired holds
+    # every STOCK_SWEEP_INTERVAL seconds (0 turns the in-process sweeper off)
+    STOCK_RESERVATION_MINUTES = env_int('STOCK_RESERVATION_MINUTES', 15)
+    STOCK_SWEEP_INTERVAL = env_int('STOCK_SWEEP_INTERVAL', 60)
+    STOCK_SWEEP_BATCH = env_int('STOCK_SWEEP_BATCH', 500)
+
+    # Background job queue (jobs.py): `flask jobs work` runs the workers;
+    # JOBS_IN_PROCESS_WORKER also runs one inside each web worker
+    JOBS_BATCH_SIZE = env_int('JOBS_BATCH_SIZE', 20)
+    JOBS_POLL_INTERVAL = env_int('JOBS_POLL_INTERVAL', 2)
+    JOBS_LEASE_SECONDS = env_int('JOBS_LEASE_SECONDS', 300)
+    JOBS_MAX_ATTEMPTS = env_int('JOBS_MAX_ATTEMPTS', 5)
+    JOBS_RETRY_DELAY = env_int('JOBS_RETRY_DELAY', 30)
+    JOBS_IN_PROCESS_WORKER = env_bool('JOBS_IN_PROCESS_WORKER', False)
+
+    # How long a write's Idempotency-Key is remembered
+    IDEMPOTENCY_TTL_HOURS = env_int('IDEMPOTENCY_TTL_HOURS', 24)
+
+    # How long deletes are kept for GET /sync; clients that last synced before
+    # `flask sync purge` removed them have to download everything again
+    SYNC_TOMBSTONE_DAYS = env_int('SYNC_TOMBSTONE_DAYS', 90)
+
+    # GET /events: memory:// reaches streams in this process only, redis://...
+    # relays events between all web and job workers
+    PUSH_BACKEND_URL = os.environ.get('PUSH_BACKEND_URL', 'memory://')
+    PUSH_QUEUE_SIZE = env_int('PUSH_QUEUE_SIZE', 100)
+    PUSH_HEARTBEAT_SECONDS = env_int('PUSH_HEARTBEAT_SECONDS', 15)
+    PUSH_STREAM_SECONDS = env_int('PUSH_STREAM_SECONDS', 300)
+    PUSH_MAX_SUBSCRIBERS = env_int('PUSH_MAX_SUBSCRIBERS', 500)
+
+    # Sub-requests accepted by one POST /batch
+    BATCH_MAX_REQUESTS = env_int('BATCH_MAX_REQUESTS', 20)
+
+    # Request/SQL profiling and the Prometheus /metrics endpoint, off by default
+    PROFILING_ENABLED = env_bool('PROFILING_ENABLED', False)
+    PROFILING_SLOW_QUERY_MS = env_int('PROFILING_SLOW_QUERY_MS', 100)
+    PROFILING_N_PLUS_ONE_THRESHOLD = env_int('PROFILING_N_PLUS_ONE_THRESHOLD', 5)
+
+    CATALOG_CACHE_URL = os.environ.get('CATALOG_CACHE_URL', 'memory://')
+    CATALOG_CACHE_TTL = env_int('CATALOG_CACHE_TTL', 60)
+    CATALOG_CACHE_MAX_ENTRIES = env_int('CATALOG_CACHE_MAX_ENTRIES', 1024)
@@ -0,0 +1,6 @@
+from flask_cors import CORS
+from flask_jwt_extended import JWTManager
+
+# Extensions are created unbound and attached to each app in create_app()
+cors = CORS()
+jwt = JWTManager()
@@ -0,0 +1,99 @@
+import logging
+from datetime import datetime
+
+from sqlalchemy import select, update, func
+
+import jobs
+import push
+import stock
+from models import db, Orders, OrderItems, Payments
+
+# Order fulfilment, driven by the job queue rather than by clients:
+#
+#     placed -> payment confirmed -> stock committed -> ready for pickup
+#
+# Each step is a job that moves the order on with a guarded UPDATE (only from
+# the status it expects) and queues the next step under a per-order idempotency
+# key, so a step that runs twice, or a payment recorded twice, moves the order
+# once. Orders from checkout already took their stock with the cart's
+# reservations (StockCommittedAt is set); orders entered line by line through
+# /orders and /order_items take it in the stock step.
+
+logger = logging.getLogger(__name__)
+
+# Orders placed before the pipeline existed say 'Pending' too
+PLACED = 'Pending'
+PAYMENT_CONFIRMED = 'Payment Confirmed'
+STOCK_COMMITTED = 'Stock Committed'
+READY_FOR_PICKUP = 'Ready for Pickup'
+
+STATUSES = (PLACED, PAYMENT_CONFIRMED, STOCK_COMMITTED, READY_FOR_PICKUP)
+
+
+class StockUnavailable(Exception):
+    pass
+
+
+def payment_recorded(order_id, payment_id=None):
+    # Call in the transaction that records or changes a payment
+    key = f'payment:{payment_id}:confirm' if payment_id is not None else None
+    jobs.enqueue('order.confirm_payment', {'order_id': order_id}, key=key)
+
+
+def advance(order_id, from_status, to_status, **values):
+    result = db.session.execute(
+        update(Orders)
+        .where(Orders.OrderID == order_id, Orders.Status == from_status)
+        .values(Status=to_status, **values)
+    )
+    if result.rowcount != 1:
+        return False
+    push.order_changed(order_id)
+    return True
+
+
+@jobs.handler('order.confirm_payment')
+def confirm_payment(order_id):
+    order = db.session.execute(
+        select(Orders.Status, Orders.TotalAmount).where(Orders.OrderID == order_id)
+    ).first()
+    if order is None or order.Status != PLACED:
+        return
+    paid = db.session.scalar(
+        select(func.coalesce(func.sum(Payments.AmountPaid), 0)).where(Payments.OrderID == order_id)
+    )
+    if paid < order.TotalAmount:
+        # Part payment: the next payment queues another check
+        return
+    if advance(order_id, PLACED, PAYMENT_CONFIRMED):
+        jobs.enqueue('order.commit_stock', {'order_id': order_id}, key=f'order:{order_id}:commit_stock')
+
+
+@jobs.handler('order.commit_stock')
+def commit_stock(order_id):
+    order = db.session.execute(
+        select(Orders.Status, Orders.StockCommittedAt).where(Orders.OrderID == order_id)
+    ).first()
+    if order is None or order.Status != PAYMENT_CONFIRMED:
+        return
+    committed_at = order.StockCommittedAt
+    if committed_at is None:
+        items = db.session.execute(
+            select(OrderItems.MedicationID, OrderItems.Quantity)
+            .where(OrderItems.OrderID == order_id)
+            # Same lock order as checkout
+            .order_by(OrderItems.MedicationID)
+        ).all()
+        for item in items:
+            if not stock.take(item.MedicationID, item.Quantity):
+                # Rolled back with the job and retried later, e.g. after a restock
+                raise StockUnavailable(f'medication {item.MedicationID}: {item.Quantity} not in stock')
+        committed_at = datetime.now()
+    if advance(order_id, PAYMENT_CONFIRMED, STOCK_COMMITTED, StockCommittedAt=committed_at):
+        jobs.enqueue('order.ready_for_pickup', {'order_id': order_id}, key=f'order:{order_id}:ready_for_pickup')
+
+
+@jobs.handler('order.ready_for_pickup')
+def ready_for_pickup(order_id):
+    if advance(order_id, STOCK_COMMITTED, READY_FOR_PICKUP):
+        logger.info('order %d is ready for pickup', order_id)
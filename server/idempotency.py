@@ -0,0 +1,169 @@
+import hashlib
+from datetime import datetime, timedelta
+from functools import wraps
+
+from flask import Response, current_app, jsonify, request
+from flask_jwt_extended import get_jwt_identity, verify_jwt_in_request
+from sqlalchemy import select, insert, delete
+from sqlalchemy.exc import IntegrityError
+
+from models import db, IdempotentRequest
+from batch import BatchSession
+
+# Idempotency-Key support for write endpoints.
+#
+# A retry with the same key (same caller, method and path) gets the stored
+# response back without running the handler again, at the cost of one primary
+# key lookup. Reusing a key for a different body is a client bug and gets 422.
+#
+# The first request runs its handler with commits deferred: the handler's
+# commit() only flushes, and its writes commit in one transaction with the
+# stored response, so a crash can't leave one without the other. Two attempts
+# racing with the same key both run, but only one can insert the key; the
+# other rolls back everything it wrote and replays the winner's response.
+#
+# Server errors, and conflicts that may clear up (409, 429), are not stored, so
+# retrying them runs the handler again. Keys expire after IDEMPOTENCY_TTL_HOURS;
+# `flask idempotency purge` deletes the expired rows.
+#
+# Requests without the header behave exactly as before.
+
+HEADER = 'Idempotency-Key'
+MAX_KEY_LENGTH = 255
+UNSTORED_STATUSES = (409, 429)
+
+
+def init_app(app):
+    app.config.setdefault('IDEMPOTENCY_TTL_HOURS', 24)
+
+
+class IdempotentSession(db.session.session_factory.class_):
+    # db.session while a keyed request runs. The handler's commit() only
+    # flushes; commit_request() commits its writes with the stored response.
+
+    committed = False
+
+    def commit(self):
+        self.flush()
+        self.committed = True
+
+    def rollback(self):
+        self.committed = False
+        super().rollback()
+
+    def commit_request(self):
+        super().commit()
+
+
+def request_scope():
+    # Keys are only unique per caller and endpoint
+    verify_jwt_in_request(optional=True)
+    return f'{get_jwt_identity() or "-"} {request.method} {request.path}'[:MAX_KEY_LENGTH]
+
+
+def in_progress():
+    response = jsonify({'error': 'A request with this Idempotency-Key is still being processed'})
+    response.headers['Retry-After'] = '1'
+    return response, 409
+
+
+def replay(record):
+    response = Response(record.Response, status=record.StatusCode, content_type=record.ContentType)
+    response.headers['Idempotent-Replayed'] = 'true'
+    return response
+
+
+def lookup(key, scope):
+    return db.session.execute(
+        select(IdempotentRequest).where(IdempotentRequest.Key == key, IdempotentRequest.Scope == scope)
+    ).scalar_one_or_none()
+
+
+def answer(record, digest):
+    # The response to a retry of a stored request
+    if record.RequestHash != digest:
+        return jsonify({'error': 'Idempotency-Key was already used for a different request'}), 422
+    return replay(record)
+
+
+def store(key, scope, digest, response, replace):
+    # Add the response to the request's transaction; False if another attempt
+    # stored one first
+    now = datetime.now()
+    try:
+        if replace:
+            # The expired record this request takes over
+            db.session.execute(
+                delete(IdempotentRequest)
+                .where(IdempotentRequest.Key == key, IdempotentRequest.Scope == scope)
+            )
+        db.session.execute(insert(IdempotentRequest), [{
+            'Key': key,
+            'Scope': scope,
+            'RequestHash': digest,
+            'StatusCode': response.status_code,
+            'Response': response.get_data(),
+            'ContentType': response.content_type,
+            'CreatedAt': now,
+            'ExpiresAt': now + timedelta(hours=current_app.config['IDEMPOTENCY_TTL_HOURS']),
+        }])
+    except IntegrityError:
+        return False
+    return True
+
+
+def run(view, args, kwargs, key, scope, digest, replace):
+    # The handler's response, stored in the current transaction if it should be
+    response = current_app.make_response(view(*args, **kwargs))
+    session = db.session()
+    if isinstance(session, IdempotentSession) and not session.committed:
+        # Like the end of a request, discard writes the handler didn't commit
+        session.rollback()
+    if response.status_code >= 500 or response.status_code in UNSTORED_STATUSES:
+        return response
+    if store(key, scope, digest, response, replace):
+        return response
+    db.session.rollback()
+    record = lookup(key, scope)
+    return current_app.make_response(in_progress() if record is None else answer(record, digest))
+
+
+def idempotent(view):
+    # Apply below the auth decorators, so the key is scoped to a verified caller
+    @wraps(view)
+    def wrapper(*args, **kwargs):
+        key = request.headers.get(HEADER)
+        if key is None:
+            return view(*args, **kwargs)
+        if not key or len(key) > MAX_KEY_LENGTH:
+            return jsonify({'error': f'{HEADER} must be 1 to {MAX_KEY_LENGTH} characters'}), 400
+
+        scope = request_scope()
+        digest = hashlib.sha256(request.get_data()).hexdigest()
+        record = lookup(key, scope)
+        if record is not None and record.ExpiresAt > datetime.now():
+            return answer(record, digest)
+
+        if isinstance(db.session(), BatchSession):
+            # Part of an atomic batch, which already defers the commit
+            return run(view, args, kwargs, key, scope, digest, record is not None)
+        db.session.remove()
+        session = IdempotentSession(**db.session.session_factory.kw)
+        db.session.registry.set(session)
+        try:
+            response = run(view, args, kwargs, key, scope, digest, record is not None)
+            session.commit_request()
+        except Exception:
+            session.rollback()
+            raise
+        finally:
+            db.session.remove()
+        return response
+    return wrapper
+
+
+def purge():
+    # Drop expired keys; the number removed
+    result = db.session.execute(delete(IdempotentRequest).where(IdempotentRequest.ExpiresAt < datetime.now()))
+    db.session.commit()
+    return result.rowcount
@@ -0,0 +1,220 @@
+import bisect
+import logging
+import threading
+import time
+from collections import Counter
+
+from flask import Response, g, request, has_request_context
+from sqlalchemy import event
+
+# Opt-in request profiling (PROFILING_ENABLED=1): per-route latency histograms,
+# SQL statement counts and time per request from engine events, N+1 warnings
+# and a slow-query log, all exposed in Prometheus text format at /metrics.
+#
+# Metrics live in the worker process, so with several gunicorn workers each
+# scrape sees one worker; run a single worker or aggregate in Prometheus.
+
+logger = logging.getLogger(__name__)
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+STATEMENT_BUCKETS = (1, 2, 3, 5, 10, 20, 50, 100)
+
+
+def redact(parameters):
+    # Keep the shape of the bound parameters, never their values: a slow-query
+    # log line must not leak emails, password hashes or tokens
+    if isinstance(parameters, dict):
+        return {key: type(value).__name__ for key, value in parameters.items()}
+    if isinstance(parameters, (list, tuple)):
+        if parameters and isinstance(parameters[0], (dict, list, tuple)):
+            return [redact(parameters[0]), f'... {len(parameters)} rows']
+        return [type(value).__name__ for value in parameters]
+    return type(parameters).__name__
+
+
+def label_text(labels):
+    if not labels:
+        return ''
+    escaped = (str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n') for _, value in labels)
+    return '{' + ','.join(f'{name}="{value}"' for (name, _), value in zip(labels, escaped)) + '}'
+
+
+class Histogram:
+    def __init__(self, name, help, buckets):
+        self.name = name
+        self.help = help
+        self.buckets = buckets
+        self.series = {}
+
+    def observe(self, labels, value):
+        series = self.series.get(labels)
+        if series is None:
+            # one count per bucket, then +Inf, then the sum
+            series = self.series[labels] = [0] * (len(self.buckets) + 1) + [0.0]
+        series[bisect.bisect_left(self.buckets, value)] += 1
+        series[-1] += value
+
+    def render(self):
+        lines = [f'# HELP {self.name} {self.help}', f'# TYPE {self.name} histogram']
+        for labels, series in sorted(self.series.items()):
+            cumulative = 0
+            for bound, count in zip(self.buckets + ('+Inf',), series):
+                cumulative += count
+                lines.append(f'{self.name}_bucket{label_text(labels + (("le", bound),))} {cumulative}')
+            lines.append(f'{self.name}_sum{label_text(labels)} {series[-1]}')
+            lines.append(f'{self.name}_count{label_text(labels)} {cumulative}')
+        return lines
+
+
+class CounterMetric:
+    def __init__(self, name, help):
+        self.name = name
+        self.help = help
+        self.values = Counter()
+
+    def inc(self, labels, value=1):
+        self.values[labels] += value
+
+    def render(self):
+        lines = [f'# HELP {self.name} {self.help}', f'# TYPE {self.name} counter']
+        for labels, value in sorted(self.values.items()):
+            lines.append(f'{self.name}{label_text(labels)} {value}')
+        return lines
+
+
+class RequestProfile:
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.statements = Counter()
+        self.sql_count = 0
+        self.sql_time = 0.0
+
+
+class Profiler:
+    def __init__(self, app=None):
+        self.enabled = False
+        self.slow_query_seconds = 0.1
+        self.n_plus_one_threshold = 5
+        self._lock = threading.Lock()
+        self._reset_metrics()
+        if app is not None:
+            self.init_app(app)
+
+    def _reset_metrics(self):
+        self.request_duration = Histogram(
+            'utibu_http_request_duration_seconds', 'Request latency by route.', LATENCY_BUCKETS)
+        self.request_statements = Histogram(
+            'utibu_http_request_sql_statements', 'SQL statements executed per request by route.', STATEMENT_BUCKETS)
+        self.sql_seconds = CounterMetric(
+            'utibu_sql_duration_seconds_total', 'Time spent executing SQL, by route.')
+        self.sql_statements = CounterMetric(
+            'utibu_sql_statements_total', 'SQL statements executed, by route.')
+        self.slow_queries = CounterMetric(
+            'utibu_sql_slow_queries_total', 'Statements slower than PROFILING_SLOW_QUERY_MS, by route.')
+        self.n_plus_one = CounterMetric(
+            'utibu_sql_n_plus_one_total', 'Requests that repeated one statement PROFILING_N_PLUS_ONE_THRESHOLD times or more.')
+
+    def init_app(self, app, engine=None):
+        app.config.setdefault('PROFILING_ENABLED', False)
+        app.config.setdefault('PROFILING_SLOW_QUERY_MS', 100)
+        app.config.setdefault('PROFILING_N_PLUS_ONE_THRESHOLD', 5)
+        app.extensions['profiler'] = self
+        self.enabled = app.config['PROFILING_ENABLED']
+        if not self.enabled:
+            return
+        self.slow_query_seconds = app.config['PROFILING_SLOW_QUERY_MS'] / 1000.0
+        self.n_plus_one_threshold = app.config['PROFILING_N_PLUS_ONE_THRESHOLD']
+        self._reset_metrics()
+
+        app.before_request(self._before_request)
+        app.after_request(self._after_request)
+        app.add_url_rule('/metrics', 'metrics', self.metrics_view)
+        if engine is not None:
+            self.instrument_engine(engine)
+
+    def instrument_engine(self, engine):
+        if not event.contains(engine, 'before_cursor_execute', self._before_cursor_execute):
+            event.listen(engine, 'before_cursor_execute', self._before_cursor_execute)
+            event.listen(engine, 'after_cursor_execute', self._after_cursor_execute)
+            event.listen(engine, 'handle_error', self._handle_error)
+
+    @staticmethod
+    def route():
+        return request.url_rule.rule if request.url_rule is not None else 'unmatched'
+
+    # Requests
+
+    def _before_request(self):
+        g.profile = RequestProfile()
+
+    def _after_request(self, response):
+        profile = g.get('profile')
+        if profile is None:
+            return response
+        # Streamed bodies (GET /events, bulk exports) are still being produced,
+        # and still querying, after this hook: record once the server closes
+        # the response instead
+        method, route, status = request.method, self.route(), response.status_code
+        response.call_on_close(lambda: self._record(profile, method, route, status))
+        return response
+
+    def _record(self, profile, method, route, status):
+        elapsed = time.perf_counter() - profile.started
+        labels = (('method', method), ('route', route))
+        with self._lock:
+            self.request_duration.observe(labels + (('status', status),), elapsed)
+            self.request_statements.observe(labels, profile.sql_count)
+            self.sql_statements.inc((('route', route),), profile.sql_count)
+            self.sql_seconds.inc((('route', route),), profile.sql_time)
+
+        statement, repeats = profile.statements.most_common(1)[0] if profile.statements else (None, 0)
+        if repeats >= self.n_plus_one_threshold:
+            with self._lock:
+                self.n_plus_one.inc((('route', route),))
+            logger.warning('possible N+1 in %s %s: statement ran %d times: %s',
+                           method, route, repeats, statement)
+
+    # SQL
+
+    def _before_cursor_execute(self, conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault('profiler_started', []).append((context, time.perf_counter()))
+
+    def _after_cursor_execute(self, conn, cursor, statement, parameters, context, executemany):
+        elapsed = time.perf_counter() - conn.info['profiler_started'].pop()[1]
+        profile = g.get('profile') if has_request_context() else None
+        if profile is not None:
+            profile.sql_count += 1
+            profile.sql_time += elapsed
+            if not executemany:
+                profile.statements[statement] += 1
+        if elapsed >= self.slow_query_seconds:
+            route = self.route() if has_request_context() else 'background'
+            with self._lock:
+                self.slow_queries.inc((('route', route),))
+            logger.warning('slow query (%.1f ms) in %s: %s parameters=%s',
+                           elapsed * 1000, route, statement, redact(parameters))
+
+    def _handle_error(self, exception_context):
+        # A statement that raised never reaches after_cursor_execute. conn.info
+        # outlives the checkout, so drop its start time here or the stack grows
+        # with every failed statement on the pooled connection.
+        connection = exception_context.connection
+        started = connection.info.get('profiler_started') if connection is not None else None
+        if started and started[-1][0] is exception_context.execution_context:
+            started.pop()
+
+    # Exposition
+
+    def render(self):
+        with self._lock:
+            lines = []
+            for metric in (self.request_duration, self.request_statements, self.sql_statements,
+                           self.sql_seconds, self.slow_queries, self.n_plus_one):
+                lines.extend(metric.render())
+        return '\n'.join(lines) + '\n'
+
+    def metrics_view(self):
+        return Response(self.render(), mimetype='text/plain; version=0.0.4')
+
+
+profiler = Profiler()
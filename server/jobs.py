@@ -0,0 +1,228 @@
+import logging
+import os
+import socket
+import threading
+import traceback
+from datetime import datetime, timedelta
+
+from flask import current_app
+from sqlalchemy import select, insert, update, and_, or_
+
+from models import db, Job
+
+# Durable job queue on the `job` table.
+#
+# enqueue() adds a job to the caller's transaction, so work is queued exactly
+# when the write that needs it commits and request threads never do it inline.
+# Workers (`flask jobs work`) claim batches with SELECT ... FOR UPDATE SKIP
+# LOCKED on PostgreSQL; on SQLite, where the clause is ignored, the guarded
+# UPDATE that takes the lease decides which worker gets a job. A claimed job is
+# leased for JOBS_LEASE_SECONDS: if its worker dies, another one picks it up
+# once the lease runs out.
+#
+# A handler's writes commit in the same transaction that marks its job done, so
+# a retried job never sees half of an earlier attempt. Failures are retried with
+# exponential backoff up to MaxAttempts, then left as 'failed' for
+# `flask jobs requeue`.
+
+logger = logging.getLogger(__name__)
+
+QUEUED = 'queued'
+RUNNING = 'running'
+DONE = 'done'
+FAILED = 'failed'
+
+MAX_RETRY_DELAY = 3600
+
+HANDLERS = {}
+
+
+def handler(kind):
+    def register(function):
+        HANDLERS[kind] = function
+        return function
+    return register
+
+
+def enqueue(kind, payload, key=None, run_at=None, max_attempts=None):
+    # Queue `kind` to run with **payload. A job with the same idempotency key,
+    # queued, running or finished, makes this a no-op.
+    now = datetime.now()
+    row = {
+        'Kind': kind,
+        'Payload': payload,
+        'IdempotencyKey': key,
+        'Status': QUEUED,
+        'Attempts': 0,
+        'MaxAttempts': max_attempts or current_app.config['JOBS_MAX_ATTEMPTS'],
+        'RunAt': run_at or now,
+        'CreatedAt': now,
+    }
+    if key is None:
+        db.session.execute(insert(Job), [row])
+        return
+    dialect = db.session.connection().dialect.name
+    if dialect in ('sqlite', 'postgresql'):
+        if dialect == 'sqlite':
+            from sqlalchemy.dialects.sqlite import insert as dialect_insert
+        else:
+            from sqlalchemy.dialects.postgresql import insert as dialect_insert
+        db.session.execute(dialect_insert(Job).on_conflict_do_nothing(index_elements=['IdempotencyKey']), [row])
+        return
+    if db.session.scalar(select(Job.JobID).where(Job.IdempotencyKey == key)) is None:
+        db.session.execute(insert(Job), [row])
+
+
+def worker_name():
+    return f'{socket.gethostname()}:{os.getpid()}:{threading.get_ident()}'
+
+
+def retry_delay(attempts):
+    base = current_app.config['JOBS_RETRY_DELAY']
+    return timedelta(seconds=min(MAX_RETRY_DELAY, base * 2 ** max(0, attempts - 1)))
+
+
+def claim(worker, batch_size, now=None):
+    # Lease up to batch_size runnable jobs to `worker`, oldest first
+    now = now or datetime.now()
+    lease = timedelta(seconds=current_app.config['JOBS_LEASE_SECONDS'])
+    expired = and_(Job.Status == RUNNING, Job.LockedUntil < now)
+
+    # Jobs whose worker died on their last attempt are not handed out again
+    db.session.execute(
+        update(Job)
+        .where(expired, Job.Attempts >= Job.MaxAttempts)
+        .values(Status=FAILED, FinishedAt=now, LockedBy=None, LockedUntil=None,
+                LastError='lease expired on the last attempt')
+    )
+    claimable = or_(and_(Job.Status == QUEUED, Job.RunAt <= now), and_(expired, Job.Attempts < Job.MaxAttempts))
+    job_ids = db.session.scalars(
+        select(Job.JobID)
+        .where(claimable)
+        .order_by(Job.RunAt, Job.JobID)
+        .limit(batch_size)
+        .with_for_update(skip_locked=True)
+    ).all()
+    claimed = []
+    for job_id in job_ids:
+        result = db.session.execute(
+            update(Job)
+            .where(Job.JobID == job_id, claimable)
+            .values(Status=RUNNING, LockedBy=worker, LockedUntil=now + lease, Attempts=Job.Attempts + 1)
+        )
+        if result.rowcount == 1:
+            claimed.append(job_id)
+    db.session.commit()
+    return claimed
+
+
+def run(job_id, worker):
+    # Run one claimed job; True if it completed
+    job = db.session.execute(
+        select(Job.Kind, Job.Payload, Job.Attempts, Job.MaxAttempts).where(Job.JobID == job_id)
+    ).one()
+    held = and_(Job.JobID == job_id, Job.Status == RUNNING, Job.LockedBy == worker)
+    try:
+        function = HANDLERS.get(job.Kind)
+        if function is None:
+            raise LookupError(f'no handler for job kind {job.Kind!r}')
+        function(**job.Payload)
+        result = db.session.execute(
+            update(Job).where(held)
+            .values(Status=DONE, FinishedAt=datetime.now(), LockedBy=None, LockedUntil=None, LastError=None)
+        )
+        if result.rowcount != 1:
+            # The lease ran out and another worker has the job now; its run counts
+            db.session.rollback()
+            logger.warning('job %d (%s) lost its lease, discarding this run', job_id, job.Kind)
+            return False
+        db.session.commit()
+        return True
+    except Exception:
+        db.session.rollback()
+        error = traceback.format_exc()
+        now = datetime.now()
+        if job.Attempts >= job.MaxAttempts:
+            values = {'Status': FAILED, 'FinishedAt': now}
+            logger.error('job %d (%s) failed after %d attempts:\n%s', job_id, job.Kind, job.Attempts, error)
+        else:
+            values = {'Status': QUEUED, 'RunAt': now + retry_delay(job.Attempts)}
+            logger.warning('job %d (%s) failed, attempt %d of %d:\n%s',
+                           job_id, job.Kind, job.Attempts, job.MaxAttempts, error)
+        db.session.execute(update(Job).where(held).values(LockedBy=None, LockedUntil=None, LastError=error, **values))
+        db.session.commit()
+        return False
+
+
+def work(batch_size=None, worker=None):
+    # Claim and run one batch; the number of jobs claimed
+    batch_size = batch_size or current_app.config['JOBS_BATCH_SIZE']
+    worker = worker or worker_name()
+    job_ids = claim(worker, batch_size)
+    for job_id in job_ids:
+        run(job_id, worker)
+    return len(job_ids)
+
+
+def requeue(kind=None):
+    # Give failed jobs a fresh set of attempts
+    stmt = update(Job).where(Job.Status == FAILED)
+    if kind is not None:
+        stmt = stmt.where(Job.Kind == kind)
+    result = db.session.execute(
+        stmt.values(Status=QUEUED, Attempts=0, RunAt=datetime.now(), FinishedAt=None)
+    )
+    db.session.commit()
+    return result.rowcount
+
+
+class JobWorker:
+    # Polls the queue, sleeping JOBS_POLL_INTERVAL seconds whenever it is empty.
+    # `flask jobs work` runs one in the foreground; JOBS_IN_PROCESS_WORKER also
+    # starts one in every web worker, for single-process deployments.
+
+    def __init__(self, app=None):
+        self.thread = None
+        self.stopped = threading.Event()
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        app.config.setdefault('JOBS_BATCH_SIZE', 20)
+        app.config.setdefault('JOBS_POLL_INTERVAL', 2)
+        app.config.setdefault('JOBS_LEASE_SECONDS', 300)
+        app.config.setdefault('JOBS_MAX_ATTEMPTS', 5)
+        app.config.setdefault('JOBS_RETRY_DELAY', 30)
+        app.config.setdefault('JOBS_IN_PROCESS_WORKER', False)
+        app.extensions['job_worker'] = self
+        if app.config['JOBS_IN_PROCESS_WORKER'] and not app.testing:
+            self.start(app)
+
+    def start(self, app):
+        if self.thread is not None and self.thread.is_alive():
+            return
+        self.stopped.clear()
+        self.thread = threading.Thread(target=self.run, args=(app,), name='job-worker', daemon=True)
+        self.thread.start()
+
+    def stop(self):
+        self.stopped.set()
+
+    def run(self, app, batch_size=None, once=False):
+        worker = worker_name()
+        interval = app.config['JOBS_POLL_INTERVAL']
+        while not self.stopped.is_set():
+            with app.app_context():
+                try:
+                    claimed = work(batch_size, worker)
+                except Exception:
+                    db.session.rollback()
+                    logger.exception('job queue poll failed')
+                    claimed = 0
+            if once and not claimed:
+                return
+            if not claimed:
+                self.stopped.wait(interval)
+
+
+job_worker = JobWorker()
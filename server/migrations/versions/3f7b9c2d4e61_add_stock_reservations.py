@@ -0,0 +1,41 @@
+"""Add stock reservations
+
+Revision ID: 3f7b9c2d4e61
+Revises: 8a41c3f0d925
+Create Date: 2026-10-18 19:02:33.417806
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '3f7b9c2d4e61'
+down_revision = '8a41c3f0d925'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # Carts that already exist hold no stock: their lines take it at checkout
+    op.create_table('stock_reservation',
+    sa.Column('ReservationID', sa.Integer(), nullable=False),
+    sa.Column('CartItemID', sa.Integer(), nullable=False),
+    sa.Column('MedicationID', sa.Integer(), nullable=False),
+    sa.Column('Quantity', sa.Integer(), nullable=False),
+    sa.Column('ExpiresAt', sa.DateTime(), nullable=False),
+    sa.ForeignKeyConstraint(['CartItemID'], ['cart_item.CartItemID'], ),
+    sa.ForeignKeyConstraint(['MedicationID'], ['medication.MedicationID'], ),
+    sa.PrimaryKeyConstraint('ReservationID')
+    )
+    with op.batch_alter_table('stock_reservation', schema=None) as batch_op:
+        batch_op.create_index(batch_op.f('ix_stock_reservation_CartItemID'), ['CartItemID'], unique=True)
+        batch_op.create_index(batch_op.f('ix_stock_reservation_ExpiresAt'), ['ExpiresAt'], unique=False)
+
+
+def downgrade():
+    with op.batch_alter_table('stock_reservation', schema=None) as batch_op:
+        batch_op.drop_index(batch_op.f('ix_stock_reservation_ExpiresAt'))
+        batch_op.drop_index(batch_op.f('ix_stock_reservation_CartItemID'))
+
+    op.drop_table('stock_reservation')
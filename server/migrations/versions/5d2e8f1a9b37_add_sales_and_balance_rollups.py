@@ -0,0 +1,59 @@
+"""Add daily sales and customer balance rollups
+
+Revision ID: 5d2e8f1a9b37
+Revises: c6c3aa37ef65
+Create Date: 2026-10-18 17:05:12.530981
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '5d2e8f1a9b37'
+down_revision = 'c6c3aa37ef65'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('daily_medication_sales',
+    sa.Column('SalesDate', sa.Date(), nullable=False),
+    sa.Column('MedicationID', sa.Integer(), autoincrement=False, nullable=False),
+    sa.Column('QuantitySold', sa.Integer(), nullable=False),
+    sa.Column('Revenue', sa.Float(), nullable=False),
+    sa.PrimaryKeyConstraint('SalesDate', 'MedicationID')
+    )
+    with op.batch_alter_table('daily_medication_sales', schema=None) as batch_op:
+        batch_op.create_index(batch_op.f('ix_daily_medication_sales_MedicationID'), ['MedicationID'], unique=False)
+
+    op.create_table('customer_balance',
+    sa.Column('CustomerID', sa.Integer(), autoincrement=False, nullable=False),
+    sa.Column('TotalOrdered', sa.Float(), nullable=False),
+    sa.Column('TotalPaid', sa.Float(), nullable=False),
+    sa.PrimaryKeyConstraint('CustomerID')
+    )
+
+    # Backfill from the existing orders, the same computation as `flask rollups rebuild`
+    op.execute(
+        'INSERT INTO daily_medication_sales ("SalesDate", "MedicationID", "QuantitySold", "Revenue") '
+        'SELECT date(o."OrderDate"), i."MedicationID", SUM(i."Quantity"), SUM(i."Subtotal") '
+        'FROM order_items i JOIN orders o ON o."OrderID" = i."OrderID" '
+        'GROUP BY date(o."OrderDate"), i."MedicationID"'
+    )
+    op.execute(
+        'INSERT INTO customer_balance ("CustomerID", "TotalOrdered", "TotalPaid") '
+        'SELECT c."CustomerID", '
+        'COALESCE((SELECT SUM(o."TotalAmount") FROM orders o WHERE o."CustomerID" = c."CustomerID"), 0), '
+        'COALESCE((SELECT SUM(p."AmountPaid") FROM payments p JOIN orders o ON o."OrderID" = p."OrderID" '
+        'WHERE o."CustomerID" = c."CustomerID"), 0) '
+        'FROM (SELECT "CustomerID" FROM orders GROUP BY "CustomerID") c'
+    )
+
+
+def downgrade():
+    op.drop_table('customer_balance')
+    with op.batch_alter_table('daily_medication_sales', schema=None) as batch_op:
+        batch_op.drop_index(batch_op.f('ix_daily_medication_sales_MedicationID'))
+
+    op.drop_table('daily_medication_sales')
@@ -0,0 +1,39 @@
+"""Add idempotency keys
+
+Revision ID: 6c0f2e9b3d18
+Revises: e2b6d4a81f07
+Create Date: 2026-10-18 21:12:40.275913
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '6c0f2e9b3d18'
+down_revision = 'e2b6d4a81f07'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('idempotent_request',
+    sa.Column('Key', sa.String(length=255), nullable=False),
+    sa.Column('Scope', sa.String(length=255), nullable=False),
+    sa.Column('RequestHash', sa.String(length=64), nullable=False),
+    sa.Column('StatusCode', sa.Integer(), nullable=False),
+    sa.Column('Response', sa.LargeBinary(), nullable=False),
+    sa.Column('ContentType', sa.String(length=100), nullable=False),
+    sa.Column('CreatedAt', sa.DateTime(), nullable=False),
+    sa.Column('ExpiresAt', sa.DateTime(), nullable=False),
+    sa.PrimaryKeyConstraint('Key', 'Scope')
+    )
+    with op.batch_alter_table('idempotent_request', schema=None) as batch_op:
+        batch_op.create_index(batch_op.f('ix_idempotent_request_ExpiresAt'), ['ExpiresAt'], unique=False)
+
+
+def downgrade():
+    with op.batch_alter_table('idempotent_request', schema=None) as batch_op:
+        batch_op.drop_index(batch_op.f('ix_idempotent_request_ExpiresAt'))
+
+    op.drop_table('idempotent_request')
@@ -0,0 +1,52 @@
+"""Store money as integer cents
+
+Revision ID: 8a41c3f0d925
+Revises: 5d2e8f1a9b37
+Create Date: 2026-10-18 18:21:47.102394
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '8a41c3f0d925'
+down_revision = '5d2e8f1a9b37'
+branch_labels = None
+depends_on = None
+
+
+MONEY_COLUMNS = (
+    ('medication', 'PricePerUnit'),
+    ('orders', 'TotalAmount'),
+    ('order_items', 'Subtotal'),
+    ('payments', 'AmountPaid'),
+    ('statements', 'AmountDue'),
+    ('daily_medication_sales', 'Revenue'),
+    ('customer_balance', 'TotalOrdered'),
+    ('customer_balance', 'TotalPaid'),
+)
+
+
+def upgrade():
+    # Scale to cents while the column is still a float, then change the type;
+    # SQLite's batch copy and PostgreSQL's USING both cast the rounded value
+    for table, column in MONEY_COLUMNS:
+        op.execute(f'UPDATE {table} SET "{column}" = ROUND("{column}" * 100)')
+        with op.batch_alter_table(table, schema=None) as batch_op:
+            batch_op.alter_column(column,
+                   existing_type=sa.Float(),
+                   type_=sa.BigInteger(),
+                   existing_nullable=False,
+                   postgresql_using=f'"{column}"::bigint')
+
+
+def downgrade():
+    for table, column in MONEY_COLUMNS:
+        with op.batch_alter_table(table, schema=None) as batch_op:
+            batch_op.alter_column(column,
+                   existing_type=sa.BigInteger(),
+                   type_=sa.Float(),
+                   existing_nullable=False,
+                   postgresql_using=f'"{column}"::double precision')
+        op.execute(f'UPDATE {table} SET "{column}" = "{column}" / 100.0')
@@ -0,0 +1,63 @@
+"""Add delta sync tracking
+
+Revision ID: 9d3a7e5c2f40
+Revises: 6c0f2e9b3d18
+Create Date: 2026-10-18 21:47:05.611284
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '9d3a7e5c2f40'
+down_revision = '6c0f2e9b3d18'
+branch_labels = None
+depends_on = None
+
+SYNCED_TABLES = ('customer', 'medication', 'orders', 'order_items', 'payments', 'statements')
+
+
+def upgrade():
+    op.create_table('sync_clock',
+    sa.Column('ID', sa.Integer(), nullable=False),
+    sa.Column('Version', sa.BigInteger(), nullable=False),
+    sa.Column('PurgedVersion', sa.BigInteger(), nullable=False),
+    sa.PrimaryKeyConstraint('ID')
+    )
+    op.execute('INSERT INTO sync_clock ("ID", "Version", "PurgedVersion") VALUES (1, 0, 0)')
+
+    op.create_table('tombstone',
+    sa.Column('TombstoneID', sa.Integer(), nullable=False),
+    sa.Column('TableName', sa.String(length=50), nullable=False),
+    sa.Column('RowID', sa.Integer(), nullable=False),
+    sa.Column('CustomerID', sa.Integer(), nullable=True),
+    sa.Column('RowVersion', sa.BigInteger(), nullable=False),
+    sa.Column('DeletedAt', sa.DateTime(), nullable=False),
+    sa.PrimaryKeyConstraint('TombstoneID')
+    )
+    with op.batch_alter_table('tombstone', schema=None) as batch_op:
+        batch_op.create_index(batch_op.f('ix_tombstone_DeletedAt'), ['DeletedAt'], unique=False)
+        batch_op.create_index(batch_op.f('ix_tombstone_RowVersion'), ['RowVersion'], unique=False)
+
+    # Existing rows start at version 0, so the first sync of every client gets them
+    for table in SYNCED_TABLES:
+        with op.batch_alter_table(table, schema=None) as batch_op:
+            batch_op.add_column(sa.Column('UpdatedAt', sa.DateTime(), nullable=True))
+            batch_op.add_column(sa.Column('RowVersion', sa.BigInteger(), server_default='0', nullable=False))
+            batch_op.create_index(batch_op.f(f'ix_{table}_RowVersion'), ['RowVersion'], unique=False)
+
+
+def downgrade():
+    for table in reversed(SYNCED_TABLES):
+        with op.batch_alter_table(table, schema=None) as batch_op:
+            batch_op.drop_index(batch_op.f(f'ix_{table}_RowVersion'))
+            batch_op.drop_column('RowVersion')
+            batch_op.drop_column('UpdatedAt')
+
+    with op.batch_alter_table('tombstone', schema=None) as batch_op:
+        batch_op.drop_index(batch_op.f('ix_tombstone_RowVersion'))
+        batch_op.drop_index(batch_op.f('ix_tombstone_DeletedAt'))
+
+    op.drop_table('tombstone')
+    op.drop_table('sync_clock')
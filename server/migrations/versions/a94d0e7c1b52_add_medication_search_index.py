@@ -0,0 +1,48 @@
+"""Add medication search index
+
+Revision ID: a94d0e7c1b52
+Revises: 3f7b9c2d4e61
+Create Date: 2026-10-18 19:48:05.631270
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'a94d0e7c1b52'
+down_revision = '3f7b9c2d4e61'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # Same objects as search.py creates alongside db.create_all()
+    dialect = op.get_context().dialect.name
+    if dialect == 'sqlite':
+        op.execute(
+            "CREATE VIRTUAL TABLE medication_fts USING fts5("
+            "Name, Description, tokenize = 'unicode61 remove_diacritics 2')"
+        )
+        op.execute("CREATE VIRTUAL TABLE medication_fts_vocab USING fts5vocab('medication_fts', 'row')")
+        op.execute(
+            'INSERT INTO medication_fts (rowid, "Name", "Description") '
+            'SELECT "MedicationID", "Name", "Description" FROM medication'
+        )
+    elif dialect == 'postgresql':
+        op.execute(
+            'ALTER TABLE medication ADD COLUMN search_vector tsvector GENERATED ALWAYS AS ('
+            "setweight(to_tsvector('simple', coalesce(\"Name\", '')), 'A') || "
+            "setweight(to_tsvector('simple', coalesce(\"Description\", '')), 'B')) STORED"
+        )
+        op.create_index('ix_medication_search_vector', 'medication', ['search_vector'], postgresql_using='gin')
+
+
+def downgrade():
+    dialect = op.get_context().dialect.name
+    if dialect == 'sqlite':
+        op.execute('DROP TABLE medication_fts_vocab')
+        op.execute('DROP TABLE medication_fts')
+    elif dialect == 'postgresql':
+        op.drop_index('ix_medication_search_vector', table_name='medication')
+        op.drop_column('medication', 'search_vector')
@@ -0,0 +1,32 @@
+"""Widen Customer.PasswordHash for scrypt hashes
+
+Revision ID: b7e4c1d9a362
+Revises: 9d3a7e5c2f40
+Create Date: 2026-10-18 22:05:13.482917
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'b7e4c1d9a362'
+down_revision = '9d3a7e5c2f40'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('customer', schema=None) as batch_op:
+        batch_op.alter_column('PasswordHash',
+               existing_type=sa.String(length=128),
+               type_=sa.String(length=255),
+               existing_nullable=False)
+
+
+def downgrade():
+    with op.batch_alter_table('customer', schema=None) as batch_op:
+        batch_op.alter_column('PasswordHash',
+               existing_type=sa.String(length=255),
+               type_=sa.String(length=128),
+               existing_nullable=False)
@@ -0,0 +1,79 @@
+"""Add lookup indexes and unique constraints
+
+Revision ID: c6c3aa37ef65
+Revises: 4171aadb46e4
+Create Date: 2026-10-18 09:12:41.204518
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'c6c3aa37ef65'
+down_revision = '4171aadb46e4'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # The unique indexes below replace application-level duplicate checks, so
+    # clean up duplicates those checks let through before creating them.
+
+    # Rows sharing a unique value: the oldest keeps it (it is the one login and
+    # lookups already resolved to), the others get their id appended
+    for table, pk, column in (
+        ('customer', 'CustomerID', 'Username'),
+        ('customer', 'CustomerID', 'Email'),
+        ('medication', 'MedicationID', 'Name'),
+    ):
+        op.execute(
+            f'UPDATE {table} SET "{column}" = "{column}" || \' #\' || CAST("{pk}" AS VARCHAR(20)) '
+            f'WHERE "{pk}" NOT IN (SELECT MIN("{pk}") FROM {table} GROUP BY "{column}")'
+        )
+    # Repeated cart lines and order lines: fold them into the oldest row
+    op.execute(
+        'UPDATE cart_item SET "Quantity" = (SELECT SUM(c2."Quantity") FROM cart_item c2 '
+        'WHERE c2."CustomerID" = cart_item."CustomerID" AND c2."MedicationID" = cart_item."MedicationID") '
+        'WHERE "CartItemID" IN (SELECT MIN("CartItemID") FROM cart_item GROUP BY "CustomerID", "MedicationID" HAVING COUNT(*) > 1)'
+    )
+    op.execute(
+        'DELETE FROM cart_item WHERE "CartItemID" NOT IN '
+        '(SELECT MIN("CartItemID") FROM cart_item GROUP BY "CustomerID", "MedicationID")'
+    )
+    op.execute(
+        'UPDATE order_items SET '
+        '"Quantity" = (SELECT SUM(o2."Quantity") FROM order_items o2 '
+        'WHERE o2."OrderID" = order_items."OrderID" AND o2."MedicationID" = order_items."MedicationID"), '
+        '"Subtotal" = (SELECT SUM(o2."Subtotal") FROM order_items o2 '
+        'WHERE o2."OrderID" = order_items."OrderID" AND o2."MedicationID" = order_items."MedicationID") '
+        'WHERE "OrderItemID" IN (SELECT MIN("OrderItemID") FROM order_items GROUP BY "OrderID", "MedicationID" HAVING COUNT(*) > 1)'
+    )
+    op.execute(
+        'DELETE FROM order_items WHERE "OrderItemID" NOT IN '
+        '(SELECT MIN("OrderItemID") FROM order_items GROUP BY "OrderID", "MedicationID")'
+    )
+
+    op.create_index('ix_customer_Username', 'customer', ['Username'], unique=True)
+    op.create_index('ix_customer_Email', 'customer', ['Email'], unique=True)
+    op.create_index('ix_medication_Name', 'medication', ['Name'], unique=True)
+    op.create_index('ix_orders_CustomerID', 'orders', ['CustomerID'], unique=False)
+    op.create_index('ix_order_items_OrderID_MedicationID', 'order_items', ['OrderID', 'MedicationID'], unique=True)
+    op.create_index('ix_order_items_MedicationID', 'order_items', ['MedicationID'], unique=False)
+    op.create_index('ix_payments_OrderID', 'payments', ['OrderID'], unique=False)
+    op.create_index('ix_statements_CustomerID', 'statements', ['CustomerID'], unique=False)
+    op.create_index('ix_cart_item_CustomerID_MedicationID', 'cart_item', ['CustomerID', 'MedicationID'], unique=True)
+    op.create_index('ix_cart_item_MedicationID', 'cart_item', ['MedicationID'], unique=False)
+
+
+def downgrade():
+    op.drop_index('ix_cart_item_MedicationID', table_name='cart_item')
+    op.drop_index('ix_cart_item_CustomerID_MedicationID', table_name='cart_item')
+    op.drop_index('ix_statements_CustomerID', table_name='statements')
+    op.drop_index('ix_payments_OrderID', table_name='payments')
+    op.drop_index('ix_order_items_MedicationID', table_name='order_items')
+    op.drop_index('ix_order_items_OrderID_MedicationID', table_name='order_items')
+    op.drop_index('ix_orders_CustomerID', table_name='orders')
+    op.drop_index('ix_medication_Name', table_name='medication')
+    op.drop_index('ix_customer_Email', table_name='customer')
+    op.drop_index('ix_customer_Username', table_name='customer')
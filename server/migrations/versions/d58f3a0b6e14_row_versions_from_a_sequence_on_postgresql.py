@@ -0,0 +1,81 @@
+"""Row versions from a sequence on PostgreSQL
+
+Revision ID: d58f3a0b6e14
+Revises: b7e4c1d9a362
+Create Date: 2026-10-18 23:12:40.207381
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'd58f3a0b6e14'
+down_revision = 'b7e4c1d9a362'
+branch_labels = None
+depends_on = None
+
+GATE = '1937337955, 0'
+
+
+def upgrade():
+    # Same objects as models.py creates alongside db.create_all(); SQLite keeps
+    # counting in sync_clock
+    if op.get_context().dialect.name != 'postgresql':
+        return
+    op.execute('CREATE SEQUENCE row_version_seq')
+    # Carry on from the last version the clock handed out
+    op.execute('SELECT setval(\'row_version_seq\', "Version" + 1, false) FROM sync_clock')
+    op.execute(f"""CREATE OR REPLACE FUNCTION next_row_version() RETURNS bigint AS $$
+DECLARE
+    version bigint;
+BEGIN
+    PERFORM pg_advisory_lock_shared({GATE});
+    BEGIN
+        version := nextval('row_version_seq');
+        -- Until the transaction ends
+        PERFORM pg_advisory_xact_lock(version);
+    EXCEPTION WHEN OTHERS OR query_canceled THEN
+        PERFORM pg_advisory_unlock_shared({GATE});
+        RAISE;
+    END;
+    PERFORM pg_advisory_unlock_shared({GATE});
+    RETURN version;
+END
+$$ LANGUAGE plpgsql""")
+    op.execute(f"""CREATE OR REPLACE FUNCTION settled_row_version() RETURNS bigint AS $$
+DECLARE
+    settled bigint;
+BEGIN
+    -- Every version below the result belongs to a transaction that has ended
+    PERFORM pg_advisory_lock({GATE});
+    BEGIN
+        SELECT min((CAST(classid AS bigint) << 32) | CAST(objid AS bigint)) INTO settled
+        FROM pg_locks
+        WHERE locktype = 'advisory' AND objsubid = 1 AND granted
+            AND database = (SELECT oid FROM pg_database WHERE datname = current_database());
+        IF settled IS NULL THEN
+            SELECT CASE WHEN is_called THEN last_value + 1 ELSE last_value END INTO settled
+            FROM row_version_seq;
+        END IF;
+    EXCEPTION WHEN OTHERS OR query_canceled THEN
+        PERFORM pg_advisory_unlock({GATE});
+        RAISE;
+    END;
+    PERFORM pg_advisory_unlock({GATE});
+    RETURN settled;
+END
+$$ LANGUAGE plpgsql""")
+
+
+def downgrade():
+    if op.get_context().dialect.name != 'postgresql':
+        return
+    # Hand the count back to the clock row
+    op.execute(
+        'UPDATE sync_clock SET "Version" = (SELECT CASE WHEN is_called THEN last_value ELSE last_value - 1 END '
+        'FROM row_version_seq)'
+    )
+    op.execute('DROP FUNCTION settled_row_version()')
+    op.execute('DROP FUNCTION next_row_version()')
+    op.execute('DROP SEQUENCE row_version_seq')
@@ -0,0 +1,55 @@
+"""Add job queue and order stock commit time
+
+Revision ID: e2b6d4a81f07
+Revises: a94d0e7c1b52
+Create Date: 2026-10-18 20:34:12.588104
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'e2b6d4a81f07'
+down_revision = 'a94d0e7c1b52'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('job',
+    sa.Column('JobID', sa.Integer(), nullable=False),
+    sa.Column('Kind', sa.String(length=50), nullable=False),
+    sa.Column('Payload', sa.JSON(), nullable=False),
+    sa.Column('IdempotencyKey', sa.String(length=100), nullable=True),
+    sa.Column('Status', sa.String(length=10), nullable=False),
+    sa.Column('Attempts', sa.Integer(), nullable=False),
+    sa.Column('MaxAttempts', sa.Integer(), nullable=False),
+    sa.Column('RunAt', sa.DateTime(), nullable=False),
+    sa.Column('LockedBy', sa.String(length=100), nullable=True),
+    sa.Column('LockedUntil', sa.DateTime(), nullable=True),
+    sa.Column('LastError', sa.Text(), nullable=True),
+    sa.Column('CreatedAt', sa.DateTime(), nullable=False),
+    sa.Column('FinishedAt', sa.DateTime(), nullable=True),
+    sa.PrimaryKeyConstraint('JobID'),
+    sa.UniqueConstraint('IdempotencyKey')
+    )
+    with op.batch_alter_table('job', schema=None) as batch_op:
+        batch_op.create_index('ix_job_Status_RunAt', ['Status', 'RunAt'], unique=False)
+
+    with op.batch_alter_table('orders', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('StockCommittedAt', sa.DateTime(), nullable=True))
+
+    # Existing orders are past the stock step one way or another; never take
+    # their stock a second time
+    op.execute('UPDATE orders SET "StockCommittedAt" = "OrderDate"')
+
+
+def downgrade():
+    with op.batch_alter_table('orders', schema=None) as batch_op:
+        batch_op.drop_column('StockCommittedAt')
+
+    with op.batch_alter_table('job', schema=None) as batch_op:
+        batch_op.drop_index('ix_job_Status_RunAt')
+
+    op.drop_table('job')
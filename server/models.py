@@ -1,75 +1,269 @@
+from datetime import datetime
+
 from flask import Flask
 from flask_sqlalchemy import SQLAlchemy
-from werkzeug.security import generate_password_hash, check_password_hash
+from sqlalchemy import DDL, event, func, select, update
+from security import password_hasher
+from money import Money
 
 db = SQLAlchemy()
 
-class Customer(db.Model):
+
+# Change tracking for GET /sync (see sync.py). Every write to a synced table
+# stamps the row with UpdatedAt and with its transaction's RowVersion, taken by
+# the transaction's first synced write. Being column defaults, the stamps also
+# cover Core INSERTs and UPDATEs.
+#
+# A client that has seen version N must never miss a later commit numbered below
+# N. On SQLite the version comes from the single sync_clock row, which stays
+# locked until commit, so versions are handed out in commit order (SQLite has
+# one writer at a time anyway). On PostgreSQL that lock would queue every writer
+# behind the previous one's commit, so versions come from a sequence instead and
+# each transaction holds an advisory lock on its version until it ends; /sync
+# only serves versions below the oldest one still locked (settled_row_version()).
+
+def row_version(context):
+    connection = context.connection
+    transaction = connection.get_transaction()
+    cached = connection.info.get('row_version')
+    if cached is not None:
+        owner, savepoint, version = cached
+        # A version taken in a savepoint that was rolled back went with it
+        if owner is transaction and (savepoint is None or savepoint.is_active):
+            return version
+    if connection.dialect.name == 'postgresql':
+        version = connection.scalar(select(func.next_row_version()))
+    else:
+        connection.execute(update(SyncClock).values(Version=SyncClock.Version + 1))
+        version = connection.scalar(select(SyncClock.Version))
+    connection.info['row_version'] = (transaction, connection.get_nested_transaction(), version)
+    return version
+
+
+class Versioned:
+    UpdatedAt = db.Column(db.DateTime, default=datetime.now, onupdate=datetime.now)
+    RowVersion = db.Column(db.BigInteger, nullable=False, index=True, server_default='0',
+                           default=row_version, onupdate=row_version)
+
+
+class Customer(Versioned, db.Model):
     CustomerID = db.Column(db.Integer, primary_key=True)
     FirstName = db.Column(db.String(100), nullable=False)
     LastName = db.Column(db.String(100), nullable=False)
-    Email = db.Column(db.String(100), nullable=False)
+    Email = db.Column(db.String(100), nullable=False, unique=True, index=True)
     Phone = db.Column(db.String(20), nullable=False)
     Address = db.Column(db.String(255))
-    Username = db.Column(db.String(100), nullable=False)
-    PasswordHash = db.Column(db.String(128), nullable=False)
+    Username = db.Column(db.String(100), nullable=False, unique=True, index=True)
+    # scrypt hashes run to ~160 characters
+    PasswordHash = db.Column(db.String(255), nullable=False)
 
     def set_password(self, password):
-        self.PasswordHash = generate_password_hash(password)
+        self.PasswordHash = password_hasher.hash(password)
 
     def check_password(self, password):
-        return check_password_hash(self.PasswordHash, password)
+        return password_hasher.verify(self.PasswordHash, password)
+
+    def password_needs_rehash(self):
+        return password_hasher.needs_rehash(self.PasswordHash)
 
-class Medication(db.Model):
+class Medication(Versioned, db.Model):
     MedicationID = db.Column(db.Integer, primary_key=True)
-    Name = db.Column(db.String(100), nullable=False)
+    Name = db.Column(db.String(100), nullable=False, unique=True, index=True)
     Description = db.Column(db.Text)
     StockLevel = db.Column(db.Integer, nullable=False)
-    PricePerUnit = db.Column(db.Float, nullable=False)
+    PricePerUnit = db.Column(Money, nullable=False)
 
-class Orders(db.Model):
+class Orders(Versioned, db.Model):
     OrderID = db.Column(db.Integer, primary_key=True)
-    CustomerID = db.Column(db.Integer, db.ForeignKey('customer.CustomerID'), nullable=False)
+    CustomerID = db.Column(db.Integer, db.ForeignKey('customer.CustomerID'), nullable=False, index=True)
     OrderDate = db.Column(db.DateTime, nullable=False)
     Status = db.Column(db.String(20), nullable=False)
-    TotalAmount = db.Column(db.Float, nullable=False)
+    TotalAmount = db.Column(Money, nullable=False)
+    # When the order's stock was taken off StockLevel: at checkout, or by the
+    # fulfilment pipeline for orders entered line by line (see fulfilment.py)
+    StockCommittedAt = db.Column(db.DateTime)
 
     customer = db.relationship('Customer', backref=db.backref('orders', lazy=True))
 
-class OrderItems(db.Model):
+class OrderItems(Versioned, db.Model):
+    __table_args__ = (
+        db.Index('ix_order_items_OrderID_MedicationID', 'OrderID', 'MedicationID', unique=True),
+    )
+
     OrderItemID = db.Column(db.Integer, primary_key=True)
     OrderID = db.Column(db.Integer, db.ForeignKey('orders.OrderID'), nullable=False)
-    MedicationID = db.Column(db.Integer, db.ForeignKey('medication.MedicationID'), nullable=False)
+    MedicationID = db.Column(db.Integer, db.ForeignKey('medication.MedicationID'), nullable=False, index=True)
     Quantity = db.Column(db.Integer, nullable=False)
-    Subtotal = db.Column(db.Float, nullable=False)
+    Subtotal = db.Column(Money, nullable=False)
 
-    order = db.relationship('Orders', backref=db.backref('order_items', lazy=True))
+    order = db.relationship('Orders', backref=db.backref('order_items', lazy=True, cascade='all, delete-orphan'))
     medication = db.relationship('Medication')
 
-class Payments(db.Model):
+class Payments(Versioned, db.Model):
     PaymentID = db.Column(db.Integer, primary_key=True)
-    OrderID = db.Column(db.Integer, db.ForeignKey('orders.OrderID'), nullable=False)
+    OrderID = db.Column(db.Integer, db.ForeignKey('orders.OrderID'), nullable=False, index=True)
     PaymentDate = db.Column(db.DateTime, nullable=False)
-    AmountPaid = db.Column(db.Float, nullable=False)
+    AmountPaid = db.Column(Money, nullable=False)
     PaymentMethod = db.Column(db.String(50), nullable=False)
 
-    order = db.relationship('Orders', backref=db.backref('payments', lazy=True))
+    order = db.relationship('Orders', backref=db.backref('payments', lazy=True, cascade='all, delete-orphan'))
 
 
-class Statements(db.Model):
+class Statements(Versioned, db.Model):
     StatementID = db.Column(db.Integer, primary_key=True)
-    CustomerID = db.Column(db.Integer, db.ForeignKey('customer.CustomerID'), nullable=False)
+    CustomerID = db.Column(db.Integer, db.ForeignKey('customer.CustomerID'), nullable=False, index=True)
     StatementDate = db.Column(db.DateTime, nullable=False)
-    AmountDue = db.Column(db.Float, nullable=False)
+    AmountDue = db.Column(Money, nullable=False)
     PaymentStatus = db.Column(db.String(20), nullable=False)
 
     customer = db.relationship('Customer', backref=db.backref('statements', lazy=True))
 
 class CartItem(db.Model):
+    __table_args__ = (
+        db.Index('ix_cart_item_CustomerID_MedicationID', 'CustomerID', 'MedicationID', unique=True),
+    )
+
     CartItemID = db.Column(db.Integer, primary_key=True)
     CustomerID = db.Column(db.Integer, db.ForeignKey('customer.CustomerID'), nullable=False)
-    MedicationID = db.Column(db.Integer, db.ForeignKey('medication.MedicationID'), nullable=False)
+    MedicationID = db.Column(db.Integer, db.ForeignKey('medication.MedicationID'), nullable=False, index=True)
     Quantity = db.Column(db.Integer, nullable=False)
 
     customer = db.relationship('Customer', backref=db.backref('cart_items', lazy=True))
     medication = db.relationship('Medication')
+
+class StockReservation(db.Model):
+    # Stock held for a cart line: while the row exists its Quantity has already
+    # been taken off Medication.StockLevel (see stock.py)
+    ReservationID = db.Column(db.Integer, primary_key=True)
+    CartItemID = db.Column(db.Integer, db.ForeignKey('cart_item.CartItemID'), nullable=False, unique=True, index=True)
+    MedicationID = db.Column(db.Integer, db.ForeignKey('medication.MedicationID'), nullable=False)
+    Quantity = db.Column(db.Integer, nullable=False)
+    ExpiresAt = db.Column(db.DateTime, nullable=False, index=True)
+
+# Rollups: totals maintained incrementally by rollups.py as orders, order items and
+# payments change, so reports read one row instead of scanning the transactional tables.
+# `flask rollups rebuild` recomputes them from scratch.
+
+class DailyMedicationSales(db.Model):
+    SalesDate = db.Column(db.Date, primary_key=True)
+    MedicationID = db.Column(db.Integer, primary_key=True, autoincrement=False, index=True)
+    QuantitySold = db.Column(db.Integer, nullable=False, default=0)
+    Revenue = db.Column(Money, nullable=False, default=0)
+
+class CustomerBalance(db.Model):
+    CustomerID = db.Column(db.Integer, primary_key=True, autoincrement=False)
+    TotalOrdered = db.Column(Money, nullable=False, default=0)
+    TotalPaid = db.Column(Money, nullable=False, default=0)
+
+
+class Job(db.Model):
+    # Durable background work, claimed and run by `flask jobs work` (see jobs.py).
+    # IdempotencyKey is unique, so enqueueing the same work twice keeps one job.
+    __table_args__ = (
+        db.Index('ix_job_Status_RunAt', 'Status', 'RunAt'),
+    )
+
+    JobID = db.Column(db.Integer, primary_key=True)
+    Kind = db.Column(db.String(50), nullable=False)
+    Payload = db.Column(db.JSON, nullable=False)
+    IdempotencyKey = db.Column(db.String(100), unique=True)
+    Status = db.Column(db.String(10), nullable=False)
+    Attempts = db.Column(db.Integer, nullable=False, default=0)
+    MaxAttempts = db.Column(db.Integer, nullable=False)
+    RunAt = db.Column(db.DateTime, nullable=False)
+    LockedBy = db.Column(db.String(100))
+    LockedUntil = db.Column(db.DateTime)
+    LastError = db.Column(db.Text)
+    CreatedAt = db.Column(db.DateTime, nullable=False)
+    FinishedAt = db.Column(db.DateTime)
+
+class IdempotentRequest(db.Model):
+    # The stored response to a write sent with an Idempotency-Key, replayed to
+    # retries until ExpiresAt (see idempotency.py). It commits in the same
+    # transaction as the request's writes.
+    Key = db.Column(db.String(255), primary_key=True)
+    Scope = db.Column(db.String(255), primary_key=True)
+    RequestHash = db.Column(db.String(64), nullable=False)
+    StatusCode = db.Column(db.Integer, nullable=False)
+    Response = db.Column(db.LargeBinary, nullable=False)
+    ContentType = db.Column(db.String(100), nullable=False)
+    CreatedAt = db.Column(db.DateTime, nullable=False)
+    ExpiresAt = db.Column(db.DateTime, nullable=False, index=True)
+
+
+class SyncClock(db.Model):
+    # One row: the last RowVersion handed out (SQLite only), and the newest
+    # version whose tombstones have been purged (older sync tokens can no longer
+    # be served)
+    ID = db.Column(db.Integer, primary_key=True)
+    Version = db.Column(db.BigInteger, nullable=False)
+    PurgedVersion = db.Column(db.BigInteger, nullable=False)
+
+event.listen(SyncClock.__table__, 'after_create',
+             DDL('INSERT INTO sync_clock ("ID", "Version", "PurgedVersion") VALUES (1, 0, 0)'))
+
+# PostgreSQL's row versions. Writers take the gate shared just long enough to
+# pair nextval() with the lock on the version, so the exclusive gate in
+# settled_row_version() never sees a version that is handed out but not locked
+# yet. Versions are locked with the one-bigint form of the advisory lock
+# functions (objsubid 1 in pg_locks), the gate with the two-integer form.
+ROW_VERSION_GATE = '1937337955, 0'
+POSTGRESQL_ROW_VERSION_DDL = (
+    'CREATE SEQUENCE IF NOT EXISTS row_version_seq',
+    f"""CREATE OR REPLACE FUNCTION next_row_version() RETURNS bigint AS $$
+DECLARE
+    version bigint;
+BEGIN
+    PERFORM pg_advisory_lock_shared({ROW_VERSION_GATE});
+    BEGIN
+        version := nextval('row_version_seq');
+        -- Until the transaction ends
+        PERFORM pg_advisory_xact_lock(version);
+    EXCEPTION WHEN OTHERS OR query_canceled THEN
+        PERFORM pg_advisory_unlock_shared({ROW_VERSION_GATE});
+        RAISE;
+    END;
+    PERFORM pg_advisory_unlock_shared({ROW_VERSION_GATE});
+    RETURN version;
+END
+$$ LANGUAGE plpgsql""",
+    f"""CREATE OR REPLACE FUNCTION settled_row_version() RETURNS bigint AS $$
+DECLARE
+    settled bigint;
+BEGIN
+    -- Every version below the result belongs to a transaction that has ended
+    PERFORM pg_advisory_lock({ROW_VERSION_GATE});
+    BEGIN
+        SELECT min((CAST(classid AS bigint) << 32) | CAST(objid AS bigint)) INTO settled
+        FROM pg_locks
+        WHERE locktype = 'advisory' AND objsubid = 1 AND granted
+            AND database = (SELECT oid FROM pg_database WHERE datname = current_database());
+        IF settled IS NULL THEN
+            SELECT CASE WHEN is_called THEN last_value + 1 ELSE last_value END INTO settled
+            FROM row_version_seq;
+        END IF;
+    EXCEPTION WHEN OTHERS OR query_canceled THEN
+        PERFORM pg_advisory_unlock({ROW_VERSION_GATE});
+        RAISE;
+    END;
+    PERFORM pg_advisory_unlock({ROW_VERSION_GATE});
+    RETURN settled;
+END
+$$ LANGUAGE plpgsql""",
+)
+
+for statement in POSTGRESQL_ROW_VERSION_DDL:
+    event.listen(SyncClock.__table__, 'after_create', DDL(statement).execute_if(dialect='postgresql'))
+for statement in ('DROP FUNCTION IF EXISTS settled_row_version()', 'DROP FUNCTION IF EXISTS next_row_version()',
+                  'DROP SEQUENCE IF EXISTS row_version_seq'):
+    event.listen(SyncClock.__table__, 'before_drop', DDL(statement).execute_if(dialect='postgresql'))
+
+class Tombstone(db.Model):
+    # A deleted row of a synced table, so /sync can tell clients to drop it.
+    # CustomerID is the customer the row belonged to (NULL for medications).
+    TombstoneID = db.Column(db.Integer, primary_key=True)
+    TableName = db.Column(db.String(50), nullable=False)
+    RowID = db.Column(db.Integer, nullable=False)
+    CustomerID = db.Column(db.Integer)
+    RowVersion = db.Column(db.BigInteger, nullable=False, index=True, default=row_version)
+    DeletedAt = db.Column(db.DateTime, nullable=False, default=datetime.now, index=True)
@@ -0,0 +1,64 @@
+from decimal import Decimal, InvalidOperation, ROUND_HALF_UP
+
+from sqlalchemy import BigInteger
+from sqlalchemy.sql import operators
+from sqlalchemy.types import TypeDecorator
+
+# Money is stored as an integer number of cents and handled as Decimal in Python,
+# so sums are exact integer arithmetic in SQL and no float rounding creeps in.
+# The API still reads and writes amounts as plain JSON numbers (6.25).
+
+CENT = Decimal('0.01')
+
+
+def to_money(value):
+    # Decimal rounded to whole cents; accepts ints, floats, Decimals and numeric strings
+    if value is None:
+        return None
+    if isinstance(value, bool):
+        raise ValueError(f'invalid amount: {value!r}')
+    try:
+        amount = value if isinstance(value, Decimal) else Decimal(str(value))
+        return amount.quantize(CENT, rounding=ROUND_HALF_UP)
+    except (InvalidOperation, ValueError):
+        raise ValueError(f'invalid amount: {value!r}')
+
+
+def parse_money(value):
+    # An amount sent by a client: prices, subtotals and payments are never negative
+    amount = to_money(value)
+    if amount is None or not amount.is_finite():
+        raise ValueError(f'invalid amount: {value!r}')
+    if amount < 0:
+        raise ValueError('must be zero or more')
+    return amount
+
+
+class Money(TypeDecorator):
+    impl = BigInteger
+    cache_ok = True
+
+    class Comparator(TypeDecorator.Comparator):
+        def _adapt_expression(self, op, other_comparator):
+            # price * quantity and total - paid are still money
+            if op in (operators.add, operators.sub, operators.mul):
+                return op, self.type
+            return super()._adapt_expression(op, other_comparator)
+
+    comparator_factory = Comparator
+
+    def process_bind_param(self, value, dialect):
+        if value is None:
+            return None
+        return int(to_money(value) * 100)
+
+    def process_result_value(self, value, dialect):
+        if value is None:
+            return None
+        # SUM() of a bigint comes back as a Decimal on PostgreSQL
+        return (Decimal(value) / 100).quantize(CENT)
+
+    @property
+    def python_type(self):
+        return Decimal
+
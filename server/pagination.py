@@ -0,0 +1,57 @@
+from sqlalchemy import select
+
+# Keyset ("seek") pagination: rows are always ordered by the primary key, so the
+# next page is `WHERE pk > :after LIMIT :n` and never pays for an OFFSET scan.
+DEFAULT_PAGE_SIZE = 100
+MAX_PAGE_SIZE = 1000
+EXPORT_BATCH_SIZE = 500
+
+
+def page_size(limit):
+    if limit is None:
+        return DEFAULT_PAGE_SIZE
+    return max(1, min(limit, MAX_PAGE_SIZE))
+
+
+def keyset_select(columns, pk, after=None, limit=None, descending=False):
+    # With descending=True pages walk newest first and `after` is an upper bound
+    if descending:
+        stmt = select(*columns).order_by(pk.desc())
+        if after is not None:
+            stmt = stmt.where(pk < after)
+    else:
+        stmt = select(*columns).order_by(pk)
+        if after is not None:
+            stmt = stmt.where(pk > after)
+    if limit is not None:
+        stmt = stmt.limit(limit)
+    return stmt
+
+
+def iter_keyset(session, columns, pk, batch_size=EXPORT_BATCH_SIZE):
+    # Walk a whole table in primary key order, one bounded batch at a time
+    after = None
+    while True:
+        rows = session.execute(keyset_select(columns, pk, after, batch_size)).all()
+        if not rows:
+            return
+        yield rows
+        if len(rows) < batch_size:
+            return
+        after = rows[-1]._mapping[pk.key]
+
+
+def project_columns(model, allowed, fields, pk):
+    # Resolve a `fields=` query string into table columns, always keeping the
+    # primary key so the result can still be paginated.
+    # Returns None if an unknown field was requested.
+    if not fields:
+        names = list(allowed)
+    else:
+        names = [name.strip() for name in fields.split(',') if name.strip()]
+        if any(name not in allowed for name in names):
+            return None
+    if pk.key not in names:
+        names.insert(0, pk.key)
+    table = model.__table__
+    return [table.c[name] for name in names]
@@ -0,0 +1,157 @@
+from flask import request, jsonify
+from sqlalchemy import select, update
+from sqlalchemy.exc import IntegrityError
+
+import rollups
+from models import db
+from auth import current_customer_id, is_admin, can_access, forbidden
+
+# PATCH endpoints: partial updates with optimistic concurrency.
+#
+# The body holds only the columns to change. Each one must be in the endpoint's
+# whitelist and is parsed by its converter, then the change is written with one
+# column-targeted UPDATE ... WHERE pk, without loading the row. Rows that feed
+# the rollups are the exception: when a patch touches a rollup input, those
+# columns are read (and locked) first so the totals stay exact.
+#
+# The row's RowVersion is its version: responses return it as the ETag, and a
+# request sent with If-Match: "<RowVersion>" only applies if the row has not
+# changed since, otherwise it gets 412 and the current version. Without
+# If-Match the patch applies unconditionally, but still only to the columns sent.
+# The ETag of GET /medications/<id>, "<catalog epoch>.<RowVersion>", is accepted
+# as well, so a client can echo back whatever ETag it read the row with.
+
+
+def text(value):
+    if not isinstance(value, str) or not value.strip():
+        raise ValueError('must be a non-empty string')
+    return value
+
+
+def optional_text(value):
+    if value is not None and not isinstance(value, str):
+        raise ValueError('must be a string or null')
+    return value
+
+
+def count(value):
+    if not isinstance(value, int) or isinstance(value, bool) or value < 0:
+        raise ValueError('must be a whole number, zero or more')
+    return value
+
+
+def positive_count(value):
+    if count(value) == 0:
+        raise ValueError('must be a positive whole number')
+    return value
+
+
+def if_match_versions():
+    # The versions If-Match accepts, or None when any version will do
+    if not request.if_match or request.if_match.star_tag:
+        return None
+    versions = (tag.rpartition('.')[2] for tag in request.if_match.as_set())
+    return [int(version) for version in versions if version.isdigit()]
+
+
+class PartialUpdate:
+    def __init__(self, model, name, fields, owner=None, returning=(), on_update=None, after_commit=None):
+        self.model = model
+        # 'Medication' in messages
+        self.name = name
+        # field name -> converter for the JSON value
+        self.fields = fields
+        self.pk = model.__mapper__.primary_key[0]
+        # Column (or correlated subquery) holding the customer a row belongs to;
+        # customers may only patch their own rows. None: no ownership check.
+        self.owner = owner
+        # Extra columns for on_update, read back from the UPDATE
+        self.returning = (model.RowVersion,) + tuple(returning)
+        # on_update(key, values, row) runs in the transaction, after_commit(key, values) after it
+        self.on_update = on_update
+        self.after_commit = after_commit
+
+    def parse(self, data):
+        unknown = set(data) - set(self.fields)
+        if unknown:
+            raise LookupError(sorted(unknown))
+        values = {}
+        for name, value in data.items():
+            try:
+                values[name] = self.fields[name](value)
+            except (TypeError, ValueError) as error:
+                raise ValueError(f'{name}: {error}')
+        return values
+
+    def apply(self, key):
+        # The PATCH handler: the response for updating row `key` from the request
+        data = request.get_json(silent=True)
+        if not isinstance(data, dict) or not data:
+            return jsonify({'error': 'Send a JSON object with the fields to change'}), 400
+        try:
+            values = self.parse(data)
+        except LookupError:
+            return jsonify({'error': 'Unknown field', 'allowed_fields': list(self.fields)}), 400
+        except ValueError as error:
+            return jsonify({'error': str(error)}), 400
+
+        condition = [self.pk == key]
+        versions = if_match_versions()
+        if versions is not None:
+            condition.append(self.model.RowVersion.in_(versions))
+        if self.owner is not None and not is_admin():
+            condition.append(self.owner == current_customer_id())
+
+        inputs = rollups.INPUTS.get(self.model, ())
+        old = None
+        if set(values) & set(inputs):
+            old = db.session.execute(
+                select(*(getattr(self.model, name) for name in inputs)).where(*condition).with_for_update()
+            ).first()
+            if old is None:
+                return self.refused(key)
+
+        try:
+            row = self.update(key, condition, values)
+        except IntegrityError:
+            db.session.rollback()
+            return jsonify({'error': f'{self.name} conflicts with an existing one'}), 409
+        if row is None:
+            return self.refused(key)
+
+        if old is not None:
+            old = old._asdict()
+            rollups.record_update(self.model, old, dict(old, **{k: v for k, v in values.items() if k in old}))
+        if self.on_update is not None:
+            self.on_update(key, values, row)
+        db.session.commit()
+        if self.after_commit is not None:
+            self.after_commit(key, values)
+
+        response = jsonify({
+            'message': f'{self.name} updated successfully', self.pk.key: key, 'RowVersion': row.RowVersion,
+        })
+        response.set_etag(str(row.RowVersion))
+        return response
+
+    def update(self, key, condition, values):
+        # The UPDATE's `returning` row, None if no row matched
+        stmt = update(self.model).where(*condition).values(values)
+        if db.session.get_bind().dialect.update_returning:
+            return db.session.execute(stmt.returning(*self.returning)).first()
+        if db.session.execute(stmt).rowcount != 1:
+            return None
+        return db.session.execute(select(*self.returning).where(self.pk == key)).first()
+
+    def refused(self, key):
+        # Nothing matched: missing, someone else's, or changed since If-Match
+        db.session.rollback()
+        columns = [self.model.RowVersion] if self.owner is None else [self.model.RowVersion, self.owner]
+        row = db.session.execute(select(*columns).where(self.pk == key)).first()
+        if row is None:
+            return jsonify({'error': f'{self.name} not found'}), 404
+        if self.owner is not None and not can_access(row[1]):
+            return forbidden()
+        response = jsonify({'error': f'{self.name} has changed since it was read', 'RowVersion': row[0]})
+        response.set_etag(str(row[0]))
+        return response, 412
@@ -0,0 +1,238 @@
+import logging
+import queue
+import threading
+import time
+
+from sqlalchemy import select, event, inspect
+
+from models import db, Medication, Orders
+from serializers import dumps, loads
+
+# Push notifications for stock levels and order status (GET /events).
+#
+# Writes note which medications and orders they touched: ORM changes are picked
+# up at flush, Core UPDATEs report themselves with stock_changed() and
+# order_changed(). Just before the transaction commits the current values are
+# read back, and once it has committed they are published, so subscribers never
+# hear about rolled-back work and several changes to one row in a transaction
+# arrive as one event carrying the final value.
+#
+# Events fan out to every subscriber in the process. The backend is pluggable:
+# MemoryBackend only reaches subscribers in the publishing process, which is
+# enough when the web workers also run the job queue (JOBS_IN_PROCESS_WORKER);
+# RedisBackend relays events through Redis pub/sub, so changes made by any
+# worker, including `flask jobs work`, reach every open stream.
+
+logger = logging.getLogger(__name__)
+
+STOCK = 'stock'
+ORDER_STATUS = 'order_status'
+
+
+class Subscription:
+    def __init__(self, backend, accepts, size):
+        self.backend = backend
+        self.accepts = accepts
+        self.queue = queue.Queue(size)
+        # Set when events had to be dropped because the client fell behind
+        self.overflowed = False
+
+    def put(self, notification):
+        if not self.accepts(notification):
+            return
+        try:
+            self.queue.put_nowait(notification)
+        except queue.Full:
+            self.overflowed = True
+
+    def get(self, timeout):
+        # The next event, or None if there was none within timeout seconds
+        try:
+            return self.queue.get(timeout=timeout)
+        except queue.Empty:
+            return None
+
+    def close(self):
+        self.backend.unsubscribe(self)
+
+
+class MemoryBackend:
+    def __init__(self):
+        self._subscriptions = set()
+        self._lock = threading.Lock()
+
+    def subscribe(self, accepts, size):
+        subscription = Subscription(self, accepts, size)
+        with self._lock:
+            self._subscriptions.add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription):
+        with self._lock:
+            self._subscriptions.discard(subscription)
+
+    def subscribers(self):
+        return len(self._subscriptions)
+
+    def publish(self, events):
+        self.dispatch(events)
+
+    def dispatch(self, events):
+        with self._lock:
+            subscriptions = list(self._subscriptions)
+        for subscription in subscriptions:
+            for notification in events:
+                subscription.put(notification)
+
+
+class RedisBackend(MemoryBackend):
+    CHANNEL = 'push:events'
+
+    def __init__(self, url):
+        super().__init__()
+        try:
+            import redis
+        except ImportError:
+            raise RuntimeError('PUSH_BACKEND_URL points at Redis but the redis package is not installed')
+        self._client = redis.Redis.from_url(url)
+        self._listener = None
+
+    def subscribe(self, accepts, size):
+        # One listener thread per process relays the channel to local subscribers
+        with self._lock:
+            if self._listener is None:
+                self._listener = threading.Thread(target=self._listen, name='push-listener', daemon=True)
+                self._listener.start()
+        return super().subscribe(accepts, size)
+
+    def publish(self, events):
+        self._client.publish(self.CHANNEL, dumps(events))
+
+    def _listen(self):
+        while True:
+            try:
+                pubsub = self._client.pubsub(ignore_subscribe_messages=True)
+                pubsub.subscribe(self.CHANNEL)
+                for message in pubsub.listen():
+                    self.dispatch(loads(message['data']))
+            except Exception:
+                logger.exception('push listener lost its Redis connection, reconnecting')
+                time.sleep(1)
+
+
+class EventHub:
+    def __init__(self, app=None):
+        self.backend = None
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        app.config.setdefault('PUSH_BACKEND_URL', 'memory://')
+        # Events held for a client that is not reading; past that it is told to resync
+        app.config.setdefault('PUSH_QUEUE_SIZE', 100)
+        app.config.setdefault('PUSH_HEARTBEAT_SECONDS', 15)
+        # Streams end after this long and clients reconnect, picking up a fresh token
+        app.config.setdefault('PUSH_STREAM_SECONDS', 300)
+        # Every open stream holds a server thread
+        app.config.setdefault('PUSH_MAX_SUBSCRIBERS', 500)
+
+        url = app.config['PUSH_BACKEND_URL']
+        self.backend = RedisBackend(url) if url.startswith('redis') else MemoryBackend()
+        app.extensions['event_hub'] = self
+
+        if not event.contains(db.session, 'before_flush', collect_changes):
+            event.listen(db.session, 'before_flush', collect_changes)
+            event.listen(db.session, 'before_commit', read_changes)
+            event.listen(db.session, 'after_commit', publish_changes)
+            event.listen(db.session, 'after_soft_rollback', discard_changes)
+
+    def subscribe(self, accepts, size):
+        return self.backend.subscribe(accepts, size)
+
+    def subscribers(self):
+        return self.backend.subscribers() if self.backend is not None else 0
+
+    def publish(self, events):
+        if self.backend is None or not events:
+            return
+        try:
+            self.backend.publish(events)
+        except Exception:
+            # The write has committed; a lost notification only delays clients
+            # until their next sync
+            logger.exception('publishing %d push events failed', len(events))
+
+
+event_hub = EventHub()
+
+
+# Collecting changes
+
+def changed(session, key):
+    return session.info.setdefault(key, set())
+
+
+def stock_changed(medication_id):
+    # Call after a Core UPDATE of Medication.StockLevel
+    changed(db.session, 'push_medications').add(medication_id)
+
+
+def order_changed(order_id):
+    # Call after a Core UPDATE of Orders.Status
+    changed(db.session, 'push_orders').add(order_id)
+
+
+def collect_changes(session, flush_context, instances):
+    for obj in session.new:
+        if isinstance(obj, Orders):
+            session.info.setdefault('push_new_orders', []).append(obj)
+    for obj in session.dirty:
+        if isinstance(obj, Medication) and inspect(obj).attrs.StockLevel.history.has_changes():
+            changed(session, 'push_medications').add(obj.MedicationID)
+        elif isinstance(obj, Orders) and inspect(obj).attrs.Status.history.has_changes():
+            changed(session, 'push_orders').add(obj.OrderID)
+
+
+def read_changes(session):
+    if session.in_nested_transaction():
+        # Releasing a savepoint: the outer commit reads everything
+        return
+    session.flush()
+    medications = session.info.pop('push_medications', None)
+    orders = session.info.pop('push_orders', set())
+    # New orders only have their ids once flushed
+    orders.update(order.OrderID for order in session.info.pop('push_new_orders', ()))
+    events = []
+    if medications:
+        rows = session.execute(
+            select(Medication.MedicationID, Medication.StockLevel, Medication.RowVersion)
+            .where(Medication.MedicationID.in_(medications))
+        )
+        events += [
+            {'type': STOCK, 'MedicationID': row.MedicationID, 'StockLevel': row.StockLevel, 'version': row.RowVersion}
+            for row in rows
+        ]
+    if orders:
+        rows = session.execute(
+            select(Orders.OrderID, Orders.CustomerID, Orders.Status, Orders.RowVersion)
+            .where(Orders.OrderID.in_(orders))
+        )
+        events += [
+            {'type': ORDER_STATUS, 'OrderID': row.OrderID, 'CustomerID': row.CustomerID, 'Status': row.Status,
+             'version': row.RowVersion}
+            for row in rows
+        ]
+    if events:
+        session.info['push_events'] = events
+
+
+def publish_changes(session):
+    event_hub.publish(session.info.pop('push_events', None))
+
+
+def discard_changes(session, previous_transaction):
+    if previous_transaction.parent is not None:
+        # A savepoint rolled back; whatever it touched is read again at commit
+        return
+    for key in ('push_medications', 'push_orders', 'push_new_orders', 'push_events'):
+        session.info.pop(key, None)
@@ -0,0 +1,43 @@
+from contextlib import contextmanager
+
+from sqlalchemy import event
+
+# Count the SQL statements an engine executes inside a block, e.g.
+#
+#     with assert_max_queries(db.engine, 1):
+#         client.get('/cartitems/1')
+#
+# so an N+1 regression fails loudly instead of quietly slowing a page down.
+
+
+class QueryCounter:
+    def __init__(self):
+        self.statements = []
+
+    @property
+    def count(self):
+        return len(self.statements)
+
+    def _before_cursor_execute(self, conn, cursor, statement, parameters, context, executemany):
+        self.statements.append(statement)
+
+
+@contextmanager
+def count_queries(engine):
+    counter = QueryCounter()
+    event.listen(engine, 'before_cursor_execute', counter._before_cursor_execute)
+    try:
+        yield counter
+    finally:
+        event.remove(engine, 'before_cursor_execute', counter._before_cursor_execute)
+
+
+@contextmanager
+def assert_max_queries(engine, limit):
+    with count_queries(engine) as counter:
+        yield counter
+    if counter.count > limit:
+        raise AssertionError(
+            'Expected at most %d queries, %d were executed:\n%s'
+            % (limit, counter.count, '\n'.join(counter.statements))
+        )
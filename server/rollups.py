@@ -0,0 +1,310 @@
+from collections import defaultdict
+
+from sqlalchemy import select, insert, update, delete, event, func, inspect
+
+from models import db, Orders, OrderItems, Payments, DailyMedicationSales, CustomerBalance
+from money import to_money
+
+# Rollup maintenance. Every flush that touches orders, order items or payments
+# turns the change into signed deltas (the old row's contribution is subtracted,
+# the new row's added) and applies them with one upsert per rollup table, in the
+# same transaction as the change itself. Writes that bypass the ORM (executemany
+# INSERTs in checkout and bulk import) report their rows with record_inserts().
+#
+# An order item counts towards the day of its order, a payment towards the
+# customer of its order; rows whose order is gone count towards nothing, which
+# is also what rebuild() computes. Amounts are summed as exact Decimals, so an
+# up to date rollup matches a recomputation to the cent.
+
+
+class RollupDeltas:
+    def __init__(self):
+        self.sales = defaultdict(lambda: [0, to_money(0)])
+        self.balances = defaultdict(lambda: [to_money(0), to_money(0)])
+
+    def sale(self, order_state, medication_id, quantity, revenue, sign):
+        if order_state is not None:
+            totals = self.sales[(order_state[0], medication_id)]
+            totals[0] += sign * quantity
+            totals[1] += sign * to_money(revenue)
+
+    def ordered(self, customer_id, amount, sign):
+        self.balances[customer_id][0] += sign * to_money(amount)
+
+    def paid(self, order_state, amount, sign):
+        if order_state is not None:
+            self.balances[order_state[1]][1] += sign * to_money(amount)
+
+    def apply(self, session):
+        sales = [
+            {'SalesDate': day, 'MedicationID': medication_id, 'QuantitySold': quantity, 'Revenue': revenue}
+            for (day, medication_id), (quantity, revenue) in self.sales.items()
+            if quantity or revenue
+        ]
+        balances = [
+            {'CustomerID': customer_id, 'TotalOrdered': ordered, 'TotalPaid': paid}
+            for customer_id, (ordered, paid) in self.balances.items()
+            if ordered or paid
+        ]
+        if sales:
+            upsert_increment(session, DailyMedicationSales, ('SalesDate', 'MedicationID'), ('QuantitySold', 'Revenue'), sales)
+        if balances:
+            upsert_increment(session, CustomerBalance, ('CustomerID',), ('TotalOrdered', 'TotalPaid'), balances)
+
+
+def upsert_increment(session, model, keys, totals, rows):
+    table = model.__table__
+    dialect = session.connection().dialect.name
+    if dialect in ('sqlite', 'postgresql'):
+        if dialect == 'sqlite':
+            from sqlalchemy.dialects.sqlite import insert as dialect_insert
+        else:
+            from sqlalchemy.dialects.postgresql import insert as dialect_insert
+        stmt = dialect_insert(table)
+        stmt = stmt.on_conflict_do_update(
+            index_elements=list(keys),
+            set_={name: table.c[name] + stmt.excluded[name] for name in totals},
+        )
+        session.execute(stmt, rows)
+        return
+    # No native upsert: bump the existing row, create it when there is none
+    for row in rows:
+        condition = [table.c[name] == row[name] for name in keys]
+        result = session.execute(
+            update(table).where(*condition).values({name: table.c[name] + row[name] for name in totals})
+        )
+        if result.rowcount == 0:
+            session.execute(insert(table), [row])
+
+
+# ORM changes
+
+def old_value(session, obj, key):
+    history = inspect(obj).attrs[key].history
+    if history.deleted:
+        return history.deleted[0]
+    if history.added:
+        # Assigned while the attribute was expired: the row still holds the old value
+        state = inspect(obj)
+        column = state.mapper.columns[key]
+        pk = state.mapper.primary_key[0]
+        return session.execute(select(column).where(pk == state.identity[0])).scalar()
+    return getattr(obj, key)
+
+
+def order_state(session, order, old):
+    # (day, customer id) an order's lines and payments count towards
+    if order is None or (not old and order in session.deleted):
+        return None
+    if old:
+        return old_value(session, order, 'OrderDate').date(), old_value(session, order, 'CustomerID')
+    return order.OrderDate.date(), order.CustomerID
+
+
+def parent_order(session, obj, old):
+    order_id = old_value(session, obj, 'OrderID') if old else obj.OrderID
+    if order_id is None:
+        return obj.order
+    return session.get(Orders, order_id)
+
+
+def contribute(session, deltas, obj, old):
+    sign = -1 if old else 1
+    value = (lambda key: old_value(session, obj, key)) if old else (lambda key: getattr(obj, key))
+    if isinstance(obj, Orders):
+        deltas.ordered(value('CustomerID'), value('TotalAmount'), sign)
+    elif isinstance(obj, OrderItems):
+        state = order_state(session, parent_order(session, obj, old), old)
+        deltas.sale(state, value('MedicationID'), value('Quantity'), value('Subtotal'), sign)
+    elif isinstance(obj, Payments):
+        state = order_state(session, parent_order(session, obj, old), old)
+        deltas.paid(state, value('AmountPaid'), sign)
+
+
+def follow_order(session, deltas, order, flushed):
+    # Lines and payments not flushed themselves move with their order when its
+    # date or customer changes, and stop counting when it is deleted
+    deleted = order in session.deleted
+    attrs = inspect(order).attrs
+    if deleted or attrs.OrderDate.history.has_changes():
+        items = session.execute(
+            select(OrderItems.OrderItemID, OrderItems.MedicationID, OrderItems.Quantity, OrderItems.Subtotal)
+            .where(OrderItems.OrderID == order.OrderID)
+        )
+        for item in items:
+            if (OrderItems, item.OrderItemID) not in flushed:
+                deltas.sale(order_state(session, order, True), item.MedicationID, item.Quantity, item.Subtotal, -1)
+                deltas.sale(order_state(session, order, False), item.MedicationID, item.Quantity, item.Subtotal, 1)
+    if deleted or attrs.CustomerID.history.has_changes():
+        payments = session.execute(
+            select(Payments.PaymentID, Payments.AmountPaid).where(Payments.OrderID == order.OrderID)
+        )
+        for payment in payments:
+            if (Payments, payment.PaymentID) not in flushed:
+                deltas.paid(order_state(session, order, True), payment.AmountPaid, -1)
+                deltas.paid(order_state(session, order, False), payment.AmountPaid, 1)
+
+
+TRACKED = (Orders, OrderItems, Payments)
+
+
+def collect_deltas(session, flush_context, instances):
+    deltas = RollupDeltas()
+    dirty = [obj for obj in session.dirty if isinstance(obj, TRACKED) and session.is_modified(obj)]
+    deleted = [obj for obj in session.deleted if isinstance(obj, TRACKED)]
+    flushed = {(type(obj), inspect(obj).identity[0]) for obj in dirty + deleted}
+
+    for obj in session.new:
+        contribute(session, deltas, obj, old=False)
+    for obj in dirty:
+        contribute(session, deltas, obj, old=True)
+        contribute(session, deltas, obj, old=False)
+    for obj in deleted:
+        contribute(session, deltas, obj, old=True)
+    for obj in dirty + deleted:
+        if isinstance(obj, Orders):
+            follow_order(session, deltas, obj, flushed)
+    session.info['rollup_deltas'] = deltas
+
+
+def apply_deltas(session, flush_context):
+    deltas = session.info.pop('rollup_deltas', None)
+    if deltas is not None:
+        deltas.apply(session)
+
+
+def init_app(app):
+    if not event.contains(db.session, 'before_flush', collect_deltas):
+        event.listen(db.session, 'before_flush', collect_deltas)
+        event.listen(db.session, 'after_flush', apply_deltas)
+
+
+# Core INSERTs and UPDATEs
+
+# The columns of each table that rollups are computed from
+INPUTS = {
+    Orders: ('OrderID', 'CustomerID', 'OrderDate', 'TotalAmount'),
+    OrderItems: ('OrderID', 'MedicationID', 'Quantity', 'Subtotal'),
+    Payments: ('OrderID', 'AmountPaid'),
+}
+
+
+def add_rows(deltas, model, rows, sign):
+    if model is Orders:
+        for row in rows:
+            deltas.ordered(row['CustomerID'], row['TotalAmount'], sign)
+    elif model is OrderItems or model is Payments:
+        order_ids = {row['OrderID'] for row in rows}
+        states = {
+            order.OrderID: (order.OrderDate.date(), order.CustomerID)
+            for order in db.session.execute(
+                select(Orders.OrderID, Orders.OrderDate, Orders.CustomerID).where(Orders.OrderID.in_(order_ids))
+            )
+        }
+        for row in rows:
+            if model is OrderItems:
+                deltas.sale(states.get(row['OrderID']), row['MedicationID'], row['Quantity'], row['Subtotal'], sign)
+            else:
+                deltas.paid(states.get(row['OrderID']), row['AmountPaid'], sign)
+
+
+def record_inserts(model, rows):
+    if model not in INPUTS:
+        return
+    deltas = RollupDeltas()
+    add_rows(deltas, model, rows, 1)
+    deltas.apply(db.session)
+
+
+def record_update(model, old, new):
+    # One row changed by a Core UPDATE: `old` and `new` hold its INPUTS columns
+    # before and after
+    if model not in INPUTS:
+        return
+    deltas = RollupDeltas()
+    add_rows(deltas, model, [old], -1)
+    add_rows(deltas, model, [new], 1)
+    if model is Orders and old['OrderDate'] != new['OrderDate']:
+        # The order's lines move to its new day
+        items = db.session.execute(
+            select(OrderItems.MedicationID, OrderItems.Quantity, OrderItems.Subtotal)
+            .where(OrderItems.OrderID == old['OrderID'])
+        )
+        for item in items:
+            deltas.sale((old['OrderDate'].date(), old['CustomerID']), item.MedicationID, item.Quantity, item.Subtotal, -1)
+            deltas.sale((new['OrderDate'].date(), new['CustomerID']), item.MedicationID, item.Quantity, item.Subtotal, 1)
+    deltas.apply(db.session)
+
+
+# Rebuild and drift check
+
+def sales_source():
+    day = func.date(Orders.OrderDate, type_=db.Date)
+    return (
+        select(
+            day.label('SalesDate'),
+            OrderItems.MedicationID,
+            func.sum(OrderItems.Quantity).label('QuantitySold'),
+            func.sum(OrderItems.Subtotal).label('Revenue'),
+        )
+        .join(Orders, Orders.OrderID == OrderItems.OrderID)
+        .group_by(day, OrderItems.MedicationID)
+    )
+
+
+def balances_source():
+    ordered = (
+        select(Orders.CustomerID, func.sum(Orders.TotalAmount).label('TotalOrdered'))
+        .group_by(Orders.CustomerID)
+        .subquery()
+    )
+    paid = (
+        select(Orders.CustomerID, func.sum(Payments.AmountPaid).label('TotalPaid'))
+        .join(Payments, Payments.OrderID == Orders.OrderID)
+        .group_by(Orders.CustomerID)
+        .subquery()
+    )
+    customer_ids = select(ordered.c.CustomerID).union(select(paid.c.CustomerID)).subquery()
+    return (
+        select(
+            customer_ids.c.CustomerID,
+            func.coalesce(ordered.c.TotalOrdered, 0).label('TotalOrdered'),
+            func.coalesce(paid.c.TotalPaid, 0).label('TotalPaid'),
+        )
+        .outerjoin(ordered, ordered.c.CustomerID == customer_ids.c.CustomerID)
+        .outerjoin(paid, paid.c.CustomerID == customer_ids.c.CustomerID)
+    )
+
+
+ROLLUPS = (
+    (DailyMedicationSales, sales_source, ('SalesDate', 'MedicationID'), ('QuantitySold', 'Revenue')),
+    (CustomerBalance, balances_source, ('CustomerID',), ('TotalOrdered', 'TotalPaid')),
+)
+
+
+def rebuild():
+    for model, source, keys, totals in ROLLUPS:
+        db.session.execute(delete(model))
+        db.session.execute(insert(model).from_select(keys + totals, source()))
+    db.session.commit()
+
+
+def check():
+    # Rows where the rollup disagrees with a recomputation from the base tables
+    drift = []
+    for model, source, keys, totals in ROLLUPS:
+        columns = [getattr(model, name) for name in keys + totals]
+        stored = {tuple(row[:len(keys)]): row[len(keys):] for row in db.session.execute(select(*columns))}
+        expected = {tuple(row[:len(keys)]): row[len(keys):] for row in db.session.execute(source())}
+        zero = (0,) * len(totals)
+        for key in stored.keys() | expected.keys():
+            have = stored.get(key, zero)
+            want = expected.get(key, zero)
+            if tuple(have) != tuple(want):
+                drift.append({
+                    'table': model.__tablename__,
+                    'key': dict(zip(keys, key)),
+                    'stored': dict(zip(totals, have)),
+                    'expected': dict(zip(totals, want)),
+                })
+    return drift
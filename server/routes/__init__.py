@@ -0,0 +1,21 @@
+from routes import customers, medications, orders, order_items, payments, statements, cart, bulk, reports, sync, events, batch
+
+BLUEPRINTS = (
+    customers.bp,
+    medications.bp,
+    orders.bp,
+    order_items.bp,
+    payments.bp,
+    statements.bp,
+    cart.bp,
+    bulk.bp,
+    reports.bp,
+    sync.bp,
+    events.bp,
+    batch.bp,
+)
+
+
+def register_blueprints(app):
+    for blueprint in BLUEPRINTS:
+        app.register_blueprint(blueprint)
@@ -0,0 +1,23 @@
+from flask import Blueprint, request, jsonify
+
+import batch
+
+bp = Blueprint('batch', __name__)
+
+
+# Several API calls in one round trip:
+# {"requests": [{"method": "PATCH", "path": "/medications/3", "body": {...},
+#                "headers": {"If-Match": "\"42\""}}, ...], "atomic": false}
+# Sub-requests run in order with the batch's Authorization header unless they
+# send their own, and each gets its own status, headers and body back. With
+# "atomic": true their writes commit together or not at all.
+@bp.route('/batch', methods=['POST'])
+def run_batch():
+    try:
+        requests, atomic = batch.parse(request.get_json(silent=True))
+    except ValueError as error:
+        return jsonify({'error': str(error)}), 400
+    responses, committed = batch.run(requests, atomic)
+    if atomic:
+        return jsonify({'responses': responses, 'committed': committed})
+    return jsonify({'responses': responses})
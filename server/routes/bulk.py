@@ -0,0 +1,44 @@
+from flask import Blueprint, request, jsonify, Response, stream_with_context, current_app
+
+import bulk
+from models import Medication
+from cache import catalog_cache
+from auth import admin_required
+
+bp = Blueprint('bulk', __name__)
+
+
+# Bulk import: a JSON array, NDJSON or CSV body (or a multipart `file` upload).
+# Rows are inserted in batches of ?batch_size= and failures are reported per row.
+# Admins only, like the export.
+@bp.route('/bulk/<resource>', methods=['POST'])
+@admin_required
+def bulk_import(resource):
+    spec = bulk.RESOURCES.get(resource)
+    if spec is None:
+        return jsonify({'error': f'Unknown resource {resource}'}), 404
+
+    batch_size = request.args.get('batch_size', current_app.config['BULK_BATCH_SIZE'], type=int)
+    batch_size = max(1, min(batch_size, bulk.MAX_BATCH_SIZE))
+    try:
+        records = bulk.read_records(request)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+
+    result = bulk.import_records(spec, records, batch_size)
+    if spec.model is Medication and result['inserted']:
+        catalog_cache.invalidate()
+    return jsonify(result), 200
+
+# Bulk export as NDJSON (default) or CSV, streamed in primary key order. It
+# holds every customer's details, so only admins may read it.
+@bp.route('/bulk/<resource>', methods=['GET'])
+@admin_required
+def bulk_export(resource):
+    spec = bulk.RESOURCES.get(resource)
+    if spec is None:
+        return jsonify({'error': f'Unknown resource {resource}'}), 404
+
+    if request.args.get('format', 'ndjson') == 'csv':
+        return Response(stream_with_context(bulk.export_csv(spec)), mimetype='text/csv')
+    return Response(stream_with_context(bulk.export_ndjson(spec)), mimetype='application/x-ndjson')
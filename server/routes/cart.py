@@ -0,0 +1,201 @@
+from datetime import datetime
+
+from flask import Blueprint, request, jsonify
+from flask_jwt_extended import jwt_required
+from sqlalchemy import select, insert, delete, join, func
+from sqlalchemy.exc import IntegrityError
+
+import fulfilment
+import stock
+from models import db, Customer, Medication, Orders, OrderItems, CartItem, StockReservation
+from rollups import record_inserts
+from auth import current_customer_id, can_access, forbidden, owner_required
+from idempotency import idempotent
+
+bp = Blueprint('cart', __name__)
+
+
+def valid_quantity(quantity):
+    return isinstance(quantity, int) and not isinstance(quantity, bool) and quantity > 0
+
+
+@bp.route('/cart', methods=['POST'])
+@jwt_required()
+def add_to_cart():
+    data = request.json
+    # Defaults to the caller's own cart
+    customer_id = data.get('customer_id') or current_customer_id()
+    medication_id = data.get('medication_id')
+    quantity = data.get('quantity')
+
+    if not medication_id or not quantity:
+        return jsonify({'error': 'Customer ID, Medication ID, and quantity are required'}), 400
+    if not valid_quantity(quantity):
+        return jsonify({'error': 'Quantity must be a positive whole number'}), 400
+    if not can_access(customer_id):
+        return forbidden()
+    if db.session.get(Medication, medication_id) is None:
+        return jsonify({'error': 'Medication not found'}), 404
+
+    # Create a new cart item, (CustomerID, MedicationID) is unique so an item
+    # already in the cart fails the INSERT
+    new_cart_item = CartItem(CustomerID=customer_id, MedicationID=medication_id, Quantity=quantity)
+    db.session.add(new_cart_item)
+    try:
+        db.session.flush()
+    except IntegrityError:
+        db.session.rollback()
+        return jsonify({'error': 'Item already exists in the cart'}), 409
+
+    # Hold the stock until checkout or until the reservation expires
+    reserved_until = stock.reserve(new_cart_item.CartItemID, medication_id, quantity)
+    if reserved_until is None:
+        db.session.rollback()
+        return jsonify({'error': 'Insufficient quantity in stock'}), 409
+    db.session.commit()
+    return jsonify({
+        'message': 'Item added to cart successfully',
+        'CartItemID': new_cart_item.CartItemID,
+        'ReservedUntil': reserved_until.strftime('%Y-%m-%d %H:%M:%S'),
+    }), 201
+
+
+
+@bp.route('/cartitems/<int:user_id>', methods=['GET'])
+@owner_required('user_id')
+def get_cart_items(user_id):
+    # One round trip for the cart lines and their medications, with subtotals and
+    # the cart total computed by the database.
+    subtotal = CartItem.Quantity * Medication.PricePerUnit
+    cart_lines = join(CartItem, Medication, CartItem.MedicationID == Medication.MedicationID).outerjoin(
+        StockReservation, StockReservation.CartItemID == CartItem.CartItemID
+    )
+    stmt = select(
+        CartItem.CartItemID,
+        Medication.MedicationID,
+        Medication.Name,
+        CartItem.Quantity,
+        subtotal.label('Subtotal'),
+        StockReservation.ExpiresAt,
+        func.coalesce(func.sum(subtotal).over(), 0).label('CartTotal'),
+    ).order_by(CartItem.CartItemID)
+
+    own_cart = current_customer_id() == user_id
+    if own_cart:
+        # The token already proves the customer exists
+        stmt = stmt.select_from(cart_lines).where(CartItem.CustomerID == user_id)
+    else:
+        # Admin looking at someone else's cart: outer-join from the customer so an
+        # empty cart still returns one row and a missing customer none
+        stmt = (
+            stmt.select_from(Customer)
+            .outerjoin(cart_lines, CartItem.CustomerID == Customer.CustomerID)
+            .where(Customer.CustomerID == user_id)
+        )
+    rows = db.session.execute(stmt).all()
+
+    if not rows and not own_cart:
+        return jsonify({'error': 'User not found'}), 404
+
+    # Prepare the response data
+    items_data = []
+    for row in rows:
+        if row.CartItemID is None:
+            continue
+        items_data.append({
+            "CartItemID": row.CartItemID,
+            "MedicationID": row.MedicationID,
+            "MedicationName": row.Name,
+            "Quantity": row.Quantity,
+            "Subtotal": row.Subtotal,
+            # None once the reservation has expired and the stock was released
+            "ReservedUntil": row.ExpiresAt.strftime('%Y-%m-%d %H:%M:%S') if row.ExpiresAt else None,
+        })
+
+    return jsonify({'cart_items': items_data, 'total': rows[0].CartTotal if rows else 0}), 200
+
+
+
+
+
+# Route to turn a customer's cart into an order.
+# Pricing, stock decrements, the order and its items and clearing the cart all
+# happen in a single transaction, so either the whole order lands or nothing does.
+@bp.route('/checkout/<int:customer_id>', methods=['POST'])
+@owner_required('customer_id')
+@idempotent
+def checkout(customer_id):
+    lines = db.session.execute(
+        select(CartItem.CartItemID, CartItem.MedicationID, CartItem.Quantity, Medication.Name, Medication.PricePerUnit)
+        .join(Medication, CartItem.MedicationID == Medication.MedicationID)
+        .where(CartItem.CustomerID == customer_id)
+        # Lock medication rows in a stable order so concurrent checkouts can't deadlock
+        .order_by(CartItem.MedicationID)
+    ).all()
+
+    if not lines:
+        if db.session.get(Customer, customer_id) is None:
+            return jsonify({'error': 'Customer not found'}), 404
+        return jsonify({'error': 'Cart is empty'}), 400
+
+    # Lines still holding a reservation already have their stock; the others take
+    # it now with a guarded decrement, so two buyers racing for the last units
+    # can't both succeed
+    for line in lines:
+        if not stock.consume(line.CartItemID, line.MedicationID, line.Quantity):
+            db.session.rollback()
+            return jsonify({'error': f'Insufficient quantity of {line.Name} in stock'}), 409
+
+    order_items = [
+        {'MedicationID': line.MedicationID, 'Quantity': line.Quantity, 'Subtotal': line.Quantity * line.PricePerUnit}
+        for line in lines
+    ]
+    now = datetime.now()
+    order = Orders(
+        CustomerID=customer_id,
+        OrderDate=now,
+        Status=fulfilment.PLACED,
+        TotalAmount=sum(item['Subtotal'] for item in order_items),
+        # The reservations consumed above were the stock
+        StockCommittedAt=now,
+    )
+    db.session.add(order)
+    db.session.flush()
+
+    for item in order_items:
+        item['OrderID'] = order.OrderID
+    db.session.execute(insert(OrderItems), order_items)
+    record_inserts(OrderItems, order_items)
+    db.session.execute(delete(CartItem).where(CartItem.CustomerID == customer_id))
+    db.session.commit()
+
+    return jsonify({'message': 'Order placed successfully', 'OrderID': order.OrderID, 'TotalAmount': order.TotalAmount}), 201
+
+
+@bp.route('/cart/<int:cart_item_id>', methods=['PUT'])
+@jwt_required()
+def update_cart_item(cart_item_id):
+    cart_item = CartItem.query.get_or_404(cart_item_id)
+    if not can_access(cart_item.CustomerID):
+        return forbidden()
+    data = request.json
+    quantity = data.get('quantity')
+    if not valid_quantity(quantity):
+        return jsonify({'error': 'Quantity must be a positive whole number'}), 400
+    if stock.change_reservation(cart_item.CartItemID, cart_item.MedicationID, quantity) is None:
+        db.session.rollback()
+        return jsonify({'error': 'Insufficient quantity in stock'}), 409
+    cart_item.Quantity = quantity
+    db.session.commit()
+    return jsonify({'message': 'Cart item updated successfully'})
+
+@bp.route('/cart/<int:cart_item_id>', methods=['DELETE'])
+@jwt_required()
+def remove_from_cart(cart_item_id):
+    cart_item = CartItem.query.get_or_404(cart_item_id)
+    if not can_access(cart_item.CustomerID):
+        return forbidden()
+    stock.release(cart_item.CartItemID)
+    db.session.delete(cart_item)
+    db.session.commit()
+    return jsonify({'message': 'Item removed from cart successfully'})
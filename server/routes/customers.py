@@ -0,0 +1,136 @@
+import time
+
+from flask import Blueprint, request, jsonify, current_app
+from flask_jwt_extended import create_access_token, jwt_required, get_jwt
+from sqlalchemy.exc import IntegrityError
+
+from models import db, Customer
+from serializers import CUSTOMER
+from security import login_limiter
+from auth import token_claims, admin_required, owner_required, revocations
+
+bp = Blueprint('customers', __name__)
+
+
+@bp.route('/add_customer', methods=['POST'])
+def add_customer():
+    data = request.json
+
+ # Add the new customer to the database
+    new_customer = Customer(
+        FirstName=data['FirstName'],
+        LastName=data['LastName'],
+        Email=data['Email'],
+        Phone=data['Phone'],
+        Address=data.get('Address'),
+        Username=data['Username']
+    )
+    new_customer.set_password(data['Password'])
+    db.session.add(new_customer)
+    # Username and Email carry unique indexes, so a duplicate fails the INSERT itself
+    try:
+        db.session.commit()
+    except IntegrityError:
+        db.session.rollback()
+        return jsonify({'error': 'Customer with the same username or email already exists'}), 400
+    return jsonify({'message': 'Customer added successfully'}), 201
+
+
+@bp.route('/login', methods=['POST'])
+@login_limiter.limit
+def login():
+    data = request.json
+    username = data.get('username')
+    password = data.get('password')
+
+    if not username or not password:
+        return jsonify({'error': 'Username and password are required'}), 400
+
+    # Query the database for the user with the provided username
+    user = Customer.query.filter_by(Username=username).first()
+
+    # Check if the user exists and the provided password is correct
+    if user and user.check_password(password):
+        # Upgrade hashes made with older PASSWORD_HASH_METHOD parameters
+        if user.password_needs_rehash():
+            user.set_password(password)
+            db.session.commit()
+        # Generate JWT token carrying the customer id and role
+        claims = token_claims(user, current_app.config['ADMIN_USERNAMES'])
+        access_token = create_access_token(identity=str(user.CustomerID), additional_claims=claims)
+        return jsonify({'message': 'Login successful',  'access_token': access_token, 'email': user.Email, 'customer_id': user.CustomerID }), 200
+    else:
+        return jsonify({'error': 'Invalid username or password'}), 401
+
+
+def token_lifetime():
+    expires = current_app.config['JWT_ACCESS_TOKEN_EXPIRES']
+    # False means tokens never expire, remember the revocation for a year
+    return expires.total_seconds() if expires else 365 * 24 * 3600
+
+
+@bp.route('/logout', methods=['POST'])
+@jwt_required()
+def logout():
+    token = get_jwt()
+    revocations.revoke_token(token['jti'], token.get('exp') or time.time() + token_lifetime())
+    return jsonify({'message': 'Logged out successfully'}), 200
+
+
+@bp.route('/customers', methods=['GET'])
+@admin_required
+def get_customers():
+    rows = db.session.execute(CUSTOMER.select().order_by(Customer.CustomerID)).all()
+    return jsonify(CUSTOMER.encode_all(rows))
+
+@bp.route('/customer/<int:customer_id>', methods=['GET'])
+@owner_required('customer_id')
+def get_customer(customer_id):
+    row = db.session.execute(CUSTOMER.select().where(Customer.CustomerID == customer_id)).first()
+    if row is None:
+        return jsonify({'error': 'Customer not found'}), 404
+    return jsonify(CUSTOMER.encode(row))
+
+@bp.route('/customer/<int:customer_id>', methods=['DELETE'])
+@owner_required('customer_id')
+def delete_customer(customer_id):
+    customer = Customer.query.get(customer_id)
+    if not customer:
+        return jsonify({'error': 'Customer not found'}), 404
+    db.session.delete(customer)
+    db.session.commit()
+    revocations.revoke_customer(customer_id, token_lifetime())
+    return jsonify({'message': 'Customer deleted successfully'}), 200
+
+@bp.route('/customer/<int:customer_id>', methods=['PATCH'])
+@owner_required('customer_id')
+def update_customer(customer_id):
+    customer = Customer.query.get(customer_id)
+    if not customer:
+        return jsonify({'error': 'Customer not found'}), 404
+
+    data = request.json
+    if 'FirstName' in data:
+        customer.FirstName = data['FirstName']
+    if 'LastName' in data:
+        customer.LastName = data['LastName']
+    if 'Email' in data:
+        customer.Email = data['Email']
+    if 'Phone' in data:
+        customer.Phone = data['Phone']
+    if 'Address' in data:
+        customer.Address = data['Address']
+    if 'Username' in data:
+        customer.Username = data['Username']
+    if 'Password' in data:
+        customer.set_password(data['Password'])
+
+    try:
+        db.session.commit()
+    except IntegrityError:
+        db.session.rollback()
+        return jsonify({'error': 'Customer with the same username or email already exists'}), 400
+    # A new password signs out every session opened with the old one
+    if 'Password' in data:
+        revocations.revoke_customer(customer_id, token_lifetime())
+    return jsonify({'message': 'Customer updated successfully'}), 200
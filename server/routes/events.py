@@ -0,0 +1,93 @@
+import time
+
+from flask import Blueprint, Response, current_app, request, jsonify
+from flask_jwt_extended import get_jwt_identity, verify_jwt_in_request
+
+from models import db
+from push import event_hub, STOCK, ORDER_STATUS
+from serializers import dumps
+from auth import current_customer_id, is_admin
+
+bp = Blueprint('events', __name__)
+
+EVENT_TYPES = (STOCK, ORDER_STATUS)
+# How long EventSource clients wait before reconnecting
+RECONNECT_MILLISECONDS = 2000
+
+
+def parse_ids(value):
+    if not value:
+        return None
+    return {int(part) for part in value.split(',') if part.strip()}
+
+
+def event_filter(types, medication_ids, customer_id):
+    # customer_id None: every order (admins), 0: none (no token)
+    def accepts(event):
+        if event['type'] not in types:
+            return False
+        if event['type'] == STOCK:
+            return medication_ids is None or event['MedicationID'] in medication_ids
+        return customer_id is None or event['CustomerID'] == customer_id
+    return accepts
+
+
+def stream(subscription, heartbeat, lifetime):
+    # Runs after the request has returned, so it must not touch the database
+    deadline = time.monotonic() + lifetime
+    yield f'retry: {RECONNECT_MILLISECONDS}\n\n'
+    while True:
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            return
+        event = subscription.get(min(heartbeat, remaining))
+        if subscription.overflowed:
+            # Events were dropped: the client has to refresh from GET /sync
+            yield 'event: resync\ndata: {}\n\n'
+            return
+        if event is None:
+            yield ': keepalive\n\n'
+        else:
+            yield f'event: {event["type"]}\ndata: {dumps(event)}\n\n'
+
+
+# Server-sent events: `stock` (MedicationID, StockLevel) for every medication, or
+# those in ?medication_id=1,2,3, and `order_status` (OrderID, CustomerID, Status)
+# for the caller's own orders (admins: all orders, no token: none).
+# ?types=stock,order_status picks the kinds. Events carry the row's sync version.
+# A `resync` event means the client fell behind and should catch up through
+# GET /sync; streams close after PUSH_STREAM_SECONDS and clients reconnect.
+@bp.route('/events', methods=['GET'])
+def stream_events():
+    verify_jwt_in_request(optional=True)
+    if get_jwt_identity() is None:
+        customer_id = 0
+    else:
+        customer_id = None if is_admin() else current_customer_id()
+
+    types = set(request.args.get('types', ','.join(EVENT_TYPES)).split(','))
+    if not types <= set(EVENT_TYPES):
+        return jsonify({'error': 'Unknown event type', 'allowed_types': list(EVENT_TYPES)}), 400
+    try:
+        medication_ids = parse_ids(request.args.get('medication_id'))
+    except ValueError:
+        return jsonify({'error': 'medication_id must be a comma separated list of ids'}), 400
+
+    config = current_app.config
+    if event_hub.subscribers() >= config['PUSH_MAX_SUBSCRIBERS']:
+        response = jsonify({'error': 'Too many open event streams, try again later'})
+        response.headers['Retry-After'] = '30'
+        return response, 503
+
+    # Don't hold a database connection for the life of the stream
+    db.session.close()
+    subscription = event_hub.subscribe(event_filter(types, medication_ids, customer_id), config['PUSH_QUEUE_SIZE'])
+    response = Response(
+        stream(subscription, config['PUSH_HEARTBEAT_SECONDS'], config['PUSH_STREAM_SECONDS']),
+        mimetype='text/event-stream',
+        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'},
+    )
+    # The server closes the response however the stream ends, even when the
+    # client left before the generator started, when a finally in it never runs
+    response.call_on_close(subscription.close)
+    return response
@@ -0,0 +1,273 @@
+from flask import Blueprint, request, jsonify, Response, stream_with_context, current_app, abort
+from sqlalchemy import select, func
+from sqlalchemy.exc import IntegrityError
+
+import push
+import search
+import stock
+from models import db, Medication
+from pagination import EXPORT_BATCH_SIZE, page_size, keyset_select, iter_keyset, project_columns
+from cache import catalog_cache
+from money import parse_money
+from auth import admin_required
+from patching import PartialUpdate, text, optional_text, count
+from serializers import MEDICATION, RowEncoder
+
+bp = Blueprint('medications', __name__)
+
+
+# Route to create a new medication
+@bp.route('/medications', methods=['POST'])
+def create_medication():
+    data = request.get_json()
+    try:
+        price = parse_money(data.get('PricePerUnit'))
+    except ValueError as error:
+        return jsonify({'error': f'PricePerUnit: {error}'}), 400
+    new_medication = Medication(Name=data['Name'], Description=data['Description'], StockLevel=data['StockLevel'], PricePerUnit=price)
+    db.session.add(new_medication)
+    try:
+        db.session.flush()
+    except IntegrityError:
+        db.session.rollback()
+        return jsonify({'error': 'Medication already exists'}), 400
+    search.index([new_medication.MedicationID])
+    db.session.commit()
+    catalog_cache.invalidate()
+    return jsonify({'message': 'Medication created successfully'}), 201
+
+MEDICATION_FIELDS = ('MedicationID', 'Name', 'Description', 'StockLevel', 'PricePerUnit', 'RowVersion')
+# Every cart action moves StockLevel (and with it RowVersion), so cached catalog
+# bodies leave these out and each response reads them by primary key. Stock
+# changes therefore don't invalidate the catalog cache; only edits to the
+# cached fields and deletes do.
+LIVE_FIELDS = ('StockLevel', 'RowVersion')
+
+
+def stream_medications(columns):
+    # Full catalog export: emit the JSON document in keyset batches so memory
+    # stays flat no matter how large the formulary grows
+    encoder = RowEncoder(columns)
+    yield '{"medications": ['
+    first = True
+    for rows in iter_keyset(db.session, columns, Medication.MedicationID, EXPORT_BATCH_SIZE):
+        # One dumps() per batch, without the list's brackets
+        chunk = current_app.json.dumps(encoder.encode_all(rows))[1:-1]
+        yield chunk if first else ',' + chunk
+        first = False
+    yield ']}'
+
+
+def cached_catalog_response(name, columns, build, rows_of):
+    # Serve a catalog read from the cache, or build(columns) and cache its JSON
+    # body, then fill in the live fields of the medications rows_of(document)
+    # returns. The catalog epoch is the ETag, plus the newest RowVersion of the
+    # rows when they carry live fields, so an unchanged response answers 304.
+    epoch = catalog_cache.epoch()
+    live = [column for column in columns if column.key in LIVE_FIELDS]
+    if not live and request.if_none_match.contains(epoch):
+        return catalog_not_modified(epoch)
+    body = catalog_cache.get(name, epoch)
+    if body is None:
+        document = build([column for column in columns if column.key not in LIVE_FIELDS])
+        body = current_app.json.dumps(document)
+        catalog_cache.set(name, epoch, body)
+    elif live:
+        document = current_app.json.loads(body)
+
+    etag = epoch
+    if live:
+        rows = rows_of(document)
+        current = {
+            row.MedicationID: row
+            for row in db.session.execute(
+                select(Medication.MedicationID, Medication.RowVersion, *live)
+                .where(Medication.MedicationID.in_([row['MedicationID'] for row in rows]))
+            )
+        }
+        # A medication deleted since the body was cached is dropped
+        rows[:] = [row for row in rows if row['MedicationID'] in current]
+        for row in rows:
+            row.update((column.key, getattr(current[row['MedicationID']], column.key)) for column in live)
+        etag = f'{epoch}.{max((row.RowVersion for row in current.values()), default=0)}'
+        if request.if_none_match.contains(etag):
+            return catalog_not_modified(etag)
+        body = current_app.json.dumps(document)
+    response = Response(body, mimetype='application/json')
+    response.set_etag(etag)
+    return response
+
+
+def catalog_version(columns):
+    # ETag for a catalog read straight from the table
+    epoch = catalog_cache.epoch()
+    if not any(column.key in LIVE_FIELDS for column in columns):
+        return epoch
+    return f'{epoch}.{db.session.scalar(select(func.max(Medication.RowVersion))) or 0}'
+
+
+def catalog_not_modified(epoch):
+    response = Response(status=304)
+    response.set_etag(epoch)
+    return response
+
+
+# Route to retrieve all medications
+# ?limit=&after=<MedicationID> returns one keyset page, ?fields=Name,StockLevel
+# selects only those columns. Without limit/after the whole catalog is streamed.
+@bp.route('/medications', methods=['GET'])
+def get_medications():
+    columns = project_columns(Medication, MEDICATION_FIELDS, request.args.get('fields'), Medication.MedicationID)
+    if columns is None:
+        return jsonify({'error': 'Unknown field requested', 'allowed_fields': list(MEDICATION_FIELDS)}), 400
+
+    limit = request.args.get('limit', type=int)
+    after = request.args.get('after', type=int)
+    if limit is None and after is None:
+        # Full exports are too big to keep in the cache, but still honour If-None-Match
+        etag = catalog_version(columns)
+        if request.if_none_match.contains(etag):
+            return catalog_not_modified(etag)
+        response = Response(stream_with_context(stream_medications(columns)), mimetype='application/json')
+        response.set_etag(etag)
+        return response
+
+    limit = page_size(limit)
+
+    def build(columns):
+        rows = db.session.execute(keyset_select(columns, Medication.MedicationID, after, limit)).all()
+        next_after = rows[-1].MedicationID if len(rows) == limit else None
+        return {'medications': RowEncoder(columns).encode_all(rows), 'next_after': next_after}
+
+    fields = ','.join(column.key for column in columns)
+    return cached_catalog_response(
+        f'medications:{limit}:{after}:{fields}', columns, build, lambda document: document['medications']
+    )
+
+# Route to search the catalog by name and description, best matches first.
+# ?q= (the last word is completed as a prefix, so it serves type-ahead), ?limit=,
+# ?offset= and ?fields=. A query matching nothing is retried with the closest
+# known spellings, which are returned as `corrected`.
+@bp.route('/medications/search', methods=['GET'])
+def search_medications():
+    terms = search.query_terms(request.args.get('q', ''))
+    if not terms:
+        return jsonify({'error': 'Search query is required'}), 400
+    columns = project_columns(Medication, MEDICATION_FIELDS, request.args.get('fields'), Medication.MedicationID)
+    if columns is None:
+        return jsonify({'error': 'Unknown field requested', 'allowed_fields': list(MEDICATION_FIELDS)}), 400
+    limit = page_size(request.args.get('limit', type=int))
+    offset = max(0, request.args.get('offset', 0, type=int))
+
+    def build(columns):
+        rows, corrected = search.search(' '.join(terms), columns, limit, offset)
+        next_offset = offset + limit if len(rows) == limit else None
+        return {
+            'medications': RowEncoder(columns).encode_all(rows),
+            'corrected': [words[0] for words in corrected] if corrected else None,
+            'next_offset': next_offset,
+        }
+
+    fields = ','.join(column.key for column in columns)
+    return cached_catalog_response(
+        f'search:{limit}:{offset}:{fields}:{" ".join(terms)}', columns, build, lambda document: document['medications']
+    )
+
+# Route to retrieve a specific medication by its ID
+@bp.route('/medications/<int:medication_id>', methods=['GET'])
+def get_medication(medication_id):
+    def build(columns):
+        row = db.session.execute(select(*columns).where(Medication.MedicationID == medication_id)).first()
+        if row is None:
+            abort(404)
+        return RowEncoder(columns).encode(row)
+
+    def rows_of(document):
+        if not document:
+            # Deleted since it was cached
+            abort(404)
+        return [document]
+
+    return cached_catalog_response(f'medication:{medication_id}', MEDICATION.columns, build, rows_of)
+
+# Route to update a medication
+@bp.route('/medications/<int:medication_id>', methods=['PUT'])
+def update_medication(medication_id):
+    medication = Medication.query.get_or_404(medication_id)
+    data = request.get_json()
+    try:
+        price = parse_money(data.get('PricePerUnit'))
+    except ValueError as error:
+        return jsonify({'error': f'PricePerUnit: {error}'}), 400
+    medication.Name = data['Name']
+    medication.Description = data['Description']
+    # Optional: an absolute stock count. Deliveries and write-offs should go
+    # through POST /medications/<id>/stock so they don't overwrite concurrent sales.
+    if 'StockLevel' in data:
+        medication.StockLevel = data['StockLevel']
+    medication.PricePerUnit = price
+    try:
+        db.session.flush()
+    except IntegrityError:
+        db.session.rollback()
+        return jsonify({'error': 'Medication already exists'}), 400
+    search.index([medication_id])
+    db.session.commit()
+    catalog_cache.invalidate()
+    return jsonify({'message': 'Medication updated successfully'})
+
+def medication_patched(medication_id, values, row):
+    if 'Name' in values or 'Description' in values:
+        search.index([medication_id])
+    if 'StockLevel' in values:
+        push.stock_changed(medication_id)
+
+
+def medication_committed(medication_id, values):
+    # Stock is read live, so a stock-only change leaves the cached bodies valid
+    if set(values) - {'StockLevel'}:
+        catalog_cache.invalidate()
+
+
+MEDICATION_PATCH = PartialUpdate(
+    Medication, 'Medication',
+    {'Name': text, 'Description': optional_text, 'StockLevel': count, 'PricePerUnit': parse_money},
+    on_update=medication_patched,
+    after_commit=medication_committed,
+)
+
+# Route to change some of a medication's fields, e.g. {"PricePerUnit": 12.5}.
+# With If-Match: "<RowVersion>" it only applies if the medication is unchanged
+# since that version (412 otherwise), so two edits of the stock count can't
+# silently overwrite each other.
+@bp.route('/medications/<int:medication_id>', methods=['PATCH'])
+@admin_required
+def patch_medication(medication_id):
+    return MEDICATION_PATCH.apply(medication_id)
+
+# Route to restock or write off a medication: {"Adjustment": 25} or {"Adjustment": -3}.
+# Applied as one relative UPDATE, so it composes with concurrent sales.
+@bp.route('/medications/<int:medication_id>/stock', methods=['POST'])
+@admin_required
+def adjust_medication_stock(medication_id):
+    adjustment = request.get_json().get('Adjustment')
+    if not isinstance(adjustment, int) or isinstance(adjustment, bool):
+        return jsonify({'error': 'Adjustment must be a whole number'}), 400
+    stock_level = stock.adjust(medication_id, adjustment)
+    if stock_level is None:
+        db.session.rollback()
+        if db.session.get(Medication, medication_id) is None:
+            return jsonify({'error': 'Medication not found'}), 404
+        return jsonify({'error': 'Stock level cannot go below zero'}), 409
+    db.session.commit()
+    return jsonify({'MedicationID': medication_id, 'StockLevel': stock_level})
+
+# Route to delete a medication
+@bp.route('/medications/<int:medication_id>', methods=['DELETE'])
+def delete_medication(medication_id):
+    medication = Medication.query.get_or_404(medication_id)
+    db.session.delete(medication)
+    search.remove([medication_id])
+    db.session.commit()
+    catalog_cache.invalidate()
+    return jsonify({'message': 'Medication deleted successfully'})
@@ -0,0 +1,98 @@
+from flask import Blueprint, request, jsonify
+from flask_jwt_extended import jwt_required
+from sqlalchemy import select
+from sqlalchemy.exc import IntegrityError
+
+from models import db, Orders, OrderItems
+from serializers import ORDER_ITEM
+from auth import current_customer_id, is_admin, can_access, forbidden, order_owner
+from idempotency import idempotent
+from money import parse_money
+from patching import PartialUpdate, positive_count
+
+bp = Blueprint('order_items', __name__)
+
+
+# Create operation
+@bp.route('/order_items', methods=['POST'])
+@jwt_required()
+@idempotent
+def create_order_item():
+    data = request.json
+    if not can_access(order_owner(data['OrderID'])):
+        return forbidden()
+    try:
+        subtotal = parse_money(data.get('Subtotal'))
+    except ValueError as error:
+        return jsonify({'error': f'Subtotal: {error}'}), 400
+    new_order_item = OrderItems(
+        OrderID=data['OrderID'],
+        MedicationID=data['MedicationID'],
+        Quantity=data['Quantity'],
+        Subtotal=subtotal
+    )
+    db.session.add(new_order_item)
+    # (OrderID, MedicationID) is unique, a repeated line fails the INSERT
+    try:
+        db.session.commit()
+    except IntegrityError:
+        db.session.rollback()
+        return jsonify({'message': 'Order item already exists'}), 409  # 409 Conflict status code
+    return jsonify({'message': 'Order item created successfully'}), 201
+
+# Read operation (get all order items)
+@bp.route('/order_items', methods=['GET'])
+@jwt_required()
+def get_order_items():
+    stmt = ORDER_ITEM.select().order_by(OrderItems.OrderItemID)
+    if not is_admin():
+        stmt = stmt.join(Orders, Orders.OrderID == OrderItems.OrderID).where(Orders.CustomerID == current_customer_id())
+    rows = db.session.execute(stmt).all()
+    return jsonify({'order_items': ORDER_ITEM.encode_all(rows)})
+
+# Update operation
+@bp.route('/order_items/<int:id>', methods=['PUT'])
+@jwt_required()
+def update_order_item(id):
+    order_item = OrderItems.query.get(id)
+    if order_item:
+        data = request.json
+        if not can_access(order_owner(order_item.OrderID)) or not can_access(order_owner(data['OrderID'])):
+            return forbidden()
+        try:
+            subtotal = parse_money(data.get('Subtotal'))
+        except ValueError as error:
+            return jsonify({'error': f'Subtotal: {error}'}), 400
+        order_item.OrderID = data['OrderID']
+        order_item.MedicationID = data['MedicationID']
+        order_item.Quantity = data['Quantity']
+        order_item.Subtotal = subtotal
+        db.session.commit()
+        return jsonify({'message': 'Order item updated successfully'})
+    else:
+        return jsonify({'message': 'Order item not found'}), 404
+
+ORDER_ITEM_PATCH = PartialUpdate(
+    OrderItems, 'Order item', {'Quantity': positive_count, 'Subtotal': parse_money},
+    owner=select(Orders.CustomerID).where(Orders.OrderID == OrderItems.OrderID).scalar_subquery(),
+)
+
+# Partial update: {"Quantity": 3, "Subtotal": 7.5}, optionally guarded with If-Match: "<RowVersion>"
+@bp.route('/order_items/<int:id>', methods=['PATCH'])
+@jwt_required()
+def patch_order_item(id):
+    return ORDER_ITEM_PATCH.apply(id)
+
+# Delete operation
+@bp.route('/order_items/<int:id>', methods=['DELETE'])
+@jwt_required()
+def delete_order_item(id):
+    order_item = OrderItems.query.get(id)
+    if order_item:
+        if not can_access(order_owner(order_item.OrderID)):
+            return forbidden()
+        db.session.delete(order_item)
+        db.session.commit()
+        return jsonify({'message': 'Order item deleted successfully'})
+    else:
+        return jsonify({'message': 'Order item not found'}), 404
@@ -0,0 +1,215 @@
+from datetime import datetime
+
+from flask import Blueprint, request, jsonify
+from flask_jwt_extended import jwt_required
+
+import fulfilment
+from idempotency import idempotent
+from patching import PartialUpdate
+from models import db, Orders, OrderItems, Payments, Medication
+from money import parse_money
+from bulk import parse_datetime
+from serializers import ORDER, ORDER_ITEM, PAYMENT, RowEncoder
+from pagination import page_size, keyset_select
+from auth import current_customer_id, is_admin, can_access, forbidden
+
+bp = Blueprint('orders', __name__)
+
+
+# @bp.route('/order', methods=['POST'])
+# def order_medication():
+#     data = request.json
+#     medication_name = data.get('medication_name')
+#     quantity = data.get('quantity')
+#     customer_id = data.get('customer_id')
+
+#     if not medication_name or not quantity or not customer_id:
+#         return jsonify({'error': 'Medication name, quantity, and customer ID are required'}), 400
+
+#     # Check if medication is available in stock
+#     medication = Medication.query.filter_by(Name=medication_name).first()
+#     if not medication:
+#         return jsonify({'error': f'Medication {medication_name} not found'}), 404
+
+#     if medication.StockLevel < quantity:
+#         return jsonify({'error': f'Insufficient quantity of {medication_name} in stock'}), 400
+
+#     # Retrieve customer details
+#     customer = Customer.query.get(customer_id)
+#     if not customer:
+#         return jsonify({'error': f'Customer with ID {customer_id} not found'}), 404
+
+#     # Create a new order
+#     order = Orders(CustomerID=customer_id, OrderDate=datetime.now(), Status='Pending', TotalAmount=0.0)
+#     db.session.add(order)
+#     db.session.commit()
+
+#     # Create order item
+#     order_item = OrderItems(OrderID=order.OrderID, MedicationID=medication.MedicationID, Quantity=quantity, Subtotal=quantity * medication.PricePerUnit)
+#     db.session.add(order_item)
+#     db.session.commit()
+
+#     # Update total amount in order
+#     order.TotalAmount = order_item.Subtotal
+#     db.session.commit()
+
+#     # Update stock level
+#     medication.StockLevel -= quantity
+#     db.session.commit()
+
+#     return jsonify({'message': 'Order successful'}), 200
+
+ORDER_EXPANSIONS = ('items', 'payments')
+
+# What a client may change on an order, with the parser for each. The status is
+# not among them: orders move through fulfilment.STATUSES in the job queue.
+ORDER_UPDATE_FIELDS = {'OrderDate': parse_datetime, 'TotalAmount': parse_money}
+
+
+# Order lines carry their medication's name
+ORDER_ITEM_WITH_NAME = RowEncoder(ORDER_ITEM.columns + [Medication.Name.label('MedicationName')])
+
+
+def expansions(order_ids, expand):
+    # {name: {OrderID: [rows]}} for the requested expansions, one query each
+    found = {}
+    if 'items' in expand:
+        rows = db.session.execute(
+            ORDER_ITEM_WITH_NAME.select()
+            .outerjoin(Medication, Medication.MedicationID == OrderItems.MedicationID)
+            .where(OrderItems.OrderID.in_(order_ids))
+            .order_by(OrderItems.OrderItemID)
+        ).all()
+        found['items'] = group_by_order(ORDER_ITEM_WITH_NAME.encode_all(rows))
+    if 'payments' in expand:
+        rows = db.session.execute(
+            PAYMENT.select().where(Payments.OrderID.in_(order_ids)).order_by(Payments.PaymentID)
+        ).all()
+        found['payments'] = group_by_order(PAYMENT.encode_all(rows))
+    return found
+
+
+def group_by_order(rows):
+    grouped = {}
+    for row in rows:
+        grouped.setdefault(row['OrderID'], []).append(row)
+    return grouped
+
+
+def parse_date_arg(value):
+    for fmt in ('%Y-%m-%dT%H:%M:%S', '%Y-%m-%d'):
+        try:
+            return datetime.strptime(value, fmt)
+        except ValueError:
+            pass
+    return None
+
+
+# Route to retrieve order history, newest first.
+# Filters: ?customer_id=, ?status=, ?from= and ?to= (YYYY-MM-DD or YYYY-MM-DDTHH:MM:SS).
+# Paging: ?limit= and ?before=<OrderID>. ?expand=items,payments eager-loads the
+# order lines (with their medication's name) and payments in one extra query each.
+@bp.route('/orders', methods=['GET'])
+@jwt_required()
+def get_orders():
+    expand = [name for name in request.args.get('expand', '').split(',') if name]
+    if any(name not in ORDER_EXPANSIONS for name in expand):
+        return jsonify({'error': 'Unknown expansion', 'allowed_expansions': list(ORDER_EXPANSIONS)}), 400
+
+    limit = page_size(request.args.get('limit', type=int))
+    stmt = keyset_select(ORDER.columns, Orders.OrderID, request.args.get('before', type=int), limit, descending=True)
+
+    customer_id = request.args.get('customer_id', type=int)
+    # Customers only ever see their own orders
+    if not is_admin():
+        customer_id = current_customer_id()
+    if customer_id is not None:
+        stmt = stmt.where(Orders.CustomerID == customer_id)
+    if request.args.get('status'):
+        stmt = stmt.where(Orders.Status == request.args['status'])
+    if request.args.get('from'):
+        date_from = parse_date_arg(request.args['from'])
+        if date_from is None:
+            return jsonify({'error': 'Invalid from date'}), 400
+        stmt = stmt.where(Orders.OrderDate >= date_from)
+    if request.args.get('to'):
+        date_to = parse_date_arg(request.args['to'])
+        if date_to is None:
+            return jsonify({'error': 'Invalid to date'}), 400
+        stmt = stmt.where(Orders.OrderDate <= date_to)
+
+    orders = ORDER.encode_all(db.session.execute(stmt).all())
+    if expand and orders:
+        found = expansions([order['OrderID'] for order in orders], expand)
+        for order in orders:
+            for name, grouped in found.items():
+                order[name] = grouped.get(order['OrderID'], [])
+    next_before = orders[-1]['OrderID'] if len(orders) == limit else None
+    return jsonify({'orders': orders, 'next_before': next_before})
+
+@bp.route('/orders', methods=['POST'])
+@jwt_required()
+@idempotent
+def create_order():
+    data = request.json
+    customer_id = data.get('CustomerID') or current_customer_id()
+    if not can_access(customer_id):
+        return forbidden()
+    try:
+        total_amount = parse_money(data.get('TotalAmount'))
+    except ValueError as error:
+        return jsonify({'error': f'TotalAmount: {error}'}), 400
+    order_date_str = data.get('OrderDate')
+    
+    # Parse order_date_str into a datetime object
+    order_date = datetime.strptime(order_date_str, '%Y-%m-%dT%H:%M:%S')
+
+    # Repeat orders are legitimate; clients retrying a lost response send an
+    # Idempotency-Key instead
+    new_order = Orders(CustomerID=customer_id, OrderDate=order_date, Status=fulfilment.PLACED, TotalAmount=total_amount)
+    db.session.add(new_order)
+    db.session.commit()
+    return jsonify({'message': 'Order placed successfully', 'OrderID': new_order.OrderID}), 201
+
+@bp.route('/orders/<int:id>', methods=['PUT'])
+@jwt_required()
+def update_order(id):
+    order = Orders.query.get_or_404(id)
+    if not can_access(order.CustomerID):
+        return forbidden()
+    data = dict(request.json or {})
+    if data.pop('Status', order.Status) != order.Status:
+        return jsonify({'error': 'Order status is set by the fulfilment pipeline'}), 409
+    unknown = set(data) - set(ORDER_UPDATE_FIELDS)
+    if unknown:
+        return jsonify({'error': 'Unknown field', 'allowed_fields': list(ORDER_UPDATE_FIELDS)}), 400
+    values = {}
+    for key, value in data.items():
+        try:
+            values[key] = ORDER_UPDATE_FIELDS[key](value)
+        except (TypeError, ValueError) as error:
+            return jsonify({'error': f'{key}: {error}'}), 400
+    for key, value in values.items():
+        setattr(order, key, value)
+    db.session.commit()
+    return jsonify({'message': 'Order updated successfully'})
+
+ORDER_PATCH = PartialUpdate(Orders, 'Order', ORDER_UPDATE_FIELDS, owner=Orders.CustomerID)
+
+# Partial update of ORDER_UPDATE_FIELDS, optionally guarded with If-Match: "<RowVersion>"
+@bp.route('/orders/<int:id>', methods=['PATCH'])
+@jwt_required()
+def patch_order(id):
+    if 'Status' in (request.get_json(silent=True) or {}):
+        return jsonify({'error': 'Order status is set by the fulfilment pipeline'}), 409
+    return ORDER_PATCH.apply(id)
+
+@bp.route('/orders/<int:id>', methods=['DELETE'])
+@jwt_required()
+def delete_order(id):
+    order = Orders.query.get_or_404(id)
+    if not can_access(order.CustomerID):
+        return forbidden()
+    db.session.delete(order)
+    db.session.commit()
+    return jsonify({'message': 'Order deleted successfully'})
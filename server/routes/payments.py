@@ -0,0 +1,106 @@
+from datetime import datetime
+
+from flask import Blueprint, request, jsonify
+from flask_jwt_extended import jwt_required
+
+import fulfilment
+from idempotency import idempotent
+from bulk import parse_datetime
+from money import parse_money
+from patching import PartialUpdate, text
+from models import db, Orders, Payments
+from serializers import PAYMENT
+from auth import current_customer_id, is_admin, admin_required
+
+bp = Blueprint('payments', __name__)
+
+
+# Create operation. Recorded payments confirm and fulfil orders, so only
+# admins (the till, or whoever reconciles M-Pesa) may write them.
+@bp.route('/payments', methods=['POST'])
+@admin_required
+@idempotent
+def create_payment():
+    data = request.json
+    order_id = data['OrderID']
+    payment_date = datetime.strptime(data['PaymentDate'], '%Y-%m-%dT%H:%M:%S')
+    try:
+        amount_paid = parse_money(data.get('AmountPaid'))
+    except ValueError as error:
+        return jsonify({'error': f'AmountPaid: {error}'}), 400
+    payment_method = data['PaymentMethod']
+
+    # Retries are recognised by their Idempotency-Key, not by matching the fields
+    new_payment = Payments(
+        OrderID=order_id,
+        PaymentDate=payment_date,
+        AmountPaid=amount_paid,
+        PaymentMethod=payment_method
+    )
+    db.session.add(new_payment)
+    db.session.flush()
+    # Confirming the order (and fulfilling it) happens in a worker
+    fulfilment.payment_recorded(order_id, new_payment.PaymentID)
+    db.session.commit()
+    return jsonify({'message': 'Payment created successfully', 'PaymentID': new_payment.PaymentID}), 201
+
+# Read operation (get all payments)
+@bp.route('/payments', methods=['GET'])
+@jwt_required()
+def get_payments():
+    stmt = PAYMENT.select().order_by(Payments.PaymentID)
+    if not is_admin():
+        stmt = stmt.join(Orders, Orders.OrderID == Payments.OrderID).where(Orders.CustomerID == current_customer_id())
+    rows = db.session.execute(stmt).all()
+    return jsonify({'payments': PAYMENT.encode_all(rows)})
+
+# Update operation
+@bp.route('/payments/<int:id>', methods=['PUT'])
+@admin_required
+def update_payment(id):
+    payment = Payments.query.get(id)
+    if payment:
+        data = request.json
+        try:
+            amount_paid = parse_money(data.get('AmountPaid'))
+        except ValueError as error:
+            return jsonify({'error': f'AmountPaid: {error}'}), 400
+        payment.OrderID = data['OrderID']
+        payment.PaymentDate = datetime.strptime(data['PaymentDate'], '%Y-%m-%d %H:%M:%S')
+        payment.AmountPaid = amount_paid
+        payment.PaymentMethod = data['PaymentMethod']
+        fulfilment.payment_recorded(payment.OrderID)
+        db.session.commit()
+        return jsonify({'message': 'Payment updated successfully'})
+    else:
+        return jsonify({'message': 'Payment not found'}), 404
+
+def payment_patched(payment_id, values, row):
+    if 'AmountPaid' in values:
+        fulfilment.payment_recorded(row.OrderID)
+
+
+PAYMENT_PATCH = PartialUpdate(
+    Payments, 'Payment',
+    {'PaymentDate': parse_datetime, 'AmountPaid': parse_money, 'PaymentMethod': text},
+    returning=(Payments.OrderID,),
+    on_update=payment_patched,
+)
+
+# Partial update, optionally guarded with If-Match: "<RowVersion>"
+@bp.route('/payments/<int:id>', methods=['PATCH'])
+@admin_required
+def patch_payment(id):
+    return PAYMENT_PATCH.apply(id)
+
+# Delete operation
+@bp.route('/payments/<int:id>', methods=['DELETE'])
+@admin_required
+def delete_payment(id):
+    payment = Payments.query.get(id)
+    if payment:
+        db.session.delete(payment)
+        db.session.commit()
+        return jsonify({'message': 'Payment deleted successfully'})
+    else:
+        return jsonify({'message': 'Payment not found'}), 404
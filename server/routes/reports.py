@@ -0,0 +1,77 @@
+from datetime import date, timedelta
+
+from flask import Blueprint, request, jsonify
+from sqlalchemy import select, func
+
+from models import db, DailyMedicationSales, CustomerBalance
+from pagination import page_size
+from auth import admin_required
+from routes.orders import parse_date_arg
+
+bp = Blueprint('reports', __name__)
+
+SALES_GROUPINGS = ('day', 'medication')
+
+
+# Sales report read from the daily rollup: ?from= and ?to= (YYYY-MM-DD, default the
+# last 30 days), ?medication_id=, ?group_by=day|medication (default both).
+@bp.route('/reports/sales', methods=['GET'])
+@admin_required
+def get_sales_report():
+    date_to = parse_date_arg(request.args['to']) if request.args.get('to') else None
+    date_from = parse_date_arg(request.args['from']) if request.args.get('from') else None
+    if (request.args.get('to') and date_to is None) or (request.args.get('from') and date_from is None):
+        return jsonify({'error': 'Invalid date'}), 400
+    date_to = date_to.date() if date_to else date.today()
+    date_from = date_from.date() if date_from else date_to - timedelta(days=30)
+
+    group_by = request.args.get('group_by')
+    if group_by is not None and group_by not in SALES_GROUPINGS:
+        return jsonify({'error': 'Unknown grouping', 'allowed_groupings': list(SALES_GROUPINGS)}), 400
+    if group_by == 'day':
+        keys = [DailyMedicationSales.SalesDate]
+    elif group_by == 'medication':
+        keys = [DailyMedicationSales.MedicationID]
+    else:
+        keys = [DailyMedicationSales.SalesDate, DailyMedicationSales.MedicationID]
+
+    stmt = (
+        select(
+            *keys,
+            func.sum(DailyMedicationSales.QuantitySold).label('QuantitySold'),
+            func.sum(DailyMedicationSales.Revenue).label('Revenue'),
+        )
+        .where(DailyMedicationSales.SalesDate.between(date_from, date_to))
+        .group_by(*keys)
+        .order_by(*keys)
+    )
+    medication_id = request.args.get('medication_id', type=int)
+    if medication_id is not None:
+        stmt = stmt.where(DailyMedicationSales.MedicationID == medication_id)
+
+    rows = []
+    for row in db.session.execute(stmt):
+        values = dict(row._mapping)
+        if 'SalesDate' in values:
+            values['SalesDate'] = values['SalesDate'].isoformat()
+        rows.append(values)
+    return jsonify({
+        'from': date_from.isoformat(),
+        'to': date_to.isoformat(),
+        'sales': rows,
+        'QuantitySold': sum(row['QuantitySold'] for row in rows),
+        'Revenue': sum(row['Revenue'] for row in rows),
+    })
+
+# Customers with the largest outstanding balance, ?min_due= and ?limit=
+@bp.route('/reports/balances', methods=['GET'])
+@admin_required
+def get_balances_report():
+    amount_due = (CustomerBalance.TotalOrdered - CustomerBalance.TotalPaid).label('AmountDue')
+    stmt = (
+        select(CustomerBalance.CustomerID, CustomerBalance.TotalOrdered, CustomerBalance.TotalPaid, amount_due)
+        .where(amount_due > request.args.get('min_due', 0, type=float))
+        .order_by(amount_due.desc(), CustomerBalance.CustomerID)
+        .limit(page_size(request.args.get('limit', type=int)))
+    )
+    return jsonify({'balances': [dict(row._mapping) for row in db.session.execute(stmt)]})
@@ -0,0 +1,117 @@
+from datetime import datetime
+
+from flask import Blueprint, request, jsonify
+from flask_jwt_extended import jwt_required
+
+from models import db, Statements
+from serializers import STATEMENT
+from auth import current_customer_id, is_admin, can_access, forbidden, owner_required
+from idempotency import idempotent
+from bulk import parse_datetime
+from patching import PartialUpdate, text
+from billing import customer_balance, payment_status
+
+bp = Blueprint('statements', __name__)
+
+
+# Route to get a customer's outstanding balance, computed from their orders and payments
+@bp.route('/customer/<int:customer_id>/balance', methods=['GET'])
+@owner_required('customer_id')
+def get_customer_balance(customer_id):
+    balance = customer_balance(customer_id)
+    if balance is None:
+        return jsonify({'error': 'Customer not found'}), 404
+    return jsonify({
+        'CustomerID': balance.CustomerID,
+        'TotalOrdered': balance.TotalOrdered,
+        'TotalPaid': balance.TotalPaid,
+        'AmountDue': balance.AmountDue
+    })
+
+@bp.route('/statements', methods=['POST'])
+@jwt_required()
+@idempotent
+def create_statement():
+    data = request.json
+    customer_id = data['CustomerID']
+    if not can_access(customer_id):
+        return forbidden()
+    if data.get('StatementDate'):
+        statement_date = datetime.strptime(data['StatementDate'], '%Y-%m-%dT%H:%M:%S')
+    else:
+        statement_date = datetime.now()
+
+    # The amount due and status are computed server-side, any client-supplied
+    # AmountDue or PaymentStatus is ignored
+    balance = customer_balance(customer_id)
+    if balance is None:
+        return jsonify({'error': 'Customer not found'}), 404
+    amount_due = balance.AmountDue
+
+    new_statement = Statements(
+        CustomerID=customer_id,
+        StatementDate=statement_date,
+        AmountDue=amount_due,
+        PaymentStatus=payment_status(amount_due)
+    )
+    db.session.add(new_statement)
+    db.session.commit()
+    return jsonify({'message': 'Statement created successfully', 'StatementID': new_statement.StatementID, 'AmountDue': amount_due}), 201
+
+# Read operation (get all statements)
+@bp.route('/statements', methods=['GET'])
+@jwt_required()
+def get_statements():
+    stmt = STATEMENT.select().order_by(Statements.StatementID)
+    if not is_admin():
+        stmt = stmt.where(Statements.CustomerID == current_customer_id())
+    rows = db.session.execute(stmt).all()
+    return jsonify({'statements': STATEMENT.encode_all(rows)})
+
+# Update operation
+@bp.route('/statements/<int:id>', methods=['PUT'])
+@jwt_required()
+def update_statement(id):
+    statement = Statements.query.get(id)
+    if statement:
+        data = request.json
+        if not can_access(statement.CustomerID) or not can_access(data['CustomerID']):
+            return forbidden()
+        # Recomputed like create_statement, a client-supplied AmountDue or
+        # PaymentStatus is ignored
+        balance = customer_balance(data['CustomerID'])
+        if balance is None:
+            return jsonify({'error': 'Customer not found'}), 404
+        statement.CustomerID = data['CustomerID']
+        statement.StatementDate = datetime.strptime(data['StatementDate'], '%Y-%m-%dT%H:%M:%S')
+        statement.AmountDue = balance.AmountDue
+        statement.PaymentStatus = payment_status(balance.AmountDue)
+        db.session.commit()
+        return jsonify({'message': 'Statement updated successfully'})
+    else:
+        return jsonify({'message': 'Statement not found'}), 404
+
+# AmountDue is computed when the statement is written and can't be patched
+STATEMENT_PATCH = PartialUpdate(
+    Statements, 'Statement', {'StatementDate': parse_datetime, 'PaymentStatus': text}, owner=Statements.CustomerID,
+)
+
+# Partial update, optionally guarded with If-Match: "<RowVersion>"
+@bp.route('/statements/<int:id>', methods=['PATCH'])
+@jwt_required()
+def patch_statement(id):
+    return STATEMENT_PATCH.apply(id)
+
+# Delete operation
+@bp.route('/statements/<int:id>', methods=['DELETE'])
+@jwt_required()
+def delete_statement(id):
+    statement = Statements.query.get(id)
+    if statement:
+        if not can_access(statement.CustomerID):
+            return forbidden()
+        db.session.delete(statement)
+        db.session.commit()
+        return jsonify({'message': 'Statement deleted successfully'})
+    else:
+        return jsonify({'message': 'Statement not found'}), 404
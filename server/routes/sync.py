@@ -0,0 +1,40 @@
+from flask import Blueprint, request, jsonify
+from flask_jwt_extended import get_jwt_identity, verify_jwt_in_request
+
+import sync
+from pagination import page_size
+from auth import current_customer_id, is_admin
+
+bp = Blueprint('sync', __name__)
+
+
+# Changes since the client's last sync: ?since=<next_since of the previous
+# response> (omit it for a full download), ?limit=, ?tables=medications,orders.
+# Customers get the catalog plus their own rows, admins every row, and callers
+# without a token the catalog only. Keep calling while has_more is true.
+@bp.route('/sync', methods=['GET'])
+def get_changes():
+    verify_jwt_in_request(optional=True)
+    if get_jwt_identity() is None:
+        customer_id = None
+        allowed = [table for table in sync.TABLES if table.owner is None]
+    else:
+        customer_id = None if is_admin() else current_customer_id()
+        allowed = list(sync.TABLES)
+
+    tables = allowed
+    if request.args.get('tables'):
+        names = [name.strip() for name in request.args['tables'].split(',') if name.strip()]
+        tables = [table for table in allowed if table.name in names]
+        if len(tables) != len(set(names)):
+            return jsonify({'error': 'Unknown table', 'allowed_tables': [table.name for table in allowed]}), 400
+
+    try:
+        changes, next_since, has_more = sync.changes(
+            request.args.get('since'), page_size(request.args.get('limit', type=int)), customer_id, tables
+        )
+    except ValueError as error:
+        return jsonify({'error': str(error)}), 400
+    except sync.SyncTokenExpired:
+        return jsonify({'error': 'Sync token has expired, sync again without since'}), 410
+    return jsonify({'changes': changes, 'next_since': next_since, 'has_more': has_more})
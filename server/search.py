@@ -0,0 +1,188 @@
+import difflib
+import re
+import threading
+
+from sqlalchemy import DDL, select, insert, delete, event, func, or_, table, column, literal_column
+
+from models import db, Medication
+from cache import catalog_cache
+
+# Medication full-text search.
+#
+# SQLite: an FTS5 table medication_fts(Name, Description) whose rowid is the
+# MedicationID, kept in step by index()/remove() from the medication write paths.
+# PostgreSQL: a generated tsvector column medication.search_vector with a GIN
+# index, which the database keeps up to date by itself.
+#
+# The last query term is a prefix (type-ahead); when a query matches nothing,
+# each term is swapped for the closest words in the index vocabulary, so a
+# misspelt drug name still finds the drug.
+
+NAME_WEIGHT = 10.0
+DESCRIPTION_WEIGHT = 1.0
+MAX_CORRECTIONS = 3
+CORRECTION_CUTOFF = 0.75
+
+medication_fts = table('medication_fts', column('rowid'), column('Name'), column('Description'))
+
+SQLITE_DDL = (
+    "CREATE VIRTUAL TABLE IF NOT EXISTS medication_fts USING fts5("
+    "Name, Description, tokenize = 'unicode61 remove_diacritics 2')",
+    "CREATE VIRTUAL TABLE IF NOT EXISTS medication_fts_vocab USING fts5vocab('medication_fts', 'row')",
+)
+POSTGRESQL_DDL = (
+    'ALTER TABLE medication ADD COLUMN IF NOT EXISTS search_vector tsvector GENERATED ALWAYS AS ('
+    "setweight(to_tsvector('simple', coalesce(\"Name\", '')), 'A') || "
+    "setweight(to_tsvector('simple', coalesce(\"Description\", '')), 'B')) STORED",
+    'CREATE INDEX IF NOT EXISTS ix_medication_search_vector ON medication USING gin (search_vector)',
+)
+
+# db.create_all() and db.drop_all() build and drop the index with the medication table
+for statement in SQLITE_DDL:
+    event.listen(Medication.__table__, 'after_create', DDL(statement).execute_if(dialect='sqlite'))
+for name in ('medication_fts_vocab', 'medication_fts'):
+    event.listen(Medication.__table__, 'before_drop', DDL(f'DROP TABLE IF EXISTS {name}').execute_if(dialect='sqlite'))
+for statement in POSTGRESQL_DDL:
+    event.listen(Medication.__table__, 'after_create', DDL(statement).execute_if(dialect='postgresql'))
+
+
+def dialect():
+    return db.session.get_bind().dialect.name
+
+
+# Keeping the SQLite index in step. Call inside the transaction that wrote the
+# medications; on other databases these do nothing.
+
+def index(medication_ids=None, names=None):
+    # (Re)index medications by id or, for bulk inserts that don't return ids, by name
+    if dialect() != 'sqlite':
+        return
+    source = select(Medication.MedicationID, Medication.Name, Medication.Description)
+    if medication_ids is not None:
+        source = source.where(Medication.MedicationID.in_(medication_ids))
+        remove(medication_ids)
+    elif names is not None:
+        source = source.where(Medication.Name.in_(names))
+        remove(select(Medication.MedicationID).where(Medication.Name.in_(names)))
+    db.session.execute(insert(medication_fts).from_select(['rowid', 'Name', 'Description'], source))
+
+
+def remove(medication_ids):
+    if dialect() != 'sqlite':
+        return
+    db.session.execute(delete(medication_fts).where(medication_fts.c.rowid.in_(medication_ids)))
+
+
+def rebuild():
+    if dialect() != 'sqlite':
+        return
+    db.session.execute(delete(medication_fts))
+    index()
+    db.session.commit()
+
+
+# Queries
+
+def query_terms(q):
+    return re.findall(r'\w+', q.lower())
+
+
+def fts5_query(alternatives):
+    # [['amoxicillin'], ['caps', 'cap']] -> ("amoxicillin") AND ("caps"* OR "cap"*)
+    groups = []
+    for position, words in enumerate(alternatives):
+        suffix = '*' if position == len(alternatives) - 1 else ''
+        groups.append('(' + ' OR '.join(f'"{word}"{suffix}' for word in words) + ')')
+    return ' AND '.join(groups)
+
+
+def tsquery(alternatives):
+    groups = []
+    for position, words in enumerate(alternatives):
+        suffix = ':*' if position == len(alternatives) - 1 else ''
+        groups.append('(' + ' | '.join(f'{word}{suffix}' for word in words) + ')')
+    return ' & '.join(groups)
+
+
+def search_select(columns, alternatives):
+    name = dialect()
+    if name == 'sqlite':
+        fts = literal_column('medication_fts')
+        return (
+            select(*columns)
+            .select_from(medication_fts.join(Medication, Medication.MedicationID == medication_fts.c.rowid))
+            .where(fts.op('MATCH')(fts5_query(alternatives)))
+            .order_by(func.bm25(fts, NAME_WEIGHT, DESCRIPTION_WEIGHT), Medication.MedicationID)
+        )
+    if name == 'postgresql':
+        vector = literal_column('medication.search_vector')
+        query = func.to_tsquery('simple', tsquery(alternatives))
+        return (
+            select(*columns)
+            .where(vector.op('@@')(query))
+            .order_by(func.ts_rank(vector, query).desc(), Medication.MedicationID)
+        )
+    # No full-text support: substring match, names first
+    conditions = []
+    for words in alternatives:
+        conditions.append(or_(*(
+            or_(Medication.Name.ilike(f'%{word}%'), Medication.Description.ilike(f'%{word}%'))
+            for word in words
+        )))
+    return select(*columns).where(*conditions).order_by(Medication.Name, Medication.MedicationID)
+
+
+_vocabulary = (None, ())
+_vocabulary_lock = threading.Lock()
+
+
+def vocabulary():
+    # Every word in the index, reloaded only when the catalog changes
+    global _vocabulary
+    epoch = catalog_cache.epoch()
+    if _vocabulary[0] == epoch:
+        return _vocabulary[1]
+    with _vocabulary_lock:
+        name = dialect()
+        if name == 'sqlite':
+            words = db.session.scalars(select(column('term')).select_from(table('medication_fts_vocab')))
+        elif name == 'postgresql':
+            words = db.session.scalars(
+                select(column('word')).select_from(func.ts_stat('SELECT search_vector FROM medication'))
+            )
+        else:
+            words = ()
+        _vocabulary = (epoch, tuple(words))
+    return _vocabulary[1]
+
+
+def corrections(terms):
+    # Closest known words for each term; the last term is matched against word
+    # prefixes of the same length so a misspelt prefix still completes
+    words = vocabulary()
+    alternatives = []
+    for position, term in enumerate(terms):
+        if position == len(terms) - 1:
+            candidates = {word[:len(term)] for word in words if len(word) >= len(term)}
+        else:
+            candidates = words
+        matches = difflib.get_close_matches(term, candidates, MAX_CORRECTIONS, CORRECTION_CUTOFF)
+        alternatives.append(matches or [term])
+    return alternatives
+
+
+def search(q, columns, limit, offset=0):
+    # (rows, corrected) where corrected is the list of words searched for
+    # instead of the query's own, or None if the query matched as typed
+    terms = query_terms(q)
+    if not terms:
+        return [], None
+    alternatives = [[term] for term in terms]
+    rows = db.session.execute(search_select(columns, alternatives).limit(limit).offset(offset)).all()
+    if rows or (offset and db.session.execute(search_select(columns, alternatives).limit(1)).first()):
+        return rows, None
+    corrected = corrections(terms)
+    if corrected == alternatives:
+        return rows, None
+    rows = db.session.execute(search_select(columns, corrected).limit(limit).offset(offset)).all()
+    return rows, corrected
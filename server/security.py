@@ -0,0 +1,131 @@
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+from functools import wraps
+
+from flask import request, jsonify
+from werkzeug.security import generate_password_hash, check_password_hash
+
+# Password hashing is deliberately slow, so it is kept off the open request
+# path: hashes are computed on a bounded executor (hashlib's scrypt/pbkdf2
+# release the GIL, so threads give real parallelism), and /login is guarded by
+# a per-worker concurrency cap and a per-client rate limit.
+
+
+def hash_method_prefix(password_hash):
+    # 'scrypt:32768:8:1$salt$hash' -> 'scrypt:32768:8:1'
+    return password_hash.split('$', 1)[0]
+
+
+class PasswordHasher:
+    def __init__(self, app=None):
+        self.method = 'scrypt'
+        self.executor = None
+        self.timeout = None
+        self._method_prefix = None
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        app.config.setdefault('PASSWORD_HASH_METHOD', 'scrypt')
+        app.config.setdefault('PASSWORD_HASH_WORKERS', 4)
+        app.config.setdefault('PASSWORD_HASH_EXECUTOR', 'thread')
+        app.config.setdefault('PASSWORD_HASH_TIMEOUT', 30)
+
+        self.method = app.config['PASSWORD_HASH_METHOD']
+        self.timeout = app.config['PASSWORD_HASH_TIMEOUT']
+        self._method_prefix = None
+        if self.executor is not None:
+            self.executor.shutdown(wait=False)
+        # 'thread' (default), 'process', or 'inline' to hash on the request thread
+        workers = app.config['PASSWORD_HASH_WORKERS']
+        if app.config['PASSWORD_HASH_EXECUTOR'] == 'inline':
+            self.executor = None
+        elif app.config['PASSWORD_HASH_EXECUTOR'] == 'process':
+            self.executor = ProcessPoolExecutor(max_workers=workers)
+        else:
+            self.executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='password-hash')
+        app.extensions['password_hasher'] = self
+
+    def hash(self, password):
+        if self.executor is None:
+            return generate_password_hash(password, self.method)
+        return self.executor.submit(generate_password_hash, password, self.method).result(self.timeout)
+
+    def verify(self, password_hash, password):
+        if self.executor is None:
+            return check_password_hash(password_hash, password)
+        return self.executor.submit(check_password_hash, password_hash, password).result(self.timeout)
+
+    def needs_rehash(self, password_hash):
+        # Werkzeug fills in default parameters ('scrypt' -> 'scrypt:32768:8:1'),
+        # so learn the full prefix of the configured method from one real hash
+        if self._method_prefix is None:
+            self._method_prefix = hash_method_prefix(self.hash(''))
+        return hash_method_prefix(password_hash) != self._method_prefix
+
+
+class LoginLimiter:
+    def __init__(self, app=None):
+        self.semaphore = None
+        self.queue_timeout = 0
+        self.rate = 0
+        self._buckets = {}
+        self._lock = threading.Lock()
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        # At most LOGIN_MAX_CONCURRENCY logins verify at once in this worker, the
+        # rest wait up to LOGIN_QUEUE_TIMEOUT seconds before getting a 503.
+        # LOGIN_RATE_LIMIT is attempts per minute per client address (0 disables).
+        app.config.setdefault('LOGIN_MAX_CONCURRENCY', 8)
+        app.config.setdefault('LOGIN_QUEUE_TIMEOUT', 2)
+        app.config.setdefault('LOGIN_RATE_LIMIT', 20)
+
+        self.semaphore = threading.BoundedSemaphore(app.config['LOGIN_MAX_CONCURRENCY'])
+        self.queue_timeout = app.config['LOGIN_QUEUE_TIMEOUT']
+        self.rate = app.config['LOGIN_RATE_LIMIT']
+        self._buckets = {}
+        app.extensions['login_limiter'] = self
+
+    def allow(self, client):
+        # Token bucket holding up to `rate` attempts, refilled continuously
+        if not self.rate:
+            return True
+        now = time.monotonic()
+        with self._lock:
+            tokens, updated = self._buckets.get(client, (self.rate, now))
+            tokens = min(self.rate, tokens + (now - updated) * self.rate / 60.0)
+            allowed = tokens >= 1
+            self._buckets[client] = (tokens - 1 if allowed else tokens, now)
+            if len(self._buckets) > 10000:
+                self._prune(now)
+        return allowed
+
+    def _prune(self, now):
+        # Forget clients idle long enough for their bucket to be full again
+        for client, (tokens, updated) in list(self._buckets.items()):
+            if now - updated > 60.0:
+                del self._buckets[client]
+
+    def limit(self, view):
+        @wraps(view)
+        def wrapper(*args, **kwargs):
+            if not self.allow(request.remote_addr):
+                response = jsonify({'error': 'Too many login attempts, try again later'})
+                response.headers['Retry-After'] = '60'
+                return response, 429
+            if not self.semaphore.acquire(timeout=self.queue_timeout):
+                response = jsonify({'error': 'Login service busy, try again shortly'})
+                response.headers['Retry-After'] = '1'
+                return response, 503
+            try:
+                return view(*args, **kwargs)
+            finally:
+                self.semaphore.release()
+        return wrapper
+
+
+password_hasher = PasswordHasher()
+login_limiter = LoginLimiter()
@@ -0,0 +1,129 @@
+import json
+from datetime import date
+from decimal import Decimal
+
+from flask.json.provider import DefaultJSONProvider
+from sqlalchemy import select, Date, DateTime
+
+from models import Customer, Medication, Orders, OrderItems, Payments, Statements
+from money import Money
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+# Response serialization.
+#
+# List endpoints select plain column tuples with Core and turn them into dicts
+# with a RowEncoder built once per column list, instead of loading ORM objects
+# and copying their attributes by hand. Rows become dicts with one dict(zip())
+# call; only dates and amounts are converted on the way.
+#
+# JSON is written by orjson when it is installed (pip install orjson) and by
+# the standard library otherwise.
+
+# API timestamps read "2024-05-31 14:00:00"
+DATETIME_SEPARATOR = ' '
+
+
+def default(o):
+    if isinstance(o, Decimal):
+        # Exact for cent amounts: the shortest float repr of 6.25 is "6.25"
+        return float(o)
+    return DefaultJSONProvider.default(o)
+
+
+if orjson is not None:
+    # Dates go through default() like with the stdlib encoder, so they keep Flask's format
+    ORJSON_OPTIONS = orjson.OPT_NON_STR_KEYS | orjson.OPT_PASSTHROUGH_DATETIME | orjson.OPT_PASSTHROUGH_DATACLASS
+
+    def dumps_bytes(obj, sort_keys=False):
+        return orjson.dumps(obj, default=default, option=ORJSON_OPTIONS | (orjson.OPT_SORT_KEYS if sort_keys else 0))
+
+    loads = orjson.loads
+else:
+    def dumps_bytes(obj, sort_keys=False):
+        return json.dumps(obj, default=default, sort_keys=sort_keys, separators=(',', ':')).encode()
+
+    loads = json.loads
+
+
+def dumps(obj, sort_keys=False):
+    return dumps_bytes(obj, sort_keys).decode()
+
+
+class JSONProvider(DefaultJSONProvider):
+    # Flask's provider with the fast backend; pretty-printed debug output and
+    # calls with extra json.dumps() options still go through the stdlib
+
+    default = staticmethod(default)
+
+    def dumps(self, obj, **kwargs):
+        if kwargs:
+            return super().dumps(obj, **kwargs)
+        return dumps(obj, self.sort_keys)
+
+    def loads(self, s, **kwargs):
+        if kwargs:
+            return super().loads(s, **kwargs)
+        return loads(s)
+
+    def response(self, *args, **kwargs):
+        if self.compact is False or (self.compact is None and self._app.debug):
+            return super().response(*args, **kwargs)
+        obj = self._prepare_response_obj(args, kwargs)
+        return self._app.response_class(dumps_bytes(obj, self.sort_keys) + b'\n', mimetype=self.mimetype)
+
+
+def converter(column, datetime_separator):
+    if isinstance(column.type, Money):
+        return float
+    if isinstance(column.type, DateTime):
+        return lambda value: value.isoformat(datetime_separator, 'seconds')
+    if isinstance(column.type, Date):
+        return date.isoformat
+    return None
+
+
+class RowEncoder:
+    # JSON-ready dicts from Core rows selecting `columns`, in that order
+
+    def __init__(self, columns, datetime_separator=DATETIME_SEPARATOR):
+        self.columns = list(columns)
+        self.names = tuple(column.key for column in self.columns)
+        self.converters = tuple(
+            (column.key, convert)
+            for column, convert in ((column, converter(column, datetime_separator)) for column in self.columns)
+            if convert is not None
+        )
+
+    def select(self):
+        return select(*self.columns)
+
+    def encode(self, row):
+        data = dict(zip(self.names, row))
+        for name, convert in self.converters:
+            value = data[name]
+            if value is not None:
+                data[name] = convert(value)
+        return data
+
+    def encode_all(self, rows):
+        encode = self.encode
+        return [encode(row) for row in rows]
+
+
+def model_encoder(model, fields):
+    return RowEncoder([model.__table__.c[name] for name in fields])
+
+
+# RowVersion is what PATCH requests send back in If-Match
+CUSTOMER = model_encoder(Customer, ('CustomerID', 'FirstName', 'LastName', 'Email', 'Phone', 'Address', 'Username',
+                                    'RowVersion'))
+MEDICATION = model_encoder(Medication, ('MedicationID', 'Name', 'Description', 'StockLevel', 'PricePerUnit', 'RowVersion'))
+ORDER = model_encoder(Orders, ('OrderID', 'CustomerID', 'OrderDate', 'Status', 'TotalAmount', 'RowVersion'))
+ORDER_ITEM = model_encoder(OrderItems, ('OrderItemID', 'OrderID', 'MedicationID', 'Quantity', 'Subtotal', 'RowVersion'))
+PAYMENT = model_encoder(Payments, ('PaymentID', 'OrderID', 'PaymentDate', 'AmountPaid', 'PaymentMethod', 'RowVersion'))
+STATEMENT = model_encoder(Statements, ('StatementID', 'CustomerID', 'StatementDate', 'AmountDue', 'PaymentStatus',
+                                       'RowVersion'))
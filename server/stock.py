@@ -0,0 +1,190 @@
+import logging
+import threading
+from datetime import datetime, timedelta
+
+from flask import current_app
+from sqlalchemy import select, insert, update, delete
+
+import push
+from models import db, Medication, StockReservation
+
+# Stock is only ever changed with single-statement conditional UPDATEs, so
+# concurrent buyers can't overwrite each other's decrements or drive a level
+# below zero: a decrement either matches the row (enough stock left) or does
+# nothing and the caller reports the shortage.
+#
+# Adding to the cart reserves the quantity: it is taken off StockLevel at once
+# and a StockReservation row records the hold. Checkout consumes the hold, the
+# sweeper gives expired holds back. Every hold is released by a guarded DELETE
+# that must remove the row, so a hold is only ever consumed or returned once.
+# The DELETE matches everything that was read about the hold, not just its id:
+# SQLite hands a deleted row's id to the next insert, and the quantity given
+# back must be the one removed.
+
+logger = logging.getLogger(__name__)
+
+
+HOLDS = select(
+    StockReservation.ReservationID, StockReservation.CartItemID, StockReservation.MedicationID,
+    StockReservation.Quantity,
+)
+
+
+def take(medication_id, quantity):
+    # True if the stock was there and has been decremented
+    result = db.session.execute(
+        update(Medication)
+        .where(Medication.MedicationID == medication_id, Medication.StockLevel >= quantity)
+        .values(StockLevel=Medication.StockLevel - quantity)
+    )
+    if result.rowcount != 1:
+        return False
+    push.stock_changed(medication_id)
+    return True
+
+
+def give_back(medication_id, quantity):
+    db.session.execute(
+        update(Medication)
+        .where(Medication.MedicationID == medication_id)
+        .values(StockLevel=Medication.StockLevel + quantity)
+    )
+    push.stock_changed(medication_id)
+
+
+def adjust(medication_id, change):
+    # Restock (positive) or write off (negative) without reading the level first.
+    # The new level, or None if the medication is missing or would go negative.
+    result = db.session.execute(
+        update(Medication)
+        .where(Medication.MedicationID == medication_id, Medication.StockLevel + change >= 0)
+        .values(StockLevel=Medication.StockLevel + change)
+    )
+    if result.rowcount != 1:
+        return None
+    push.stock_changed(medication_id)
+    return db.session.scalar(select(Medication.StockLevel).where(Medication.MedicationID == medication_id))
+
+
+def reservation_expiry():
+    return datetime.now() + timedelta(minutes=current_app.config['STOCK_RESERVATION_MINUTES'])
+
+
+def reserve(cart_item_id, medication_id, quantity):
+    # When the hold expires, or None if the stock is not there
+    if not take(medication_id, quantity):
+        return None
+    expires_at = reservation_expiry()
+    db.session.execute(insert(StockReservation), [{
+        'CartItemID': cart_item_id,
+        'MedicationID': medication_id,
+        'Quantity': quantity,
+        'ExpiresAt': expires_at,
+    }])
+    return expires_at
+
+
+def release(cart_item_id):
+    # Give back whatever is still held for a cart line
+    reservation = db.session.execute(HOLDS.where(StockReservation.CartItemID == cart_item_id)).first()
+    if reservation is not None and _drop(reservation):
+        give_back(reservation.MedicationID, reservation.Quantity)
+
+
+def change_reservation(cart_item_id, medication_id, quantity):
+    # The cart line's quantity changed: hold exactly `quantity` from now on, with
+    # a fresh expiry. None if the stock is not there; roll back to keep the old hold.
+    release(cart_item_id)
+    return reserve(cart_item_id, medication_id, quantity)
+
+
+def consume(cart_item_id, medication_id, quantity):
+    # Checkout: turn the hold into a sale, or take the stock now if the hold
+    # has already been swept
+    reservation = db.session.execute(HOLDS.where(StockReservation.CartItemID == cart_item_id)).first()
+    if reservation is not None and _drop(reservation):
+        if reservation.MedicationID == medication_id and reservation.Quantity == quantity:
+            return True
+        give_back(reservation.MedicationID, reservation.Quantity)
+    return take(medication_id, quantity)
+
+
+def _drop(reservation, expired_before=None):
+    # `reservation` is a HOLDS row
+    stmt = delete(StockReservation).where(
+        StockReservation.ReservationID == reservation.ReservationID,
+        StockReservation.CartItemID == reservation.CartItemID,
+        StockReservation.MedicationID == reservation.MedicationID,
+        StockReservation.Quantity == reservation.Quantity,
+    )
+    if expired_before is not None:
+        stmt = stmt.where(StockReservation.ExpiresAt < expired_before)
+    return db.session.execute(stmt).rowcount == 1
+
+
+def sweep(batch_size=500, now=None):
+    # Return the stock of expired reservations.
+    # Safe to run from several workers at once: each hold is dropped once.
+    now = now or datetime.now()
+    released = 0
+    while True:
+        expired = db.session.execute(
+            HOLDS.where(StockReservation.ExpiresAt < now)
+            .order_by(StockReservation.ExpiresAt)
+            .limit(batch_size)
+        ).all()
+        if not expired:
+            return released
+        # One short transaction per hold, holding one reservation and one
+        # medication row at a time, so the sweeper can't deadlock with checkout
+        for reservation in expired:
+            if _drop(reservation, now):
+                give_back(reservation.MedicationID, reservation.Quantity)
+                released += 1
+            db.session.commit()
+        if len(expired) < batch_size:
+            return released
+
+
+class ReservationSweeper:
+    # Background thread running sweep() every STOCK_SWEEP_INTERVAL seconds
+    # (0 disables it, e.g. when `flask stock sweep` runs from cron instead)
+
+    def __init__(self, app=None):
+        self.thread = None
+        self.stopped = threading.Event()
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        app.config.setdefault('STOCK_RESERVATION_MINUTES', 15)
+        app.config.setdefault('STOCK_SWEEP_INTERVAL', 60)
+        app.config.setdefault('STOCK_SWEEP_BATCH', 500)
+        app.extensions['reservation_sweeper'] = self
+        if app.config['STOCK_SWEEP_INTERVAL'] > 0 and not app.testing:
+            self.start(app)
+
+    def start(self, app):
+        if self.thread is not None and self.thread.is_alive():
+            return
+        self.stopped.clear()
+        self.thread = threading.Thread(target=self.run, args=(app,), name='stock-sweeper', daemon=True)
+        self.thread.start()
+
+    def stop(self):
+        self.stopped.set()
+
+    def run(self, app):
+        interval = app.config['STOCK_SWEEP_INTERVAL']
+        while not self.stopped.wait(interval):
+            with app.app_context():
+                try:
+                    released = sweep(app.config['STOCK_SWEEP_BATCH'])
+                    if released:
+                        logger.info('released %d expired stock reservations', released)
+                except Exception:
+                    db.session.rollback()
+                    logger.exception('stock reservation sweep failed')
+
+
+reservation_sweeper = ReservationSweeper()
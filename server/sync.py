@@ -0,0 +1,197 @@
+from datetime import datetime, timedelta
+
+from flask import current_app
+from sqlalchemy import select, insert, update, delete, event, func, inspect, and_, or_, true
+
+from models import db, Customer, Medication, Orders, OrderItems, Payments, Statements, SyncClock, Tombstone
+from serializers import CUSTOMER, MEDICATION, ORDER, ORDER_ITEM, PAYMENT, STATEMENT
+
+# Delta sync for offline clients (GET /sync).
+#
+# Synced rows carry a RowVersion stamped by every write (see models.Versioned),
+# and deleting one through the session leaves a Tombstone versioned the same way.
+# A client keeps the token of the last change it applied and asks for what came
+# after it: changes are returned in (version, table, primary key) order, so one
+# transaction that touched thousands of rows can still be paged through.
+# Inserts and updates both come back as upserts of the current row.
+#
+# Deletes have to go through db.session.delete(); a Core DELETE on a synced
+# table would leave clients holding the row. `flask sync purge` drops
+# tombstones older than SYNC_TOMBSTONE_DAYS, and tokens from before the purge
+# get 410 so the client starts over.
+
+
+class SyncTable:
+    def __init__(self, name, model, encoder, owner=None, parent=None):
+        self.name = name
+        self.model = model
+        self.encoder = encoder
+        self.pk = model.__mapper__.primary_key[0]
+        # Column holding the customer a row belongs to (None: everyone sees it),
+        # found through `parent` when it lives on the parent order
+        self.owner = owner
+        self.parent = parent
+
+    def select(self, customer_id):
+        stmt = select(self.model.RowVersion, *self.encoder.columns)
+        if customer_id is not None and self.owner is not None:
+            if self.parent is not None:
+                stmt = stmt.join(self.parent)
+            stmt = stmt.where(self.owner == customer_id)
+        return stmt
+
+
+TABLES = (
+    SyncTable('medications', Medication, MEDICATION),
+    SyncTable('customers', Customer, CUSTOMER, owner=Customer.CustomerID),
+    SyncTable('orders', Orders, ORDER, owner=Orders.CustomerID),
+    SyncTable('order_items', OrderItems, ORDER_ITEM, owner=Orders.CustomerID, parent=OrderItems.order),
+    SyncTable('payments', Payments, PAYMENT, owner=Orders.CustomerID, parent=Payments.order),
+    SyncTable('statements', Statements, STATEMENT, owner=Statements.CustomerID),
+)
+TABLE_NAMES = {table.model: table.name for table in TABLES}
+# Tombstones sort after every table within a version
+TOMBSTONES = len(TABLES)
+
+
+class SyncTokenExpired(Exception):
+    pass
+
+
+# Tokens
+
+def parse_token(token):
+    # "<version>.<position>.<key>" -> tuple, None for a missing token
+    if not token:
+        return None
+    try:
+        version, position, key = (int(part) for part in token.split('.'))
+    except ValueError:
+        raise ValueError(f'invalid sync token {token!r}') from None
+    if version < 0 or not 0 <= position <= TOMBSTONES:
+        raise ValueError(f'invalid sync token {token!r}')
+    return version, position, key
+
+
+def format_token(cursor):
+    return '.'.join(str(part) for part in cursor)
+
+
+def after(cursor, position, version, pk):
+    # Rows of the table at `position` that come after the cursor
+    if cursor is None:
+        return true()
+    at_version, at_position, at_key = cursor
+    if position < at_position:
+        return version > at_version
+    if position > at_position:
+        return version >= at_version
+    return or_(version > at_version, and_(version == at_version, pk > at_key))
+
+
+# Reading changes
+
+def settled_version():
+    # The version below which every change is committed or rolled back, None
+    # when versions are already handed out in commit order (see models.row_version)
+    if db.session.get_bind().dialect.name != 'postgresql':
+        return None
+    return db.session.scalar(select(func.settled_row_version()))
+
+
+def changes(since=None, limit=100, customer_id=None, tables=TABLES):
+    # The first `limit` changes after the `since` token, visible to customer_id
+    # (None: all of them). Returns (changes, next token, whether there are more).
+    cursor = parse_token(since)
+    if cursor is not None:
+        purged = db.session.scalar(select(SyncClock.PurgedVersion))
+        if purged and cursor[0] <= purged:
+            raise SyncTokenExpired(since)
+    settled = settled_version()
+
+    found = []
+    for table in tables:
+        position = TABLES.index(table)
+        stmt = table.select(customer_id).where(after(cursor, position, table.model.RowVersion, table.pk))
+        if settled is not None:
+            stmt = stmt.where(table.model.RowVersion < settled)
+        rows = db.session.execute(stmt.order_by(table.model.RowVersion, table.pk).limit(limit + 1)).all()
+        for row in rows:
+            data = table.encoder.encode(row[1:])
+            key = data[table.pk.key]
+            found.append(((row[0], position, key), {
+                'table': table.name, 'op': 'upsert', 'id': key, 'version': row[0], 'row': data,
+            }))
+
+    # A client syncing from scratch has nothing to delete
+    if cursor is not None:
+        stmt = (
+            select(Tombstone.TombstoneID, Tombstone.TableName, Tombstone.RowID, Tombstone.RowVersion)
+            .where(Tombstone.TableName.in_([table.name for table in tables]),
+                   after(cursor, TOMBSTONES, Tombstone.RowVersion, Tombstone.TombstoneID))
+            .order_by(Tombstone.RowVersion, Tombstone.TombstoneID)
+            .limit(limit + 1)
+        )
+        if customer_id is not None:
+            stmt = stmt.where(or_(Tombstone.CustomerID == customer_id, Tombstone.TableName == 'medications'))
+        if settled is not None:
+            stmt = stmt.where(Tombstone.RowVersion < settled)
+        for tombstone in db.session.execute(stmt):
+            found.append(((tombstone.RowVersion, TOMBSTONES, tombstone.TombstoneID), {
+                'table': tombstone.TableName, 'op': 'delete', 'id': tombstone.RowID, 'version': tombstone.RowVersion,
+            }))
+
+    found.sort(key=lambda change: change[0])
+    page = found[:limit]
+    next_token = format_token(page[-1][0]) if page else since
+    return [change for _, change in page], next_token, len(found) > limit
+
+
+# Tombstones for ORM deletes
+
+def owner_of(session, obj):
+    if isinstance(obj, Medication):
+        return None
+    if isinstance(obj, (OrderItems, Payments)):
+        return session.scalar(select(Orders.CustomerID).where(Orders.OrderID == obj.OrderID))
+    return obj.CustomerID
+
+
+def collect_tombstones(session, flush_context, instances):
+    # Owners are looked up before the flush, while parent orders still exist
+    tombstones = [
+        {'TableName': TABLE_NAMES[type(obj)], 'RowID': inspect(obj).identity[0],
+         'CustomerID': owner_of(session, obj)}
+        for obj in session.deleted
+        if type(obj) in TABLE_NAMES
+    ]
+    if tombstones:
+        session.info['sync_tombstones'] = tombstones
+
+
+def write_tombstones(session, flush_context):
+    tombstones = session.info.pop('sync_tombstones', None)
+    if tombstones:
+        session.execute(insert(Tombstone), tombstones)
+
+
+def init_app(app):
+    app.config.setdefault('SYNC_TOMBSTONE_DAYS', 90)
+    if not event.contains(db.session, 'before_flush', collect_tombstones):
+        event.listen(db.session, 'before_flush', collect_tombstones)
+        event.listen(db.session, 'after_flush', write_tombstones)
+
+
+def purge(days=None):
+    # Drop old tombstones and expire the tokens that would need them; the number removed
+    days = current_app.config['SYNC_TOMBSTONE_DAYS'] if days is None else days
+    cutoff = datetime.now() - timedelta(days=days)
+    newest = db.session.scalar(select(func.max(Tombstone.RowVersion)).where(Tombstone.DeletedAt < cutoff))
+    if newest is None:
+        return 0
+    result = db.session.execute(delete(Tombstone).where(Tombstone.RowVersion <= newest))
+    db.session.execute(
+        update(SyncClock).where(SyncClock.PurgedVersion < newest).values(PurgedVersion=newest)
+    )
+    db.session.commit()
+    return result.rowcount